@@ -0,0 +1,106 @@
+#!perl
+
+=head Description
+
+Measures the wall-clock time of the interpreter on the benchmark
+programs compiled with -version 2, with 1, 2 and 4 threads
+(--threads), along with the number of LLMIs of each program, its
+number of layers, and the width of its widest layer.
+
+The programs are compiled for the small secure element (l_in = l_out =
+8, s = 32, r = 40, which has to be the one of runtime/SEconfig.h), and
+executed on the same $vector_count random input vectors with each
+number of threads. The outputs have to be the same with each number
+of threads. mnist is compiled with -no-universal (as in
+all_ciphers.pl): its layers are then the ASAP wavefronts of its DFG.
+
+The interpreter has to be built beforehand (make -C runtime). The
+results are appended to benchs/results/threads.txt.
+
+=cut
+
+use strict;
+use warnings;
+use feature qw(say);
+use autodie qw(open close);
+$| = 1; # Disabling output buffering
+
+use Cwd;
+use File::Path qw(make_path);
+use File::Basename;
+
+my @ciphers_universal = qw(AES Ascon TinyJambu tracingAES sum_naive sum_tree findmax_naive findmax_tree);
+my @ciphers_no_universal = qw(mnist);
+my @threads = qw(1 2 4);
+my $vector_count = 4;
+my ($l, $s) = (8, 32);
+my $r = $l * 5;
+my $path_to_ciphers = "tests/automated/programs";
+my $python = $ENV{PYTHON} // "pypy3";
+my $path_to_results     = "benchs/results/threads.txt";
+my $path_to_compiler    = "compiler/compiler.py";
+my $path_to_interpreter = "runtime/interpreter";
+my $path_to_bytecode    = "/tmp/bench_threads.bc";
+my $path_to_inputs      = "/tmp/bench_threads_inputs.txt";
+
+# Moving to upper directory if inside "bench"
+if (getcwd() =~ m{/benchs$}) {
+    say "$0... moving one directory up.";
+    chdir "..";
+}
+
+# Making sure that the compiler and the interpreter are there
+if (! -f $path_to_compiler) {
+    die "Cannot find compiler (should be located at '$path_to_compiler')";
+}
+if (! -x $path_to_interpreter) {
+    die "Cannot find interpreter (should be built at '$path_to_interpreter')";
+}
+
+# Creating the results directory if needed
+if (! -f $path_to_results) {
+    my (undef, $path) = fileparse($path_to_results);
+    make_path $path;
+}
+
+open my $FH, '>>', $path_to_results;
+say $FH "Secure element: l_in = l_out = $l, s = $s, r = $r; $vector_count input vectors";
+
+my @ciphers = ((map { [ $_, "-universal" ] } @ciphers_universal),
+               (map { [ $_, "-no-universal" ] } @ciphers_no_universal));
+for my $cipher (@ciphers) {
+    my ($name, $universal) = @$cipher;
+    my $path_to_cipher = "$path_to_ciphers/$name.c";
+    if (! -f $path_to_cipher) {
+        die "Cannot find cipher $name at '$path_to_cipher'";
+    }
+    print "$0... $name: compiling";
+
+    my $output = `$python $path_to_compiler $path_to_cipher -o $path_to_bytecode -r $r -lin $l -lout $l -s $s -version 2 $universal -stats`;
+    die "Compilation of $name failed" if $?;
+    my ($llmi_count) = (reverse($output =~ /MLIR size: (\d+)/g))[0];
+    my ($layer_count, $widest) = $output =~ /LLIR layers: (\d+) \(widest: (\d+) LLMIs\)/;
+
+    # Random input vectors
+    my ($input_count) = `cat $path_to_ciphers/$name.info` =~ /INPUT_COUNT=(\d+)/;
+    open my $INPUTS, '>', $path_to_inputs;
+    for (1 .. $vector_count) {
+        say $INPUTS join ",", map { int rand 2**32 } 1 .. $input_count;
+    }
+    close $INPUTS;
+
+    my ($outputs, @times);
+    for my $thread_count (@threads) {
+        print "\r$0... $name: $thread_count thread(s)  ";
+        my $result = `$path_to_interpreter --threads $thread_count --inputs-file $path_to_inputs $path_to_bytecode 2>&1 >/tmp/bench_threads_outputs.txt`;
+        die "Interpretation of $name failed: $result" if $?;
+        my ($time) = $result =~ /executions in ([\d.]+) s/;
+        my $thread_outputs = `cat /tmp/bench_threads_outputs.txt`;
+        $outputs //= $thread_outputs;
+        die "Outputs of $name differ with $thread_count threads" if $outputs ne $thread_outputs;
+        push @times, "$thread_count thread(s): $time s";
+    }
+    print "\r$0... $name: done.              \n";
+    say $FH "$name: $llmi_count LLMIs, $layer_count layers (widest: $widest LLMIs); ", join ", ", @times;
+}
+say $FH "";
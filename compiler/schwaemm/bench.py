@@ -0,0 +1,48 @@
+"""Compares per-call and batch SCHWAEMM encryption
+
+The records mimic the LLSs produced by the serializer: a message of a
+couple hundred bytes, a few dozens of bytes of associated data and a
+32-byte nonce.
+
+"""
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from schwaemm import schwaemm128128_encrypt, schwaemm128128_encrypt_batch
+
+RECORD_COUNT = 100000
+THREAD_COUNT = 4
+TAG_BYTES = 16
+
+key = os.urandom(16)
+records = [ (os.urandom(200), os.urandom(60), os.urandom(32))
+            for _ in range(RECORD_COUNT) ]
+out_len = sum([ len(msg) + TAG_BYTES for msg, _, _ in records ])
+
+
+start = time.time()
+per_call = b''.join([ schwaemm128128_encrypt(msg, ad, nonce, key)
+                      for msg, ad, nonce in records ])
+per_call_time = time.time() - start
+
+start = time.time()
+batch = bytearray(out_len)
+schwaemm128128_encrypt_batch(records, batch, key)
+batch_time = time.time() - start
+assert per_call == batch
+
+start = time.time()
+chunk_size = (RECORD_COUNT + THREAD_COUNT - 1) // THREAD_COUNT
+chunks = [ records[i:i+chunk_size] for i in range(0, RECORD_COUNT, chunk_size) ]
+outs = [ bytearray(sum([ len(msg) + TAG_BYTES for msg, _, _ in chunk ]))
+         for chunk in chunks ]
+with ThreadPoolExecutor(THREAD_COUNT) as executor:
+    list(executor.map(lambda c: schwaemm128128_encrypt_batch(c[0], c[1], key),
+                      zip(chunks, outs)))
+threaded_time = time.time() - start
+assert per_call == b''.join(outs)
+
+print(f"{RECORD_COUNT} records")
+print(f"  per-call:            {per_call_time:.3f} sec")
+print(f"  batch:               {batch_time:.3f} sec")
+print(f"  batch, {THREAD_COUNT} threads:    {threaded_time:.3f} sec")
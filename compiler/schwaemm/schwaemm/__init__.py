@@ -1,2 +1,4 @@
 from ._schwaemm import schwaemm128128_encrypt
 from ._schwaemm import schwaemm128128_decrypt
+from ._schwaemm import schwaemm128128_encrypt_batch
+from ._schwaemm import esch256_hash
@@ -0,0 +1,123 @@
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+#include "schwaemm.h"
+
+// Encrypts a sequence of (msg, ad, nonce) records with the same key.
+//
+// The records and the key can be any objects supporting the buffer
+// protocol, and the key must be SCHWAEMM_KEY_BYTES bytes long. The
+// ciphertexts (each of them being len(msg) + SCHWAEMM_TAG_BYTES bytes
+// long) are written one after the other into the writable buffer
+// |out|, which must be large enough to hold all of them. The GIL is
+// released during the encryption, so that several threads can call
+// this function concurrently.
+//
+// Returns the number of bytes written into |out|.
+PyObject *schwaemm128128_encrypt_batch(PyObject *records, PyObject *out,
+                                       PyObject *key)
+{
+	PyObject *seq = PySequence_Fast(records,
+		"records must be a sequence of (msg, ad, nonce)");
+	if (!seq) {
+		return NULL;
+	}
+	Py_ssize_t count = PySequence_Fast_GET_SIZE(seq);
+	Py_buffer *views = PyMem_Calloc(3*count + 1, sizeof(Py_buffer));
+	Py_buffer out_view, key_view;
+	Py_ssize_t acquired = 0;
+	int out_acquired = 0, key_acquired = 0;
+	PyObject *result = NULL;
+	if (!views) {
+		PyErr_NoMemory();
+		goto cleanup;
+	}
+
+	if (PyObject_GetBuffer(key, &key_view, PyBUF_SIMPLE) != 0) {
+		goto cleanup;
+	}
+	key_acquired = 1;
+	if (key_view.len != SCHWAEMM_KEY_BYTES) {
+		PyErr_Format(PyExc_ValueError,
+			"the key must be %d bytes long, not %zd",
+			SCHWAEMM_KEY_BYTES, key_view.len);
+		goto cleanup;
+	}
+
+	// Acquiring all the buffers while holding the GIL
+	Py_ssize_t total = 0;
+	for (Py_ssize_t i = 0; i < count; i++) {
+		PyObject *record = PySequence_Fast(PySequence_Fast_GET_ITEM(seq, i),
+			"each record must be a (msg, ad, nonce) sequence");
+		if (!record) {
+			goto cleanup;
+		}
+		if (PySequence_Fast_GET_SIZE(record) != 3) {
+			PyErr_Format(PyExc_ValueError,
+				"record %zd: expected (msg, ad, nonce)", i);
+			Py_DECREF(record);
+			goto cleanup;
+		}
+		for (int j = 0; j < 3; j++) {
+			if (PyObject_GetBuffer(PySequence_Fast_GET_ITEM(record, j),
+			                       &views[acquired], PyBUF_SIMPLE) != 0) {
+				Py_DECREF(record);
+				goto cleanup;
+			}
+			acquired++;
+		}
+		Py_DECREF(record);
+		if (views[3*i+2].len != SCHWAEMM_NONCE_BYTES) {
+			PyErr_Format(PyExc_ValueError,
+				"record %zd: the nonce must be %d bytes long", i,
+				SCHWAEMM_NONCE_BYTES);
+			goto cleanup;
+		}
+		total += views[3*i].len + SCHWAEMM_TAG_BYTES;
+	}
+	if (PyObject_GetBuffer(out, &out_view, PyBUF_WRITABLE) != 0) {
+		goto cleanup;
+	}
+	out_acquired = 1;
+	if (out_view.len < total) {
+		PyErr_Format(PyExc_ValueError,
+			"output buffer too small: %zd bytes needed, %zd provided",
+			total, out_view.len);
+		goto cleanup;
+	}
+
+	// Encrypting without the GIL
+	int ret = 0;
+	Py_BEGIN_ALLOW_THREADS
+	UChar *c = (UChar *)out_view.buf;
+	for (Py_ssize_t i = 0; i < count && ret == 0; i++) {
+		ULLInt clen;
+		ret = crypto_aead_encrypt(
+			c, &clen,
+			(const UChar *)views[3*i].buf, (ULLInt)views[3*i].len,
+			(const UChar *)views[3*i+1].buf, (ULLInt)views[3*i+1].len,
+			(const UChar *)NULL, (const UChar *)views[3*i+2].buf,
+			(const UChar *)key_view.buf
+		);
+		c += clen;
+	}
+	Py_END_ALLOW_THREADS
+	if (ret != 0) {
+		PyErr_SetString(PyExc_RuntimeError, "SCHWAEMM encryption failed");
+		goto cleanup;
+	}
+	result = PyLong_FromSsize_t(total);
+
+cleanup:
+	if (key_acquired) {
+		PyBuffer_Release(&key_view);
+	}
+	if (out_acquired) {
+		PyBuffer_Release(&out_view);
+	}
+	for (Py_ssize_t i = 0; i < acquired; i++) {
+		PyBuffer_Release(&views[i]);
+	}
+	PyMem_Free(views);
+	Py_DECREF(seq);
+	return result;
+}
@@ -15,6 +15,14 @@ void schwaemm128128_decrypt(
 	const char *ad, long long adlen,
 	const char *nonce, const char *key
 );
+
+PyObject *schwaemm128128_encrypt_batch(PyObject *records, PyObject *out,
+                                       PyObject *key);
+
+void esch256_hash(
+	char **h, long long *hlen,
+	const char *m, long long mlen
+);
 %}
 
 %include "cstring.i"
@@ -38,3 +46,13 @@ void schwaemm128128_decrypt(
 	const char *ad, long long adlen,
 	const char *nonce, const char *key
 );
+
+PyObject *schwaemm128128_encrypt_batch(PyObject *records, PyObject *out,
+                                       PyObject *key);
+
+%cstring_output_allocate_size(char **h, long long *hlen, free(*$1));
+%apply (char *STRING, size_t LENGTH) { (const char *m, long long mlen) };
+void esch256_hash(
+	char **h, long long *hlen,
+	const char *m, long long mlen
+);
@@ -1,5 +1,6 @@
 #include <stdlib.h>
 #include "schwaemm.h"
+#include "esch.h"
 
 void schwaemm128128_encrypt(
 	char **c, long long *clen,
@@ -56,6 +57,20 @@ void schwaemm128128_decrypt(
 	return;
 }
 
+void esch256_hash(
+	char **h, long long *hlen,
+	const char *m, long long mlen
+) {
+	*hlen = ESCH_DIGEST_BYTES;
+	*h = malloc(*hlen);
+	if (!*h) {
+		return;
+	}
+	crypto_hash((unsigned char *)*h,
+	            (const unsigned char *)m, (unsigned long long)mlen);
+	return;
+}
+
 // int crypto_aead_encrypt(
 // 	UChar *c, ULLInt *clen, const UChar *m, ULLInt mlen,
 //   	const UChar *ad, ULLInt adlen, const UChar *nsec, const UChar *npub,
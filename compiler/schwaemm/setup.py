@@ -7,7 +7,9 @@ schwaemm_ext = Extension(
         'schwaemm/schwaemm.i',
         'schwaemm/schwaemm.c',
         'schwaemm/sparkle.c',
+        'schwaemm/esch.c',
         'schwaemm/wrapper.c',
+        'schwaemm/batch.c',
     ],
     depends=[
         'schwaemm/*.h'
@@ -24,7 +26,7 @@ setup(
     name='schwaemm',
     version='0.1',
     author="Aleksei Udovenko",
-    description="""Simple wrapper for Schwaemm AEAD""",
+    description="""Simple wrapper for Schwaemm AEAD and Esch hash""",
     ext_modules=[schwaemm_ext],
     package_data={'schwaemm': ['*.h', '*.so']},
 )
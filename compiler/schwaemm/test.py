@@ -1,4 +1,5 @@
-from schwaemm import schwaemm128128_encrypt, schwaemm128128_decrypt
+from schwaemm import schwaemm128128_encrypt, schwaemm128128_decrypt, esch256_hash
+from schwaemm import schwaemm128128_encrypt_batch
 
 
 msg = b"message"
@@ -10,6 +11,23 @@ print("ct", ct)
 pt = schwaemm128128_decrypt(ct, ad, nonce, key)
 print("pt", pt)
 
+batch_nonce = b"N"*32
+ct = schwaemm128128_encrypt(msg, ad, batch_nonce, key)
+out = bytearray(2 * len(ct))
+assert len(out) == schwaemm128128_encrypt_batch([ (msg, ad, batch_nonce) ] * 2, out, key)
+assert out == ct * 2
+for bad_key in [ b"short", key + b"K" ]:
+    try:
+        schwaemm128128_encrypt_batch([ (msg, ad, batch_nonce) ], out, bad_key)
+        assert False, "wrong key length accepted"
+    except ValueError:
+        pass
+
+# Same digest as the ESCH256 of runtime/sparkle/esch
+Msg = bytes.fromhex("000102030405060708090A0B0C0D0E0F101112131415161718191A1B1C1D1E1F")
+MD = bytes.fromhex("78B905B2E2D4110B76EF8AFD2495F58AD6FFD6B9727377F3E5DFCEEBF3031E24")
+assert MD == esch256_hash(Msg)
+
 
 Key = bytes.fromhex("000102030405060708090A0B0C0D0E0F")
 Nonce = bytes.fromhex("000102030405060708090A0B0C0D0E0F")
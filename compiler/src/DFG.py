@@ -2,6 +2,7 @@
 
 """
 import IR
+from array import array
 from collections import defaultdict
 from graphviz import Digraph
 from IR import MLIRProgram, MLMI, MLS
@@ -16,16 +17,52 @@ class DFG:
 
      - nodes: a set of all the MLMI of the DFG
 
-     - backward_edges: a map from MemOperand to MLMI, mapping each
-       MemOperand to the MLMI that defines it.
-
-     - forward_edges: a map from MLMI to list of MLMI, mapping each
-       MLMI to the MLMIs that use its outputs.
+     - node_list, node_ids: the nodes are numbered densely, each node
+       added to the DFG (by add_node or merge_nodes) getting the next
+       id. node_list maps each id to its node (or to None once the
+       node has been merged), and node_ids maps each node to its id.
+
+     - succs, preds: lists mapping the id of each node to the list
+       of ids of its successors (the nodes using its outputs), and of
+       its predecessors (the nodes defining its inputs). As for |uses|,
+       lists take less memory than sets. They are maintained by
+       merge_nodes, add_input, replace_inputs and clear_next_nodes.
+       next_nodes and prev_nodes return the sets of their MLMIs.
+
+     - def_ids: a list mapping the address of each MemOperand (the
+       MemOperands are numbered by memory_count) to the id of the node
+       that defines it, or to -1. While nodes are being merged, it can
+       map a MemOperand to a node that has been merged since then (see
+       defining_node). It is a list rather than an array, so that it
+       shares the int objects of the ids with the other structures.
+
+     - parents: a list mapping the id of each node to the id of the
+       node it has been merged into, or to itself (ie, a union-find
+       structure of the merged nodes).
+
+     - uses: a map from MemOperand to list of MLMI, mapping each
+       MemOperand to the MLMIs that have it in their inputs (ie, its
+       def-use chain, the definition being given by
+       def_ids). Lists take less memory than sets, and have
+       only a few elements. It is maintained by merge_nodes, add_input and
+       replace_inputs, which have to be used to change the inputs of
+       the nodes.
+
+     - ranks: a map from MLMI to int, such that each MLMI has a
+       smaller rank than the MLMIs that use its outputs (ie, a
+       topological order of the DFG). It is maintained by
+       merge_nodes, and used by check_domination_for_merge to bound
+       its searches.
 
      - prog_inputs: the inputs of the program
 
      - prog: the original mlir program
 
+    Passes which do not modify the DFG can use a FrozenDFG (see
+    freeze), a snapshot of the DFG where the live nodes are numbered
+    from 0, and their predecessors and successors are stored in
+    arrays.
+
     """
     def __init__(self, mlir:MLIRProgram, show_dfg=False):
         self.build_graph(mlir, show_dfg)
@@ -33,47 +70,247 @@ class DFG:
     def build_graph(self, mlir:MLIRProgram, show_dfg=False):
         """Builds the dataflow graph of the program"""
 
-        # Storing which instruction defines each variables
-        backward_edges = { dst : instr for instr in mlir.instrs
-                           for dst in instr.get_defs() }
+        self.prog = mlir
+        self.prog_inputs = set(mlir.inputs)
+        self.prog_outputs = mlir.outputs
+        self.memory_count = mlir.memory_count
+        self.nodes = set()
+        self.node_list = []
+        self.node_ids = dict()
+        self.succs = []
+        self.preds = []
+        self.parents = []
+        self.def_ids = [ -1 ] * mlir.memory_count
+        self.uses = dict()
 
-        # Get all variables used by the program
-        used_vars = { var for instr in mlir.instrs
-                      for var in instr.get_used() }
-        # Get inputs
-        inputs = set(mlir.inputs)
+        # Storing which instruction defines each variables
+        for instr in mlir.instrs:
+            self.add_node(instr)
+            for dst in instr.get_defs():
+                self.set_defining_node(dst, instr)
 
         # Computing edges
-        forward_edges = defaultdict(lambda: set())
         for instr in mlir.instrs:
+            idx = self.node_ids[instr]
             for src in instr.get_used():
-                if src not in inputs:
-                    forward_edges[backward_edges[src]].add(instr)
-
-        self.prog = mlir
-        self.prog_inputs = inputs
-        self.prog_outputs = mlir.outputs
-        self.memory_count = mlir.memory_count
-        self.backward_edges = backward_edges
-        self.nodes = { v for v in backward_edges.values() }
-        self.forward_edges = forward_edges
+                if src not in self.prog_inputs:
+                    self.add_edge(self.def_ids[src.m], idx)
+            for src in set(instr.inputs):
+                self.add_use(src, instr)
+        # The instructions of |mlir| are in execution order, which is
+        # a topological order of the DFG.
+        self.ranks = { instr : idx for idx, instr in enumerate(mlir.instrs) }
+        # Layers of the program, set by the universalization: a list of
+        # lists of mutually independent nodes, each layer depending
+        # only on the previous ones.
+        self.layers = None
 
         if show_dfg:
             # DEBUG ONLY: Plotting the graph
             self.show_dfg()
 
+    def add_node(self, node:MLMI):
+        """Adds |node| to the DFG (without edges), and returns its id"""
+        idx = len(self.node_list)
+        self.nodes.add(node)
+        self.node_list.append(node)
+        self.node_ids[node] = idx
+        self.succs.append([])
+        self.preds.append([])
+        self.parents.append(idx)
+        return idx
+
+    def add_edge(self, def_idx, use_idx):
+        """Adds the edge from the node |def_idx| to the node |use_idx|
+        (given by their ids), if there is none"""
+        succs = self.succs[def_idx]
+        if use_idx not in succs:
+            succs.append(use_idx)
+            self.preds[use_idx].append(def_idx)
+
+    def remove_edge(self, def_idx, use_idx):
+        """Removes the edge from the node |def_idx| to the node
+        |use_idx| (given by their ids), if there is one"""
+        succs = self.succs[def_idx]
+        if use_idx in succs:
+            succs.remove(use_idx)
+            self.preds[use_idx].remove(def_idx)
+
+    def clear_next_nodes(self, node:MLMI):
+        """Removes the edges from |node| to its successors"""
+        idx = self.node_ids[node]
+        for succ in self.succs[idx]:
+            self.preds[succ].remove(idx)
+        self.succs[idx] = []
+
     def output_count(self, node:MLMI):
-        return len(self.forward_edges[node])
+        return len(self.succs[self.node_ids[node]]) if node in self.node_ids else 0
 
     def next_nodes(self, node:MLMI):
-        return self.forward_edges[node]
+        idx = self.node_ids.get(node)
+        if idx is None:
+            return NO_NODES
+        node_list = self.node_list
+        return { node_list[succ] for succ in self.succs[idx] }
 
     def prev_nodes(self, node:MLMI):
-        prevs = set()
-        for m in node.inputs:
-            if m in self.backward_edges:
-                prevs.add(self.backward_edges[m])
-        return prevs
+        idx = self.node_ids.get(node)
+        if idx is None:
+            return NO_NODES
+        node_list = self.node_list
+        return { node_list[pred] for pred in self.preds[idx] }
+
+    def use_count(self, m):
+        """Returns the number of nodes using |m|"""
+        return len(self.uses.get(m, NO_NODES))
+
+    def add_use(self, m, node:MLMI):
+        """Adds |node| to the uses of |m| (which it must not be in
+        already)"""
+        if m in self.uses:
+            self.uses[m].append(node)
+        else:
+            self.uses[m] = [ node ]
+
+    def remove_use(self, m, node:MLMI):
+        m_uses = self.uses[m]
+        m_uses.remove(node)
+        if len(m_uses) == 0:
+            del self.uses[m]
+
+    def add_input(self, node:MLMI, m):
+        """Adds |m| to the inputs of |node|, with the edge from the node
+        defining it"""
+        node.inputs.append(m)
+        if node not in self.uses.get(m, NO_NODES):
+            self.add_use(m, node)
+        if m not in self.prog_inputs and self.is_defined(m):
+            self.add_edge(self.find(self.def_ids[m.m]), self.node_ids[node])
+
+    def replace_input(self, node:MLMI, old_m, new_m):
+        """Replaces the input |old_m| of |node| by |new_m| (see
+        replace_inputs)"""
+        self.replace_inputs(node, { old_m : new_m })
+
+    def replace_inputs(self, node:MLMI, old_to_new):
+        """Replaces each input m of |node| in |old_to_new| by
+        old_to_new[m] (in its inputs and its instructions), and
+        updates the edges: the edge from the node defining m is
+        removed if |node| does not use its other outputs."""
+        old_to_new = { m : old_to_new[m] for m in node.inputs if m in old_to_new }
+        node.inputs = [ old_to_new.get(m, m) for m in node.inputs ]
+        node.seq.replace_srcs(old_to_new)
+
+        idx = self.node_ids[node]
+        for old_m in old_to_new:
+            self.remove_use(old_m, node)
+        for new_m in set(old_to_new.values()):
+            if node not in self.uses.get(new_m, NO_NODES):
+                self.add_use(new_m, node)
+            if new_m not in self.prog_inputs and self.is_defined(new_m):
+                self.add_edge(self.find(self.def_ids[new_m.m]), idx)
+        for old_m in old_to_new:
+            if old_m in self.prog_inputs or not self.is_defined(old_m):
+                continue
+            def_idx = self.find(self.def_ids[old_m.m])
+            def_node = self.node_list[def_idx]
+            if not any(node in self.uses.get(m, NO_NODES) for m in def_node.outputs):
+                self.remove_edge(def_idx, idx)
+
+    def is_defined(self, m):
+        """Checks if |m| is defined by a node"""
+        return m.m < len(self.def_ids) and self.def_ids[m.m] != -1
+
+    def set_defining_node(self, m, node:MLMI):
+        """Records that |m| is defined by |node|"""
+        if m.m >= len(self.def_ids):
+            self.def_ids += [ -1 ] * (m.m + 1 - len(self.def_ids))
+        self.def_ids[m.m] = self.node_ids[node]
+
+    def find(self, idx):
+        """Returns the id of the node into which the node |idx| has been
+        merged (following |parents|, and compressing the path)"""
+        parents = self.parents
+        root = idx
+        while parents[root] != root:
+            root = parents[root]
+        while parents[idx] != root:
+            parents[idx], idx = root, parents[idx]
+        return root
+
+    def defining_node(self, m):
+        """Returns the node that defines |m|, following |parents| from
+        the node of |def_ids| (and updating both so that next calls
+        are faster)."""
+        idx = self.def_ids[m.m]
+        root = self.find(idx)
+        if root != idx:
+            self.def_ids[m.m] = root
+        return self.node_list[root]
+
+    def merged_node(self, node:MLMI):
+        """Returns the node into which |node| has been merged (or |node|
+        itself if it has not been merged)"""
+        return self.node_list[self.find(self.node_ids[node])]
+
+    def resolve_merges(self):
+        """Makes |def_ids| map each MemOperand to the node that defines
+        it, and forgets the ids of the merged nodes (so that they can
+        be freed, and merged_node can only be called on the nodes of
+        the DFG afterwards). This has to be done once nodes are
+        merged."""
+        for m in range(len(self.def_ids)):
+            if self.def_ids[m] != -1:
+                self.def_ids[m] = self.find(self.def_ids[m])
+        for node in [ node for node, idx in self.node_ids.items()
+                      if self.node_list[idx] is None ]:
+            del self.node_ids[node]
+
+    def reachable_between(self, nstart, nend):
+        """Returns the ids of the nodes reachable from |nstart| (without
+        going through |nend|) whose rank is lower than the one of
+        |nend|, or None if |nend| is reachable from |nstart| other
+        than through their direct edge.
+
+        Nodes of higher rank than |nend| cannot reach it, which bounds
+        the search to the nodes between |nstart| and |nend| in the
+        topological order.
+
+        """
+        ranks, node_list, succs = self.ranks, self.node_list, self.succs
+        end_rank = ranks[nend]
+        end_idx = self.node_ids[nend]
+        to_visit = [ n for n in succs[self.node_ids[nstart]]
+                     if n != end_idx and ranks[node_list[n]] < end_rank ]
+        visited = set(to_visit)
+        while len(to_visit) != 0:
+            n = to_visit.pop()
+            for next_node in succs[n]:
+                if next_node == end_idx:
+                    return None
+                if next_node not in visited and ranks[node_list[next_node]] < end_rank:
+                    visited.add(next_node)
+                    to_visit.append(next_node)
+        return visited
+
+    def reaching_between(self, nstart, nend):
+        """Returns the ids of the nodes that reach |nend| (without going
+        through |nstart|) whose rank is higher than the one of
+        |nstart|. This is the backward counterpart of
+        reachable_between, for merges that are known to be valid."""
+        ranks, node_list, preds = self.ranks, self.node_list, self.preds
+        start_rank = ranks[nstart]
+        start_idx = self.node_ids[nstart]
+        to_visit = [ n for n in preds[self.node_ids[nend]]
+                     if n != start_idx and ranks[node_list[n]] > start_rank ]
+        visited = set(to_visit)
+        while len(to_visit) != 0:
+            n = to_visit.pop()
+            for prev_node in preds[n]:
+                if prev_node not in visited and ranks[node_list[prev_node]] > start_rank:
+                    visited.add(prev_node)
+                    to_visit.append(prev_node)
+        return visited
 
     def check_domination_for_merge(self, n1, n2):
         """Check if n1 and n2 could be merged, based on their domination
@@ -83,28 +320,47 @@ class DFG:
         dominated by n1 but dominate n2 (or vise-versa): this would
         create a cycle in the DFG.
 
-        The way to check this is to a traversal of the DFG from n1
-        (ignoring its direct successor n2 at the start) and see if we
-        end up on n2. (and vise-versa)
+        Only the node of lowest rank can reach the other one, so this
+        is a traversal of the DFG from this node (ignoring its direct
+        successor at the start), restricted to the nodes ranked
+        between both, which checks if we end up on the other node.
 
         """
-        for nstart, nend in [ (n1,n2), (n2,n1) ]:
-            to_visit = { n for n in self.next_nodes(nstart) if n != nend }
-            visited = set()
-            while len(to_visit) != 0:
-                n = to_visit.pop()
-                if n in visited:
-                    continue
-                if n == nend:
-                    return False
-                visited.add(n)
-                for next_node in self.next_nodes(n):
-                    to_visit.add(next_node)
+        if self.ranks[n1] > self.ranks[n2]:
+            n1, n2 = n2, n1
+        return self.reachable_between(n1, n2) is not None
 
-        return True
+    def update_ranks(self, n1, n2, new_node):
+        """Gives a rank to |new_node|, the merge of |n1| and |n2|, and
+        updates the ranks of the nodes ranked between them so that
+        |ranks| is still a topological order.
 
+        The nodes between |n1| and |n2| that reach the later one are
+        moved before the new node, and the ones reachable from the
+        earlier one after it, reusing their ranks (as in the dynamic
+        topological sort of Pearce and Kelly). The other nodes keep
+        their ranks.
 
-    def compute_merged_instrs(self, n1:MLMI, n2:MLMI, merged_inputs):
+        """
+        if self.ranks[n1] > self.ranks[n2]:
+            n1, n2 = n2, n1
+        after  = self.reachable_between(n1, n2)
+        assert after is not None, "merge_nodes would create a cycle"
+        before = self.reaching_between(n1, n2)
+
+        before = sorted(( self.node_list[n] for n in before ), key=lambda n: self.ranks[n])
+        after  = sorted(( self.node_list[n] for n in after ),  key=lambda n: self.ranks[n])
+        # The rank of n2 is dropped: there is one node less
+        pool = sorted([ self.ranks[n] for n in before ] + [ self.ranks[n1] ] +
+                      [ self.ranks[n] for n in after ])
+        for n, rank in zip(before + [ new_node ] + after, pool):
+            self.ranks[n] = rank
+        del self.ranks[n1]
+        del self.ranks[n2]
+
+
+    @staticmethod
+    def compute_merged_instrs(n1:MLMI, n2:MLMI, merged_inputs):
         # When merging two nodes, we need to make sure that variables
         # are computed before being used inside the resulting MI. For
         # instance, if we merge:
@@ -125,37 +381,51 @@ class DFG:
         #    y = x + 4
         #    x = a + b
         #
-        # When merging two MI where one is a direct predecessor of the
-        # other, this is fairly trivial to do. However, in the general
-        # case, it's probably a little bit less trivial, so, to avoid
-        # any unforseen complication, we do a simple scheduling here,
-        # iterating though all instructions and making sure that we
-        # schedule them only once their operands have been computed.
+        # Both sequences are already correctly ordered, so we
+        # interleave them: at each step, we schedule the first
+        # remaining instruction of one of them whose operands have
+        # been computed. One of them always has (otherwise, each node
+        # would use an output of the other, which would be a cycle in
+        # the DFG), so this is linear in the number of instructions.
         #
-        # Note: this function is non-deterministic. This means that it
-        # could return a sequence that reg_alloc can allocate
-        # registers for, but then be called on the same inputs and
-        # return a sequence for which reg_alloc cannot allocate
-        # registers. Thus, it's best to call it only once for some
-        # given inputs. If you wanted to make this function
-        # deterministic, then change |to_schedule| into a list
-        # (instead of a set), but be aware that this will negatively
-        # impact performance.
-        to_schedule = set(n1.seq.instrs + n2.seq.instrs)
+        # When both can be scheduled, we prefer the one that ends the
+        # live range of more of its operands (and the one of |n1| if
+        # they end as many), which lowers register pressure. The
+        # result only depends on the two sequences.
+        seq1, seq2 = n1.seq.instrs, n2.seq.instrs
+        srcs1 = [ [ src for src in (instr.src1, instr.src2, instr.src3)
+                    if isinstance(src, IR.MemOperand) ] for instr in seq1 ]
+        srcs2 = [ [ src for src in (instr.src1, instr.src2, instr.src3)
+                    if isinstance(src, IR.MemOperand) ] for instr in seq2 ]
+        remaining_uses = defaultdict(int)
+        for srcs_list in (srcs1, srcs2):
+            for srcs in srcs_list:
+                for src in srcs:
+                    remaining_uses[src] += 1
         defined = set(merged_inputs)
+
+        def ended_live_ranges(srcs):
+            return sum(1 for src in set(srcs)
+                       if remaining_uses[src] == srcs.count(src))
+
+        idx1, idx2 = 0, 0
+        len1, len2 = len(seq1), len(seq2)
         instrs = []
-        while len(to_schedule) != 0:
-            to_remove = set()
-            for instr in to_schedule:
-                if (isinstance(instr.src1, IR.MemOperand) and instr.src1 not in defined) or \
-                   (isinstance(instr.src2, IR.MemOperand) and instr.src2 not in defined) or \
-                   (isinstance(instr.src3, IR.MemOperand) and instr.src3 not in defined):
-                    # Instruction uses a source not defined yet
-                    continue
-                to_remove.add(instr)
-                defined.add(instr.dst)
-                instrs.append(instr)
-            to_schedule = to_schedule - to_remove
+        while idx1 != len1 or idx2 != len2:
+            ready1 = idx1 != len1 and defined.issuperset(srcs1[idx1])
+            ready2 = idx2 != len2 and defined.issuperset(srcs2[idx2])
+            if ready1 and (not ready2 or ended_live_ranges(srcs1[idx1]) >=
+                           ended_live_ranges(srcs2[idx2])):
+                instr, srcs = seq1[idx1], srcs1[idx1]
+                idx1 += 1
+            else:
+                assert ready2, "Merging these nodes would create a cycle"
+                instr, srcs = seq2[idx2], srcs2[idx2]
+                idx2 += 1
+            for src in srcs:
+                remaining_uses[src] -= 1
+            defined.add(instr.dst)
+            instrs.append(instr)
 
         return MLS(instrs)
 
@@ -166,11 +436,6 @@ class DFG:
     def compute_merged_outputs(self, n1:MLMI, n2:MLMI):
         outputs = set()
 
-        n1_outputs = set(n1.outputs)
-        n1_inputs  = set(n1.inputs)
-        n2_outputs = set(n2.outputs)
-        n2_inputs  = set(n2.inputs)
-
         prog_outputs = set(self.prog_outputs)
 
         for first_node, second_node in [ (n1, n2), (n2, n1) ]:
@@ -181,10 +446,7 @@ class DFG:
                     # This output will be used as an input in the MI. If
                     # it's not used in any other MI, then it's not an
                     # output but rather a local register.
-                    output_use_count = 0
-                    for n in self.next_nodes(first_node):
-                        if o in n.inputs:
-                            output_use_count += 1
+                    output_use_count = self.use_count(o)
                     assert output_use_count >= 1 # after all, it's in s_inputs
                     if o in prog_outputs:
                         output_use_count += 1
@@ -199,9 +461,11 @@ class DFG:
 
         return list(outputs)
 
-    def merge_nodes(self, n1:MLMI, n2:MLMI, merged_mls=None):
+    def merge_nodes(self, n1:MLMI, n2:MLMI, merged_mls=None,
+                    merged_inputs=None, merged_outputs=None):
         """Merges |n1| and |n2|, and updates internal structures so that the
-        DFG is still coherent.
+        DFG is still coherent. The sequence, inputs and outputs of the
+        merged node are computed unless they are given.
 
         Warning: this function does no do any verification that the
         nodes can actually be safely merged. You should do this
@@ -209,8 +473,14 @@ class DFG:
 
         """
 
-        inputs  = self.compute_merged_inputs(n1, n2)
-        outputs = self.compute_merged_outputs(n1, n2)
+        if merged_inputs is None:
+            inputs  = self.compute_merged_inputs(n1, n2)
+        else:
+            inputs  = merged_inputs
+        if merged_outputs is None:
+            outputs = self.compute_merged_outputs(n1, n2)
+        else:
+            outputs = merged_outputs
         if merged_mls is None:
             seq     = self.compute_merged_instrs(n1, n2, inputs)
         else:
@@ -218,70 +488,88 @@ class DFG:
 
         new_MLMI = MLMI(seq, inputs, outputs)
 
+        # Ranks need the edges of n1 and n2: updating them first
+        self.update_ranks(n1, n2, new_MLMI)
+
         # Updating internal
+        idx1, idx2 = self.node_ids[n1], self.node_ids[n2]
         self.nodes.remove(n1)
         self.nodes.remove(n2)
-        self.nodes.add(new_MLMI)
-
-        defined_in_new_MLMI = new_MLMI.get_defs()
-        used_in_new_LLMI    = new_MLMI.get_used()
-
-        # Removing out-dated forward_edges (needs to be done before
-        # updating backward edges)
-        for src in used_in_new_LLMI:
-            if src not in self.prog_inputs:
-                self.forward_edges[self.backward_edges[src]].discard(n1)
-                self.forward_edges[self.backward_edges[src]].discard(n2)
-
-        forward_edges_for_new = set()
-        for use_mlmi in self.forward_edges[n1]:
-            if use_mlmi != n2:
-                forward_edges_for_new.add(use_mlmi)
-        for use_mlmi in self.forward_edges[n2]:
-            if use_mlmi != n1:
-                forward_edges_for_new.add(use_mlmi)
-        self.forward_edges[new_MLMI] = forward_edges_for_new
-
-        # Updating backward edges
-        for var in defined_in_new_MLMI:
-            self.backward_edges[var] = new_MLMI
-
-        # Updating new forward edges
-        del self.forward_edges[n1]
-        del self.forward_edges[n2]
-
-        for src in used_in_new_LLMI:
-            if src not in self.prog_inputs:
-                self.forward_edges[self.backward_edges[src]].add(new_MLMI)
+        new_idx = self.add_node(new_MLMI)
+
+        # The predecessors (resp. successors) of the new node are the
+        # ones of n1 and n2, except n1 and n2 themselves: their edges
+        # now go to (resp. come from) the new node
+        merged = (idx1, idx2)
+        preds = list(set(self.preds[idx1]).union(self.preds[idx2]).difference(merged))
+        succs = list(set(self.succs[idx1]).union(self.succs[idx2]).difference(merged))
+        for pred in preds:
+            pred_succs = self.succs[pred]
+            pred_succs[:] = [ idx for idx in pred_succs if idx not in merged ]
+            pred_succs.append(new_idx)
+        for succ in succs:
+            succ_preds = self.preds[succ]
+            succ_preds[:] = [ idx for idx in succ_preds if idx not in merged ]
+            succ_preds.append(new_idx)
+        self.preds[new_idx] = preds
+        self.succs[new_idx] = succs
+
+        # Updating the uses of the inputs
+        for node in (n1, n2):
+            for src in set(node.inputs):
+                self.remove_use(src, node)
+        for src in set(inputs):
+            self.add_use(src, new_MLMI)
+
+        # Rather than mapping each variable of the new node to it,
+        # n1 and n2 now point to it in |parents|
+        for idx in (idx1, idx2):
+            self.parents[idx] = new_idx
+            self.node_list[idx] = None
+            self.preds[idx] = NO_NODES
+            self.succs[idx] = NO_NODES
 
         return new_MLMI
 
 
+    def freeze(self):
+        """Returns a FrozenDFG of the DFG, which is only valid until the
+        DFG is modified"""
+        return FrozenDFG(self)
+
     def to_LLIR(self, config):
-        llir_instrs = []  # The final LLMIs
         mem_ready = set() # The MemOperand that have already been defined
         for m in self.prog_inputs:
             mem_ready.add(m)
 
-        def schedule_node(node):
-            llir_instrs.append(lowering.MLMI_to_LLMI(node, config.r, config.l_out))
-            for m in node.outputs:
-                mem_ready.add(m)
-
         def node_is_ready(node) -> bool :
             for m in node.inputs:
                 if m not in mem_ready:
                     return False
             return True
 
-        todo = { n for n in self.nodes if node_is_ready(n) }
+        layers = self.layers
+        if layers is None:
+            # Each node is put in the first layer after the layers of
+            # the nodes it depends on
+            frozen = self.freeze()
+            (_, layer_ids) = frozen.layers()
+            layers = [ [ frozen.nodes[idx] for idx in ids ] for ids in layer_ids ]
+
+        # Scheduling the nodes layer by layer: the nodes of a layer
+        # must only depend on the previous layers.
+        llir_instrs = []  # The final LLMIs
         done = set()
-        while len(todo) != 0:
-            node = todo.pop()
-            if node_is_ready(node):
-                schedule_node(node)
-                todo.update(self.forward_edges[node])
+        for layer in layers:
+            for node in layer:
+                if not node_is_ready(node):
+                    print("Not ready in its layer: ", node)
+                    raise RuntimeError()
+            for node in layer:
+                llir_instrs.append(lowering.MLMI_to_LLMI(node, config.r, config.l_out))
                 done.add(node)
+            for node in layer:
+                mem_ready.update(node.outputs)
 
         # Checking that all nodes were scheduled.
         for node in self.nodes:
@@ -290,41 +578,184 @@ class DFG:
                 raise RuntimeError()
 
         return IR.LLIRProgram(llir_instrs, self.prog.inputs, self.prog_outputs,
-                              self.memory_count)
+                              self.memory_count,
+                              [ len(layer) for layer in layers ])
 
 
     def check_dfg_integrity(self):
-        """Check that the edges of the graph are consistent"""
+        """Check that the edges of the graph are consistent: the
+        successors and predecessors of each node have to be the nodes
+        using its outputs and defining its inputs (which are its
+        successors and predecessors in a FrozenDFG), and the uses of
+        each variable have to be the nodes using it"""
         for node in self.nodes:
             for m in node.inputs:
-                # Checking incoming forward edges
-                if m in self.prog_inputs:
-                    continue
-                if m not in self.backward_edges:
-                    print(f"Missing backward edges for memory {m}")
+                if node not in self.uses.get(m, NO_NODES):
+                    print(f"Missing use of {m}")
+                    print("use: ", node)
                     sys.exit("Invalid DFG")
-                else:
-                    def_node = self.backward_edges[m]
-                    if node not in self.forward_edges[def_node]:
-                        print(f"Missing forward edge from def to use of {m}")
-                        print("def: ", def_node)
-                        print("use: ", node)
-                        sys.exit("Invalid DFG")
-
-                # Checking out-going forward edges
-                outputs = set(node.outputs)
-                for next_node in self.forward_edges[node]:
-                    if len(outputs & set(next_node.inputs)) == 0:
-                        print(f"Erroneous forward edge.")
-                        sys.exit("Invalid DFG")
+        if sum(len(users) for users in self.uses.values()) != \
+           sum(len(set(node.inputs)) for node in self.nodes):
+            print("Erroneous use.")
+            sys.exit("Invalid DFG")
+
+        frozen = self.freeze()
+        for idx in frozen.undefined:
+            node = frozen.nodes[idx]
+            m = next(m for m in node.inputs if m not in self.prog_inputs and
+                     (not self.is_defined(m) or
+                      self.defining_node(m) not in frozen.node_ids))
+            print(f"Missing backward edges for memory {m}")
+            print("use: ", node)
+            sys.exit("Invalid DFG")
+
+        for idx, node in enumerate(frozen.nodes):
+            next_nodes = self.next_nodes(node)
+            users = { frozen.nodes[user] for user in frozen.successors(idx) }
+            for user in users - next_nodes:
+                print("Missing forward edge from def to use")
+                print("def: ", node)
+                print("use: ", user)
+                sys.exit("Invalid DFG")
+            if len(next_nodes - users) != 0:
+                print(f"Erroneous forward edge.")
+                sys.exit("Invalid DFG")
+            defs = { frozen.nodes[pred] for pred in frozen.predecessors(idx) }
+            if self.prev_nodes(node) != defs:
+                print(f"Erroneous backward edge.")
+                print("use: ", node)
+                sys.exit("Invalid DFG")
 
     def show_dfg(self, filename="out.gv"):
         self.check_dfg_integrity()
         dot = Digraph(filename=filename)
         for node in self.nodes:
             dot.node(str(id(node)), str(node))
-        for def_instr, use_instr_list in self.forward_edges.items():
-            for use_instr in use_instr_list:
+        for def_instr in self.nodes:
+            for use_instr in self.next_nodes(def_instr):
                 dot.edge(str(id(def_instr)), str(id(use_instr)))
 
         dot.render(view=True)
+
+
+# The successors of the nodes that are not in the DFG
+NO_NODES = frozenset()
+
+# Value of FrozenDFG.def_nodes for the addresses not yet looked up
+UNRESOLVED = -2
+
+
+class FrozenDFG:
+    """Read-only snapshot of a DFG
+
+    The nodes are numbered from 0 (independently of the ids of the
+    DFG, which include the merged nodes), and the edges are stored in
+    compressed sparse row (CSR) form:
+
+     - nodes: the list of the MLMIs, the id of a node being its index
+
+     - node_ids: a map from MLMI to id
+
+     - def_nodes: an array mapping each address m (of the MemOperand
+       m[m], which are numbered by the DFG) used by a node to the id
+       of the node defining it, or to -1 if it is not defined by a
+       node (or not used)
+
+     - preds, pred_offsets: arrays such that the predecessors of the
+       node |idx| (the nodes defining its inputs) are
+       preds[pred_offsets[idx]:pred_offsets[idx+1]], in increasing
+       order
+
+     - succs, succ_offsets: same for the successors of the nodes (the
+       nodes using their outputs)
+
+     - undefined: the ids of the nodes having an input which is
+       neither an input of the program nor defined by a node. They
+       are in no topological order.
+
+    The edges are computed from the inputs of the nodes, and not from
+    the successors and predecessors maintained by the DFG, so that
+    check_dfg_integrity can compare them.
+
+    """
+    def __init__(self, dfg:DFG):
+        self.nodes = list(dfg.nodes)
+        self.node_ids = { node : idx for idx, node in enumerate(self.nodes) }
+        self.def_nodes = array('l', [ UNRESOLVED ]) * dfg.memory_count
+        self.preds = array('l')
+        self.pred_offsets = array('l', [ 0 ])
+        self.undefined = []
+        succ_counts = array('l', [ 0 ]) * len(self.nodes)
+        for idx, node in enumerate(self.nodes):
+            preds = set()
+            for m in node.inputs:
+                if m in dfg.prog_inputs:
+                    continue
+                def_node = self.def_nodes[m.m]
+                if def_node == UNRESOLVED:
+                    def_node = -1
+                    if dfg.is_defined(m):
+                        def_node = self.node_ids.get(dfg.defining_node(m), -1)
+                    self.def_nodes[m.m] = def_node
+                if def_node == -1:
+                    self.undefined.append(idx)
+                else:
+                    preds.add(def_node)
+            for pred in sorted(preds):
+                self.preds.append(pred)
+                succ_counts[pred] += 1
+            self.pred_offsets.append(len(self.preds))
+        self.undefined = sorted(set(self.undefined))
+        for m in range(len(self.def_nodes)):
+            if self.def_nodes[m] == UNRESOLVED:
+                self.def_nodes[m] = -1
+
+        # The successors are the transpose of the predecessors: adding
+        # the nodes by increasing id sorts them
+        self.succ_offsets = array('l', [ 0 ]) * (len(self.nodes) + 1)
+        for idx in range(len(self.nodes)):
+            self.succ_offsets[idx+1] = self.succ_offsets[idx] + succ_counts[idx]
+        self.succs = array('l', [ 0 ]) * len(self.preds)
+        next_succ = array('l', self.succ_offsets[:-1])
+        for idx in range(len(self.nodes)):
+            for pred in self.predecessors(idx):
+                self.succs[next_succ[pred]] = idx
+                next_succ[pred] += 1
+
+    def predecessors(self, idx):
+        return self.preds[self.pred_offsets[idx]:self.pred_offsets[idx+1]]
+
+    def successors(self, idx):
+        return self.succs[self.succ_offsets[idx]:self.succ_offsets[idx+1]]
+
+    def topological_order(self):
+        """Returns the ids of the nodes in a topological order (without
+        the undefined nodes, and the nodes depending on them)"""
+        pred_counts = array('l', ( self.pred_offsets[idx+1] - self.pred_offsets[idx]
+                                   for idx in range(len(self.nodes)) ))
+        for idx in self.undefined:
+            pred_counts[idx] += 1
+        order = [ idx for idx in range(len(self.nodes)) if pred_counts[idx] == 0 ]
+        for idx in order:
+            for succ in self.successors(idx):
+                pred_counts[succ] -= 1
+                if pred_counts[succ] == 0:
+                    order.append(succ)
+        return order
+
+    def layers(self):
+        """Splits the nodes into layers, each node being in the first
+        layer after the layers of its predecessors. Returns an array
+        mapping each node id to its layer (-1 for the nodes in no
+        topological order), and the list of the ids of each layer."""
+        node_layers = array('l', [ -1 ]) * len(self.nodes)
+        layers = []
+        for idx in self.topological_order():
+            layer = 0
+            for pred in self.predecessors(idx):
+                layer = max(layer, node_layers[pred] + 1)
+            node_layers[idx] = layer
+            if layer == len(layers):
+                layers.append([])
+            layers[layer].append(idx)
+        return (node_layers, layers)
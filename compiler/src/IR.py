@@ -1,5 +1,6 @@
 from abc    import ABC, abstractmethod
 from enum   import Enum
+from itertools import count
 from typing import Final
 
 class Opcode(Enum):
@@ -119,9 +120,25 @@ class HLI:
             str(self.src1) + src2_str + src3_str
 
 class MLS:
-    """Mid-level Sequence"""
+    """Mid-level Sequence
+
+    The variables defined and used by the sequence (see get_defs and
+    get_used) are computed once, and cached: once they have been
+    computed, the instructions of the sequence have to be modified
+    through append, insert and replace_srcs, which update them, and
+    the returned sets must not be modified. If MLS.check_caches is
+    true (with -check-caches), the cached sets are compared with the
+    instructions at each access.
+
+    """
+    check_caches = False
+
     def __init__(self, instrs):
         self.instrs = instrs
+        # Cached sets of get_defs and get_used (or None before the
+        # first access)
+        self.defs = None
+        self.used = None
 
     def __str__(self):
         return "\n".join([ "    " + str(i) for i in self.instrs ])
@@ -130,30 +147,88 @@ class MLS:
         for instr in self.instrs:
             yield instr
 
-    def get_defs(self):
-        """Returns variables defined by this MLS"""
+    def compute_vars(self):
+        """Returns the variables defined by this MLS, and the ones used
+        but not defined by it"""
         defs = set()
+        used = set()
         for instr in self.instrs:
             defs.add(instr.dst)
-        return defs
+            for src in [instr.src1, instr.src2, instr.src3]:
+                if isinstance(src, MemOperand):
+                    used.add(src)
+        return (defs, used - defs)
+
+    def check_cached_vars(self):
+        (defs, used) = self.compute_vars()
+        assert self.defs == defs, f"Stale defs for MLS:\n{self}"
+        assert self.used == used, f"Stale used variables for MLS:\n{self}"
+
+    def get_defs(self):
+        """Returns variables defined by this MLS"""
+        if self.defs is None:
+            (self.defs, self.used) = self.compute_vars()
+        elif MLS.check_caches:
+            self.check_cached_vars()
+        return self.defs
 
     def get_used(self):
         """Returns registers used but not defs by this MLS"""
-        defs = self.get_defs()
-        used = set()
+        if self.used is None:
+            (self.defs, self.used) = self.compute_vars()
+        elif MLS.check_caches:
+            self.check_cached_vars()
+        return self.used
+
+    def append(self, instr):
+        """Adds |instr| at the end of this MLS"""
+        self.insert(len(self.instrs), instr)
+
+    def insert(self, idx, instr):
+        """Adds |instr| at the position |idx| of this MLS"""
+        self.instrs.insert(idx, instr)
+        if self.defs is not None:
+            self.defs.add(instr.dst)
+            self.used.discard(instr.dst)
+            self.used.update(src for src in instr.mem_inputs()
+                             if src not in self.defs)
+
+    def replace_srcs(self, old_to_new):
+        """Replaces each source m of the instructions in |old_to_new| by
+        old_to_new[m]"""
+        replaced = set()
         for instr in self.instrs:
-            for src in [instr.src1, instr.src2, instr.src3]:
-                if isinstance(src, MemOperand):
-                    used.add(src)
-        return used - defs
+            for src in instr.mem_inputs():
+                if src in old_to_new:
+                    replaced.add(src)
+            instr.src1 = old_to_new.get(instr.src1, instr.src1)
+            instr.src2 = old_to_new.get(instr.src2, instr.src2)
+            instr.src3 = old_to_new.get(instr.src3, instr.src3)
+        if self.defs is not None:
+            self.used -= replaced
+            self.used.update(old_to_new[m] for m in replaced
+                             if old_to_new[m] not in self.defs)
 
 
 class MLMI:
-    """Mid-level Multi instruction"""
+    """Mid-level Multi instruction
+
+    MLMIs are only equal to themselves, but are hashed by their
+    creation order (rather than by their address), so that the
+    iteration order of sets of MLMIs, and thus the compilation, is the
+    same from one run to the next.
+
+    """
+    creation_order = count()
+
     def __init__(self, seq:MLS, inputs, outputs):
         self.seq     = seq
         self.inputs  = inputs
         self.outputs = outputs
+        self.hash    = next(MLMI.creation_order)
+
+    def __hash__(self):
+        return self.hash
 
     @staticmethod
     def FromHLI(hli:HLI):
@@ -351,13 +426,18 @@ class LLIRProgram:
     likelyhood, it is initially, but some later pass should remove the
     SSA to optimize memory usage)
 
+    |layers|, if provided, is the size of each layer of the program:
+    the multi-instructions of a layer are consecutive, and only depend
+    on those of the previous layers.
+
     """
 
-    def __init__(self, instrs, inputs, outputs, memory_count:int):
+    def __init__(self, instrs, inputs, outputs, memory_count:int, layers=None):
         self.instrs  = instrs
         self.inputs  = inputs
         self.outputs = outputs
         self.memory_count = memory_count
+        self.layers = layers
 
     def __str__(self):
         inputs  = ", ".join([ str(i) for i in self.inputs  ])
@@ -58,10 +58,15 @@ number of inputs/outputs to encrypt (it reduces it actually).
 
 """
 
+import copy
+import heapq
+import itertools
+import time
 from collections import defaultdict
 from lowering.reg_alloc import LinearScanAllocator
 from DFG import DFG
 from IR import Opcode, MemOperand, RegOperand, HLI, MLS, MLMI, LLI, LLS, LLMI, HLIRProgram, MLIRProgram, LLIRProgram
+from .merge_stats import count_call, reject, timed
 
 def initial_convertion_to_mlir(hlir:HLIRProgram) -> MLIRProgram :
     """Creates one MLMI per instruction.
@@ -75,37 +80,140 @@ def initial_convertion_to_mlir(hlir:HLIRProgram) -> MLIRProgram :
                        hlir.inputs, hlir.outputs, hlir.memory_count)
 
 
-def merge_1_output_nodes(dfg, config):
-    merged_seq = None
+def out_of_time(deadline):
+    """Checks if |deadline| (a time.time() value, or None for no
+    deadline) has passed"""
+    return deadline is not None and time.time() >= deadline
+
+
+def contract_chains(hlir:HLIRProgram, config, deadline=None) -> MLIRProgram :
+    """Creates the MLMIs of the instructions of |hlir|, where
+    instructions whose result is only used by a single MLMI are
+    already merged with it (when the constraints allow it).
+
+    This does in a single pass over the instructions most of the
+    merges of merge_1_output_nodes, which then only has to do the
+    remaining ones.
+
+    Instructions are visited in order, and each one is the last
+    instruction (the root) of its cluster: the clusters whose results
+    are only used by its cluster are added to it. The clusters are
+    kept in a union-find structure (mapping each instruction to an
+    instruction of its cluster).
+
+    After |deadline|, the remaining instructions are left alone.
+
+    """
+    instrs = hlir.instrs
+    prog_outputs = set(hlir.outputs)
+    defined_by = { instr.dst : idx for idx, instr in enumerate(instrs) }
+    # Instructions using the result of each instruction
+    consumers = [ set() for _ in instrs ]
+    for idx, instr in enumerate(instrs):
+        for src in instr.mem_inputs():
+            if src in defined_by:
+                consumers[defined_by[src]].add(idx)
+
+    parents = list(range(len(instrs)))
+    def find(idx):
+        root = idx
+        while parents[root] != root:
+            root = parents[root]
+        while parents[idx] != root:
+            parents[idx], idx = root, parents[idx]
+        return root
+
+    clusters = [ MLMI.FromHLI(instr) for instr in instrs ]
+    inputs   = [ set(instr.mem_inputs()) for instr in instrs ]
+    outputs  = [ { instr.dst } for instr in instrs ]
+    for idx in range(len(instrs)):
+        if out_of_time(deadline):
+            break
+        # Merging the clusters used only by the cluster of |idx|,
+        # until there are none: the result of an instruction used by
+        # several instructions can be merged once they are all in the
+        # cluster of |idx|.
+        merged = True
+        while merged:
+            merged = False
+            for src in sorted(inputs[idx], key=lambda m: m.m):
+                if src not in defined_by:
+                    continue
+                prev = find(defined_by[src])
+                if any(find(c) != idx for c in consumers[prev]):
+                    continue
+
+                count_call("contract_chains")
+                if len(clusters[prev].seq.instrs) + len(clusters[idx].seq.instrs) > config.s:
+                    reject("contract_chains", "s")
+                    continue
+                merged_inputs = (inputs[prev] | inputs[idx]) - outputs[prev]
+                if len(merged_inputs) > config.l_in:
+                    reject("contract_chains", "l_in")
+                    continue
+                merged_outputs = outputs[idx] | \
+                    { m for m in outputs[prev] if m in prog_outputs }
+                if len(merged_outputs) > config.l_out:
+                    reject("contract_chains", "l_out")
+                    continue
+                merged_instrs = timed("compute_merged_instrs", DFG.compute_merged_instrs,
+                                      clusters[prev], clusters[idx], merged_inputs)
+                if not timed("registers", LinearScanAllocator().needs_leq_k_registers,
+                             merged_instrs.instrs,
+                             list(merged_inputs), list(merged_outputs),
+                             config.r, config.l_out):
+                    reject("contract_chains", "registers")
+                    continue
+
+                parents[prev] = idx
+                clusters[idx] = MLMI(merged_instrs, list(merged_inputs), list(merged_outputs))
+                inputs[idx]   = merged_inputs
+                outputs[idx]  = merged_outputs
+                clusters[prev], inputs[prev], outputs[prev] = None, None, None
+                merged = True
+                break
+
+    mlmis = [ clusters[idx] for idx in range(len(instrs)) if parents[idx] == idx ]
+    return MLIRProgram(mlmis, hlir.inputs, hlir.outputs, hlir.memory_count)
+
+
+def merge_1_output_nodes(dfg, config, deadline=None):
+    # Sequence, inputs and outputs of the last merge accepted by
+    # should_merge_with_next
+    merged_seq, merged_inputs, merged_outputs = None, None, None
     def should_merge_with_next(node:MLMI):
         """Checks if |node| should be merged with the following node"""
+        count_call("should_merge_with_next")
         # Checking that |node| has a single output
         if dfg.output_count(node) != 1:
+            reject("should_merge_with_next", "single_output")
             return False
         next_node = next(iter(dfg.next_nodes(node)))
-        merged_inputs = dfg.compute_merged_inputs(node, next_node)
+        inputs = timed("compute_merged_inputs", dfg.compute_merged_inputs, node, next_node)
         # Checking input count
-        if len(merged_inputs) > config.l_in:
+        if len(inputs) > config.l_in:
+            reject("should_merge_with_next", "l_in")
             return False
         # Checking instruction count
         if len(node.seq.instrs) + len(next_node.seq.instrs) > config.s:
+            reject("should_merge_with_next", "s")
             return False
         # Checking register pressure
-        merged_instrs = dfg.compute_merged_instrs(node, next_node, merged_inputs)
-        if not LinearScanAllocator().needs_leq_k_registers(
-                merged_instrs.instrs,
-                merged_inputs,
-                dfg.compute_merged_outputs(node, next_node),
-                config.r, config.l_out):
+        merged_instrs = timed("compute_merged_instrs", dfg.compute_merged_instrs,
+                              node, next_node, inputs)
+        outputs = timed("compute_merged_outputs", dfg.compute_merged_outputs, node, next_node)
+        if not timed("registers", LinearScanAllocator().needs_leq_k_registers,
+                     merged_instrs.instrs, inputs, outputs, config.r, config.l_out):
+            reject("should_merge_with_next", "registers")
             return False
 
-        nonlocal merged_seq
-        merged_seq = merged_instrs
+        nonlocal merged_seq, merged_inputs, merged_outputs
+        merged_seq, merged_inputs, merged_outputs = merged_instrs, inputs, outputs
         return True
 
     if config.simple_clusterizer:
         to_visit = dfg.nodes.copy()
-        while len(to_visit) != 0:
+        while len(to_visit) != 0 and not out_of_time(deadline):
             candidate = to_visit.pop()
             if not should_merge_with_next(candidate):
                 continue
@@ -113,7 +221,7 @@ def merge_1_output_nodes(dfg, config):
             assert merged_seq != None
             new_node = dfg.merge_nodes(candidate,
                                     next(iter(dfg.next_nodes(candidate))),
-                                    merged_seq)
+                                    merged_seq, merged_inputs, merged_outputs)
             merged_seq = None
 
             # Re-adding the successors and predecessors of the new node in
@@ -125,7 +233,7 @@ def merge_1_output_nodes(dfg, config):
             to_visit.add(new_node)
     
     else:
-        while True:
+        while not out_of_time(deadline):
             # Searching for a node to merge
             candidate = None
             for node in dfg.nodes:
@@ -136,12 +244,59 @@ def merge_1_output_nodes(dfg, config):
             if candidate != None:
                 assert merged_seq != None
                 dfg.merge_nodes(candidate, next(iter(dfg.next_nodes(candidate))),
-                                merged_seq)
+                                merged_seq, merged_inputs, merged_outputs)
                 merged_seq = None
             else:
                 break
 
 
+def merge_io(dfg, config, n1, n2):
+    """Returns the score of the merge of |n1| and |n2| (see merge_score)
+    and the inputs and outputs of the merged node, without checking
+    its register pressure and check_domination_for_merge. The score
+    is -1 if the merged node would have too many instructions, inputs
+    or outputs.
+
+    """
+    count_call("merge_score")
+    # Checking instruction count
+    if len(n1.seq.instrs) + len(n2.seq.instrs) > config.s:
+        reject("merge_score", "s")
+        return (-1, None, None)
+    merged_inputs  = timed("compute_merged_inputs", dfg.compute_merged_inputs, n1, n2)
+    # Checking input count
+    if len(merged_inputs) > config.l_in:
+        reject("merge_score", "l_in")
+        return (-1, None, None)
+    merged_outputs = timed("compute_merged_outputs", dfg.compute_merged_outputs, n1, n2)
+    # Checking output count
+    if len(merged_outputs) > config.l_out:
+        reject("merge_score", "l_out")
+        return (-1, None, None)
+
+    score = len(n1.inputs) + len(n2.inputs) - len(merged_inputs) + \
+        len(n1.outputs) + len(n2.outputs) - len(merged_outputs)
+    return (score, merged_inputs, merged_outputs)
+
+def merge_mls(dfg, config, n1, n2, merged_inputs, merged_outputs):
+    """Returns the MLS of the merge of |n1| and |n2| (whose inputs and
+    outputs are given by merge_io), or None if it would need too many
+    registers or create a cycle in the DFG"""
+    # Checking register pressure
+    merged_instrs = timed("compute_merged_instrs", dfg.compute_merged_instrs,
+                          n1, n2, merged_inputs)
+    if not timed("registers", LinearScanAllocator().needs_leq_k_registers,
+                 merged_instrs.instrs, merged_inputs, merged_outputs,
+                 config.r, config.l_out):
+        reject("merge_score", "registers")
+        return None
+    # Checking that no nodes are dominated by n1 but dominate n2
+    # (or vise-versa).
+    if not timed("domination", dfg.check_domination_for_merge, n1, n2):
+        reject("merge_score", "domination")
+        return None
+    return merged_instrs
+
 def merge_score(dfg, config, n1, n2):
     """Returns a score for the resulting node representing how much of an
      improvement this merge would be.
@@ -158,39 +313,20 @@ def merge_score(dfg, config, n1, n2):
     # more expensive, and computing check_domination_for_merge is very
     # expensive. This way, this function will otfen early-return
     # without computing the more expensive parts.
-
-    # Checking instruction count
-    if len(n1.seq.instrs) + len(n2.seq.instrs) > config.s:
-        return (-1, None)
-    merged_inputs  = dfg.compute_merged_inputs(n1, n2)
-    # Checking input count
-    if len(merged_inputs) > config.l_in:
+    (score, merged_inputs, merged_outputs) = merge_io(dfg, config, n1, n2)
+    if score == -1:
         return (-1, None)
-    merged_outputs = dfg.compute_merged_outputs(n1, n2)
-    # Checking output count
-    if len(merged_outputs) > config.l_out:
-        return (-1, None)
-    # Checking register pressure
-    merged_instrs = dfg.compute_merged_instrs(n1, n2, merged_inputs)
-    if not LinearScanAllocator().needs_leq_k_registers(
-            merged_instrs.instrs,
-            merged_inputs, merged_outputs,
-            config.r, config.l_out):
+    merged_instrs = merge_mls(dfg, config, n1, n2, merged_inputs, merged_outputs)
+    if merged_instrs is None:
         return (-1, None)
-    # Checking that no nodes are dominated by n1 but dominate n2
-    # (or vise-versa).
-    if not dfg.check_domination_for_merge(n1, n2):
-        return (-1, None)
-
-    score = len(n1.inputs) + len(n2.inputs) - len(merged_inputs) + \
-        len(n1.outputs) + len(n2.outputs) - len(merged_outputs)
     return (score, merged_instrs)
 
-def merge_parents_childs(dfg, config):
-    """Merges parents with their childs when possible"""
+def merge_parents_childs(dfg, config, deadline=None):
+    """Merges parents with their childs when possible (until
+    |deadline|)"""
     if config.simple_clusterizer:
         to_visit = dfg.nodes.copy()
-        while len(to_visit) != 0:
+        while len(to_visit) != 0 and not out_of_time(deadline):
             n1 = to_visit.pop()
             best_node, best_score = None, -1
             for n2 in dfg.next_nodes(n1):
@@ -213,82 +349,153 @@ def merge_parents_childs(dfg, config):
                     to_visit.add(node)
                 to_visit.add(new_node)
     else:
-        to_skip = set()
-        while True:
-            c1, c2, mls = None, None, None
-            for n1 in dfg.nodes:
-                if config.fast and n1 in to_skip:
-                    continue
-                best_node, best_score = None, -1
-                for n2 in dfg.next_nodes(n1):
-                    (n2_score, merged_instrs) = merge_score(dfg, config, n1, n2)
-                    if n2_score > best_score:
-                        best_node  = n2
-                        best_score = n2_score
-                        best_mls   = merged_instrs
-                if best_score != -1:
-                    c1 = n1
-                    c2 = best_node
-                    mls = best_mls
-                    break
-                elif config.fast:
-                    to_skip.add(n1)
-
-            if c1 != None:
-                assert c2 != None
-                assert mls != None
-                dfg.merge_nodes(c1, c2, mls)
-            else:
-                # No possible merges were found
-                break
-
-
-def merge_siblings(dfg, config):
-    """Merges siblings when possible"""
+        # Worklist of the candidate merges, as a min-heap of (position
+        # of the parent, -score, position of the child, creation order
+        # of both nodes, parent, child, merged inputs, merged
+        # outputs): as with a scan of the nodes in a topological
+        # order, the first parent that can be merged is merged with
+        # its best child. The position of a node is its rank in the
+        # DFG when it is pushed (the new node of a merge is placed
+        # between the nodes it depends on and the ones that depend on
+        # it, see update_ranks), and the heap is swept in increasing
+        # positions.
+        #
+        # The score of a pair only depends on its two nodes and on the
+        # use counts of their outputs (see compute_merged_outputs).
+        # These use counts only change when users of an output are
+        # merged, which only changes the scores of the pairs of the
+        # new node with its parents. So after a merge, only the pairs
+        # of the new node are scored and pushed, and the entries of
+        # merged nodes are dropped when they are popped. The expensive
+        # checks of merge_mls are only done on popped entries: a pair
+        # rejected there stays rejected while both nodes exist (merges
+        # never remove a path between two other nodes), so it is not
+        # pushed again. With -fast, the pairs of the new node with its
+        # parents are not pushed: the parents are not tried again.
+        heap = []
+        position = dict(dfg.ranks)
+
+        def push_candidate(n1, n2):
+            (score, merged_inputs, merged_outputs) = merge_io(dfg, config, n1, n2)
+            if score != -1:
+                heapq.heappush(heap, (position[n1], -score, position[n2],
+                                      n1.hash, n2.hash, n1, n2,
+                                      merged_inputs, merged_outputs))
+
+        for n1 in dfg.nodes:
+            if out_of_time(deadline):
+                return
+            for n2 in dfg.next_nodes(n1):
+                push_candidate(n1, n2)
 
-    to_skip = set()
-    merged = True
-    while merged:
-        merged = False
-        for parent in dfg.nodes:
-            if config.fast and parent in to_skip:
+        while len(heap) != 0 and not out_of_time(deadline):
+            (_, _, _, _, _, n1, n2, merged_inputs, merged_outputs) = heapq.heappop(heap)
+            if n1 not in dfg.nodes or n2 not in dfg.nodes:
+                continue
+            mls = merge_mls(dfg, config, n1, n2, merged_inputs, merged_outputs)
+            if mls is None:
                 continue
-            childs = list(dfg.next_nodes(parent))
-            c1, c2, best_score, best_mls = None, None, -1, None
-            for i1 in range(len(childs)):
-                n1 = childs[i1]
-                for i2 in range(i1+1, len(childs)):
-                    n2 = childs[i2]
-                    (score, merged_instrs) = merge_score(dfg, config, n1, n2)
-                    if score > best_score:
-                        best_score = score
-                        c1 = n1
-                        c2 = n2
-                        best_mls = merged_instrs
-            if best_score > 0:
-                assert c1 != None and c2 != None and best_mls != None
-                dfg.merge_nodes(c1, c2, best_mls)
-                merged = True
-                break
-            elif config.fast:
-                to_skip.add(parent)
-
 
-def clusterize(hlir:HLIRProgram, config, print_stats=False) -> LLIRProgram :
-    mlir = initial_convertion_to_mlir(hlir)
+            new_node = dfg.merge_nodes(n1, n2, mls, merged_inputs, merged_outputs)
+            position[new_node] = dfg.ranks[new_node]
+            for node in dfg.next_nodes(new_node):
+                push_candidate(new_node, node)
+            for node in dfg.prev_nodes(new_node):
+                if not config.fast:
+                    push_candidate(node, new_node)
+
+
+def merge_siblings(dfg, config, deadline=None):
+    """Merges siblings when possible (until |deadline|)"""
+
+    # Worklist of the candidate merges of nodes sharing a parent, as a
+    # max-heap of (-score, creation order of both nodes, order of the
+    # scoring, older node, newer node, merged inputs, merged outputs),
+    # so that ties are broken the same way from one run to the next.
+    # |scored| maps each scored pair to the order of its last scoring,
+    # and the entries of the pairs scored again since are dropped when
+    # popped, as the ones of merged nodes.
+    #
+    # The score of a pair depends on its two nodes and on the use
+    # counts of their outputs (see compute_merged_outputs), which
+    # change when users of an output are merged. So after a merge, the
+    # pairs of the new node with its siblings, the pairs of its childs
+    # (which may now be siblings through it), and the pairs of its
+    # parents with their siblings are scored (again). The other pairs
+    # are not scored again. The expensive checks of merge_mls are only
+    # done on popped entries, and a pair rejected there is only tried
+    # again if it is scored again. This is always done as with -fast.
+    heap = []
+    scored = dict()
+    counter = itertools.count()
+
+    def push_siblings(parent):
+        childs = list(dfg.next_nodes(parent))
+        for i1 in range(len(childs)):
+            for i2 in range(i1+1, len(childs)):
+                push_candidate(childs[i1], childs[i2])
+
+    def push_candidate(n1, n2, again=False):
+        if n2.hash < n1.hash:
+            (n1, n2) = (n2, n1)
+        if (n1, n2) in scored and not again:
+            return
+        order = next(counter)
+        scored[(n1, n2)] = order
+        (score, merged_inputs, merged_outputs) = merge_io(dfg, config, n1, n2)
+        if score > 0:
+            heapq.heappush(heap, (-score, n1.hash, n2.hash, order, n1, n2,
+                                  merged_inputs, merged_outputs))
+
+    for parent in dfg.nodes:
+        if out_of_time(deadline):
+            return
+        push_siblings(parent)
+
+    while len(heap) != 0 and not out_of_time(deadline):
+        (_, _, _, order, n1, n2, merged_inputs, merged_outputs) = heapq.heappop(heap)
+        if n1 not in dfg.nodes or n2 not in dfg.nodes or scored[(n1, n2)] != order:
+            continue
+        mls = merge_mls(dfg, config, n1, n2, merged_inputs, merged_outputs)
+        if mls is None:
+            continue
+
+        new_node = dfg.merge_nodes(n1, n2, mls, merged_inputs, merged_outputs)
+        parents = dfg.prev_nodes(new_node)
+        for parent in parents:
+            for node in dfg.next_nodes(parent):
+                if node != new_node:
+                    push_candidate(new_node, node)
+        push_siblings(new_node)
+        for parent in parents:
+            for grandparent in dfg.prev_nodes(parent):
+                for node in dfg.next_nodes(grandparent):
+                    if node != parent:
+                        push_candidate(parent, node, again=True)
 
-    dfg = DFG(mlir, False)
 
+def clusterize(hlir:HLIRProgram, config, print_stats=False) -> LLIRProgram :
     if print_stats:
+        nodes = initial_convertion_to_mlir(hlir).instrs
         inout_count  = 0
-        instrs_count = len(dfg.nodes)
-        for node in dfg.nodes:
+        instrs_count = len(nodes)
+        for node in nodes:
             inout_count  += len(node.inputs) + len(node.outputs)
         print(f"Before clusterization: {inout_count} inputs/outputs, {instrs_count} instructions.")
 
+    # Step 1: merge 1-output instructions with their output. Without
+    # -simple-clusterizer, merge_1_output_nodes rescans the whole DFG
+    # after each merge, so most merges are first done in a single pass
+    # on the instructions.
+    if config.simple_clusterizer:
+        mlir = initial_convertion_to_mlir(hlir)
+    else:
+        mlir = contract_chains(hlir, config)
+
+    dfg = DFG(mlir, False)
+
     #dfg.show_dfg(filename="before_clusterize")
 
-    # Step 1: merge 1-output instructions with their output
     merge_1_output_nodes(dfg, config)
 
     #dfg.show_dfg()
@@ -303,6 +510,7 @@ def clusterize(hlir:HLIRProgram, config, print_stats=False) -> LLIRProgram :
 
     #dfg.show_dfg(filename="after_clusterize")
 
+    dfg.resolve_merges()
 
     if print_stats:
         inout_count  = 0
@@ -312,3 +520,73 @@ def clusterize(hlir:HLIRProgram, config, print_stats=False) -> LLIRProgram :
         print(f"After clusterization: {inout_count} inputs/outputs, {instrs_count} instructions.")
 
     return dfg
+
+
+def inout_count(dfg):
+    """Returns the total number of inputs/outputs of the nodes of |dfg|"""
+    return sum(len(node.inputs) + len(node.outputs) for node in dfg.nodes)
+
+def clusterize_with_budget(hlir:HLIRProgram, config) -> LLIRProgram :
+    """Anytime version of clusterize, which stops merging after
+    config.time_budget seconds.
+
+    The DFG is valid after each merge, so the merges can be stopped at
+    any time. The clusterization first uses the strategy of
+    -simple-clusterizer, and then refines its result with the default
+    strategy of merge_parents_childs and merge_siblings (merging
+    siblings can allow new parent/child merges, and the other way
+    around) until nothing changes. If there is time left (and without
+    -simple-clusterizer), the default strategy is then started from
+    scratch, and its result is kept if it has less inputs/outputs.
+
+    The budget is checked between two merges, but building a DFG
+    cannot be interrupted: the default strategy is only started if the
+    remaining time is larger than the time it took to build the first
+    DFG.
+
+    """
+    start_time = time.time()
+    deadline = start_time + config.time_budget
+
+    def print_progress(step, dfg):
+        if config.stats:
+            print(f"  {step} ({time.time() - start_time:.2f} sec): "
+                  f"{len(dfg.nodes)} MLMIs, {inout_count(dfg)} inputs/outputs")
+
+    simple_config = copy.copy(config)
+    simple_config.simple_clusterizer = True
+    default_config = copy.copy(config)
+    default_config.simple_clusterizer = False
+
+    def refine(dfg):
+        while not out_of_time(deadline):
+            node_count = len(dfg.nodes)
+            merge_parents_childs(dfg, default_config, deadline)
+            merge_siblings(dfg, default_config, deadline)
+            if len(dfg.nodes) == node_count:
+                break
+        print_progress("Refined", dfg)
+
+    # Fastest strategy: -simple-clusterizer
+    best = DFG(initial_convertion_to_mlir(hlir), False)
+    build_time = time.time() - start_time
+    merge_1_output_nodes(best, simple_config, deadline)
+    merge_parents_childs(best, simple_config, deadline)
+    merge_siblings(best, simple_config, deadline)
+    print_progress("Simple clusterization", best)
+    refine(best)
+
+    # Default strategy
+    if not config.simple_clusterizer and deadline - time.time() > build_time:
+        dfg = DFG(contract_chains(hlir, default_config, deadline), False)
+        merge_1_output_nodes(dfg, default_config, deadline)
+        merge_parents_childs(dfg, default_config, deadline)
+        merge_siblings(dfg, default_config, deadline)
+        print_progress("Default clusterization", dfg)
+        refine(dfg)
+        if (inout_count(dfg), len(dfg.nodes)) < (inout_count(best), len(best.nodes)):
+            best = dfg
+
+    print_progress("Best clusterization", best)
+    best.resolve_merges()
+    return best
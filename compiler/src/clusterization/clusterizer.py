@@ -1,12 +1,38 @@
+import time
 import IR
 from . import naive_clusterizer
 from . import basic_clusterizer
+from . import multilevel_clusterizer
+from . import refinement
+from . import merge_log
 from utils import debug_print_IR
 
 def clusterize(hlir:IR.HLIRProgram, config) -> IR.LLIRProgram :
+    start_time = time.time()
 
     #llir = naive_clusterizer.clusterize(hlir, config)
-    llir = basic_clusterizer.clusterize(hlir, config)
+    if config.replay_merges:
+        llir = merge_log.replay(config.replay_merges, hlir, config)
+        debug_print_IR(config.verbose >= 5, "Clusterized LLIR:", llir)
+        return llir
+
+    if config.clusterizer == "multilevel":
+        llir = multilevel_clusterizer.clusterize(hlir, config)
+    elif config.time_budget > 0:
+        llir = basic_clusterizer.clusterize_with_budget(hlir, config)
+    else:
+        llir = basic_clusterizer.clusterize(hlir, config)
+
+    if config.refine > 0:
+        deadline = None
+        if config.time_budget > 0:
+            deadline = start_time + config.time_budget
+        llir = refinement.move_hlis(llir, config, config.refine, deadline)
+        if config.stats:
+            print(f"  Moved HLIs: {len(llir.nodes)} MLMIs, "
+                  f"{basic_clusterizer.inout_count(llir)} inputs/outputs")
+    if config.merge_log:
+        merge_log.save(config.merge_log, hlir, config, llir)
     debug_print_IR(config.verbose >= 5, "Clusterized LLIR:", llir)
 
     return llir
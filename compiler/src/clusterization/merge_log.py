@@ -0,0 +1,132 @@
+"""Log of the clusterization, to replay it on later compilations
+
+The clusterization is the slowest pass of the compiler, but its result
+only depends on the HLIR and on the options of the clusterizers. With
+-merge-log FILE, the clusterization is saved in FILE, and with
+-replay-merges FILE, it is read from FILE instead of being computed
+(skipping all the merge scores).
+
+The log contains a key (a hash of the HLIR and of the options that
+change the clusterization), and the MLMIs of the clustered DFG, in a
+topological order. Each MLMI is saved as the indices (in the HLIR) of
+its HLIs, in their order in the MLMI, and as the memory addresses of
+its inputs and of its outputs. This records the result of all merges
+(including the ones of contract_chains, which are done before the DFG
+is built), and the instructions moved by -refine, so the replayed
+MLMIs are the ones of the logged clusterization.
+
+The replayed MLMIs are still checked: each HLI has to be in a single
+MLMI, the inputs and outputs of each MLMI have to be the ones of its
+HLIs (and its outputs have to include the ones used by other MLMIs),
+its HLIs have to be in execution order, the constraints of the secure
+element (s, l_in, l_out and the register count) have to hold, and
+each MLMI can only use the outputs of the MLMIs before it (so that the
+DFG is acyclic).
+
+"""
+
+import hashlib
+import json
+import sys
+from lowering.reg_alloc import LinearScanAllocator
+from DFG import DFG
+from IR import MemOperand, MLS, MLMI, HLIRProgram, MLIRProgram
+
+LOG_VERSION = 1
+
+# Options of the compiler which change the clusterization (a
+# clusterization stopped by -time-budget is only replayed with the same
+# budget)
+KEY_OPTIONS = [ "r", "l_in", "l_out", "s", "fast", "simple_clusterizer",
+                "clusterizer", "refine", "time_budget" ]
+
+
+def compute_key(hlir:HLIRProgram, config):
+    """Returns the hash of |hlir| and of the options of |config| which
+    change its clusterization"""
+    h = hashlib.sha256()
+    h.update(str(hlir).encode())
+    options = [ getattr(config, option) for option in KEY_OPTIONS ]
+    h.update(json.dumps(options).encode())
+    return h.hexdigest()
+
+
+def save(outfile, hlir:HLIRProgram, config, dfg):
+    """Writes the log of |dfg|, the clusterization of |hlir|, to
+    |outfile|"""
+    indices = { id(instr) : idx for idx, instr in enumerate(hlir.instrs) }
+    nodes = sorted(dfg.nodes, key=lambda n: dfg.ranks[n])
+    log = { "version": LOG_VERSION,
+            "key": compute_key(hlir, config),
+            "mlmis": [ [ [ indices[id(instr)] for instr in node.seq.instrs ],
+                         [ m.m for m in node.inputs ],
+                         [ m.m for m in node.outputs ] ]
+                       for node in nodes ] }
+    json.dump(log, outfile, separators=(',', ':'))
+    outfile.close()
+
+
+def replay(infile, hlir:HLIRProgram, config) -> DFG :
+    """Returns the clustered DFG of |hlir| read from |infile| (written
+    by save), and exits if it does not match |hlir| and |config|"""
+    log = json.load(infile)
+    infile.close()
+    if log.get("version") != LOG_VERSION:
+        sys.exit(f"-replay-merges: unsupported log version {log.get('version')}. Exiting.")
+    if log["key"] != compute_key(hlir, config):
+        sys.exit(f"-replay-merges: the log was written for another program or other options. Exiting.")
+
+    prog_inputs  = set(hlir.inputs)
+    prog_outputs = set(hlir.outputs)
+    # Number of MLMIs using each variable
+    use_count = dict()
+    for (_, inputs, _) in log["mlmis"]:
+        for m in inputs:
+            use_count[m] = use_count.get(m, 0) + 1
+
+    defined = set(prog_inputs)
+    placed = [ False for _ in hlir.instrs ]
+    mlmis = []
+    for (instr_indices, inputs, outputs) in log["mlmis"]:
+        instrs = []
+        for idx in instr_indices:
+            if not 0 <= idx < len(hlir.instrs):
+                sys.exit(f"-replay-merges: invalid HLI {idx} in MLMI {len(mlmis)}. Exiting.")
+            if placed[idx]:
+                sys.exit(f"-replay-merges: HLI {idx} is in several MLMIs. Exiting.")
+            placed[idx] = True
+            instrs.append(hlir.instrs[idx])
+        inputs  = [ MemOperand(m) for m in inputs ]
+        outputs = [ MemOperand(m) for m in outputs ]
+
+        # Checking the inputs and outputs (an MLMI can have outputs
+        # that are not used)
+        defs = { instr.dst for instr in instrs }
+        used = { src for instr in instrs for src in instr.mem_inputs() }
+        needed_outputs = { m for m in defs
+                           if m in prog_outputs or use_count.get(m.m, 0) != 0 }
+        if set(inputs) != used - defs or \
+           not needed_outputs <= set(outputs) <= defs:
+            sys.exit(f"-replay-merges: wrong inputs/outputs for MLMI {len(mlmis)}. Exiting.")
+        if any(m not in defined for m in inputs):
+            sys.exit(f"-replay-merges: MLMI {len(mlmis)} uses a variable defined after it. Exiting.")
+        defined.update(defs)
+        available = set(inputs)
+        for instr in instrs:
+            if any(src not in available for src in instr.mem_inputs()):
+                sys.exit(f"-replay-merges: MLMI {len(mlmis)} uses a variable before defining it. Exiting.")
+            available.add(instr.dst)
+
+        # Checking the constraints of the secure element
+        if len(instrs) > config.s or len(inputs) > config.l_in or \
+           len(outputs) > config.l_out or \
+           not LinearScanAllocator().needs_leq_k_registers(
+               instrs, inputs, outputs, config.r, config.l_out):
+            sys.exit(f"-replay-merges: MLMI {len(mlmis)} does not fit in the secure element. Exiting.")
+
+        mlmis.append(MLMI(MLS(instrs), inputs, outputs))
+
+    if not all(placed):
+        sys.exit(f"-replay-merges: HLI {placed.index(False)} is in no MLMI. Exiting.")
+
+    return DFG(MLIRProgram(mlmis, hlir.inputs, hlir.outputs, hlir.memory_count), False)
@@ -0,0 +1,91 @@
+"""Counters of the merge checks of the clusterizers
+
+When enabled (with -stats or -stats-json), the merge functions of
+basic_clusterizer count how often they are called, how many merges
+each check rejects, and how long the checks take:
+
+  - merge_score: the scoring of a merge of two nodes. The worklists
+    of merge_parents_childs and merge_siblings (and the multilevel
+    clusterizer) call its two halves separately: merge_io, counted as
+    a call of merge_score, and merge_mls, only for the merges that are
+    then tried.
+
+  - should_merge_with_next: the merges of merge_1_output_nodes.
+
+  - contract_chains: the merges of a cluster with the cluster using
+    its results (before the DFG is built).
+
+  - move_hlis: the moves of an HLI (or of the HLIs of a node of a
+    level of the multilevel clusterizer) to a neighbouring MLMI (see
+    refinement.py).
+
+The checks are "s" (instruction count), "l_in", "l_out", "registers"
+(register pressure, see LinearScanAllocator.needs_leq_k_registers),
+"domination" (see DFG.check_domination_for_merge), for
+should_merge_with_next, "single_output", and for move_hlis, "gain"
+(the move would not remove inputs/outputs).
+
+When disabled, |current| is None, and counting costs a test per call.
+
+"""
+
+import time
+from collections import defaultdict
+
+class MergeStats:
+    def __init__(self):
+        # Number of calls of each function
+        self.calls = defaultdict(int)
+        # Number of rejected merges of each function, by check
+        self.rejections = defaultdict(lambda: defaultdict(int))
+        # Cumulative time (in seconds) spent in each check, and in
+        # the DFG.compute_merged_* functions
+        self.times = defaultdict(float)
+
+    def to_dict(self):
+        return { "calls": dict(self.calls),
+                 "rejections": { function : dict(checks)
+                                 for function, checks in self.rejections.items() },
+                 "times": dict(self.times) }
+
+    def print(self):
+        for function in sorted(self.calls):
+            rejections = self.rejections[function]
+            details = ", ".join([ f"{check}: {rejections[check]}"
+                                  for check in sorted(rejections) ])
+            print(f"  {function}: {self.calls[function]} calls, "
+                  f"{sum(rejections.values())} rejected ({details})")
+        for name in sorted(self.times):
+            print(f"  {name}: {self.times[name]:.2f} sec")
+
+
+# The MergeStats of the current clusterization, or None if the
+# counters are disabled
+current = None
+
+def enable():
+    global current
+    current = MergeStats()
+    return current
+
+def disable():
+    global current
+    current = None
+
+def count_call(function):
+    if current is not None:
+        current.calls[function] += 1
+
+def reject(function, check):
+    """Counts a merge of |function| rejected by |check|"""
+    if current is not None:
+        current.rejections[function][check] += 1
+
+def timed(name, f, *args):
+    """Returns f(*args), and adds its duration to the time of |name|"""
+    if current is None:
+        return f(*args)
+    start_time = time.perf_counter()
+    result = f(*args)
+    current.times[name] += time.perf_counter() - start_time
+    return result
@@ -0,0 +1,180 @@
+"""Multilevel clusterizer
+
+This clusterizer follows the multilevel scheme of graph partitioners
+such as METIS: the graph is coarsened by contracting groups of
+neighbouring nodes at each level, a partition of the coarsest graph
+is computed, and this partition is then projected back on each level,
+from the coarsest to the finest, and refined at each level.
+
+Here, the parts are the MLMIs, and their number is not fixed: each
+MLMI only has to respect the constraints of the secure element (l_in,
+l_out, s and the register count), and the DFG of the MLMIs has to stay
+acyclic. The finest graph is the DFG of the HLIs. The rating of an
+edge between a parent and its child is the number of inputs/outputs
+removed by their merge (the score of basic_clusterizer.merge_io), and
+every contraction is checked with basic_clusterizer.merge_mls, so that
+the DFG is valid at each level:
+
+  - Coarsening: the first level contracts the single-consumer chains
+    of HLIs (basic_clusterizer.contract_chains), which never adds
+    inputs/outputs, and keeps reductions (such as the ones of
+    sum_tree.c) as full trees. At each next level, the nodes are
+    visited in a topological order, and each node of the level is
+    merged with its neighbour (parent or child) of best rating, which
+    may be a node already merged at this level (the FirstChoice scheme
+    of hMETIS), if this merge is valid. With a matching (where each
+    node is merged at most once per level), the MLMIs grow by pairs
+    and end up too large to be merged together, while most of them
+    could have been filled. For the same reason, these merges are
+    limited to s/COARSE_NODE_MAX_RATIO instructions. The coarsening
+    stops once a level merges less than 1/COARSENING_MIN_RATIO of the
+    nodes. Each level keeps its nodes (the coarse graph) and the map
+    from each node of the previous level to the node of this level
+    containing it.
+
+  - Partitioning: the parents and childs, and then the siblings, of
+    the coarsest DFG are merged (basic_clusterizer.merge_parents_childs
+    and basic_clusterizer.merge_siblings). Each MLMI of the result is
+    a part.
+
+  - Uncoarsening: each node of a level is in the part of its node in
+    the next level, and the nodes of the level are moved between
+    neighbouring parts when this removes inputs/outputs (see
+    refinement.Clusters.move_units), from the coarsest level to the
+    HLIs. Moving the nodes of a coarse level moves many HLIs at once,
+    which moving single HLIs could not do without increasing the
+    number of inputs/outputs on the way.
+
+"""
+
+import copy
+import time
+from DFG import DFG
+from IR import HLIRProgram, LLIRProgram
+from .basic_clusterizer import initial_convertion_to_mlir, inout_count, out_of_time, \
+    contract_chains, merge_io, merge_mls, merge_parents_childs, merge_siblings
+from .refinement import Clusters
+
+# The coarsening stops when a level merges less than 1 node out of
+# COARSENING_MIN_RATIO
+COARSENING_MIN_RATIO = 10
+
+# The coarse nodes have at most s/COARSE_NODE_MAX_RATIO instructions
+# (as METIS bounds the weight of the coarse vertices), so that the
+# partitioning can still combine them
+COARSE_NODE_MAX_RATIO = 2
+
+# Maximal number of passes of the refinement of each level
+REFINEMENT_PASSES = 4
+
+
+def coarsen(dfg, config, deadline=None):
+    """Merges each node of |dfg| with its best neighbour (when their
+    merge has at most s/COARSE_NODE_MAX_RATIO instructions), and
+    returns the number of merges"""
+    max_size = config.s // COARSE_NODE_MAX_RATIO
+    visited = set()
+    merge_count = 0
+    for node in sorted(dfg.nodes, key=lambda n: dfg.ranks[n]):
+        if out_of_time(deadline):
+            break
+        if node in visited:
+            continue
+        visited.add(node)
+
+        # Candidate merges, from the best rating to the worst (and
+        # then from the smallest merged node). Only the first one is
+        # tried: when it is invalid, trying the others is expensive,
+        # and gives worse clusterizations.
+        candidates = []
+        prev_nodes = dfg.prev_nodes(node)
+        for neighbour in prev_nodes | dfg.next_nodes(node):
+            if neighbour in prev_nodes:
+                (n1, n2) = (neighbour, node)
+            else:
+                (n1, n2) = (node, neighbour)
+            if len(n1.seq.instrs) + len(n2.seq.instrs) > max_size:
+                continue
+            (score, merged_inputs, merged_outputs) = merge_io(dfg, config, n1, n2)
+            if score != -1:
+                candidates.append(((-score, len(n1.seq.instrs) + len(n2.seq.instrs),
+                                    dfg.ranks[neighbour]),
+                                   n1, n2, neighbour, merged_inputs, merged_outputs))
+        candidates.sort(key=lambda candidate: candidate[0])
+
+        for (_, n1, n2, neighbour, merged_inputs, merged_outputs) in candidates[:1]:
+            mls = merge_mls(dfg, config, n1, n2, merged_inputs, merged_outputs)
+            if mls is None:
+                continue
+            dfg.merge_nodes(n1, n2, mls, merged_inputs, merged_outputs)
+            # |neighbour| is a node of this level which has just been
+            # merged: it does not have to be visited.
+            visited.add(neighbour)
+            merge_count += 1
+            break
+
+    return merge_count
+
+
+def clusterize(hlir:HLIRProgram, config) -> LLIRProgram :
+    deadline = None
+    if config.time_budget > 0:
+        deadline = time.time() + config.time_budget
+    # merge_parents_childs is used with its worklist
+    config = copy.copy(config)
+    config.simple_clusterizer = False
+
+    # Coarsening: the nodes of each level (starting with the HLIs),
+    # and the map from each of them to its node in the next level. The
+    # first level contracts the single-consumer chains.
+    hlis = initial_convertion_to_mlir(hlir).instrs
+    mlir = contract_chains(hlir, config, deadline)
+    chain_of = { id(instr) : node for node in mlir.instrs for instr in node.seq.instrs }
+    levels = [ (hlis, { node : chain_of[id(node.seq.instrs[0])] for node in hlis }) ]
+    dfg = DFG(mlir, False)
+    nodes = list(dfg.nodes)
+    if config.stats:
+        print(f"  Level 1: {len(dfg.nodes)} MLMIs, {inout_count(dfg)} inputs/outputs")
+    while not out_of_time(deadline):
+        merge_count = coarsen(dfg, config, deadline)
+        if merge_count == 0:
+            break
+        levels.append((nodes, { node : dfg.merged_node(node) for node in nodes }))
+        nodes = list(dfg.nodes)
+        if config.stats:
+            print(f"  Level {len(levels)}: {len(dfg.nodes)} MLMIs, {inout_count(dfg)} inputs/outputs")
+        if merge_count * COARSENING_MIN_RATIO < len(dfg.nodes):
+            break
+
+    # Partitioning of the coarsest DFG
+    merge_parents_childs(dfg, config, deadline)
+    merge_siblings(dfg, config, deadline)
+    if config.stats:
+        print(f"  Partitioned: {len(dfg.nodes)} MLMIs, {inout_count(dfg)} inputs/outputs")
+    clusters = Clusters(dfg)
+    part_of = { node : idx for idx, node in enumerate(clusters.nodes) }
+    # Index of the part of each node of the current level, updated by
+    # the moves of the refinement
+    parts = [ part_of[dfg.merged_node(node)] for node in nodes ]
+
+    # Uncoarsening
+    level = len(levels)
+    while True:
+        clusters.move_units(config, [ node.seq.instrs for node in nodes ], parts,
+                            REFINEMENT_PASSES, deadline)
+        if config.stats:
+            print(f"  Refined level {level}: {clusters.mlmi_count()} MLMIs, "
+                  f"{clusters.inout_count()} inputs/outputs")
+        if level == 0:
+            break
+        # Projection of the parts on the finer level
+        level -= 1
+        (finer_nodes, coarse_of) = levels[level]
+        index = { node : u for u, node in enumerate(nodes) }
+        parts = [ parts[index[coarse_of[node]]] for node in finer_nodes ]
+        nodes = finer_nodes
+
+    dfg = clusters.to_dfg()
+    dfg.resolve_merges()
+
+    return dfg
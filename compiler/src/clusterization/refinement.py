@@ -0,0 +1,246 @@
+"""Local-search refinement of a clusterization
+
+The clusterizers only merge MLMIs, and never undo a merge, so an HLI
+can end up in an MLMI when it would need fewer inputs/outputs in a
+neighbouring one. For instance, if the MLMI A computes
+
+    x = a + b
+    y = x * c
+
+and the MLMI B computes z = y ^ x (and nothing else uses x or y),
+moving "y = x * c" to B removes the output y of A and the input y of
+B, but adds c as an input of B: this lowers the number of
+inputs/outputs if c was already an input of B, and increases it
+otherwise.
+
+In the style of the Fiduccia-Mattheyses heuristic, each pass visits
+the HLIs on the boundary of the MLMIs, and moves each of them (at most
+once per pass) to a parent or a child of its MLMI when this lowers the
+total number of inputs/outputs and the two MLMIs respect the
+constraints (l_in, l_out, s and the register count).
+
+The MLMIs are kept in a topological order of the DFG (given by the
+ranks of the DFG), and a move is only done if the edges of the DFG
+still go from an MLMI to a later one, so that the DFG stays acyclic.
+This allows two moves for an HLI h of the MLMI A:
+
+  - to the front of the first MLMI B (after A) using the result of h,
+    if A does not use it, and no MLMI between A and B uses it either;
+
+  - to the end of the last MLMI B (before A) defining an operand of
+    h, if A does not define any operand of h.
+
+The same moves apply to a group of HLIs of A (a unit) rather than a
+single HLI, with the uses and operands of the HLIs of the unit that
+are not in the unit. The multilevel clusterizer moves the nodes of
+each level of its coarsening this way.
+
+"""
+
+from collections import defaultdict
+from lowering.reg_alloc import LinearScanAllocator
+from DFG import DFG
+from IR import MLS, MLMI, MLIRProgram
+from .basic_clusterizer import out_of_time
+from .merge_stats import count_call, reject, timed
+
+
+class Clusters:
+    """The MLMIs of a DFG, as lists of HLIs (the clusters), in a
+    topological order of the DFG, and the HLIs that can be moved
+    between them"""
+
+    def __init__(self, dfg):
+        self.dfg = dfg
+        self.prog_outputs = set(dfg.prog_outputs)
+        self.nodes    = sorted(dfg.nodes, key=lambda n: dfg.ranks[n])
+        self.clusters = [ list(node.seq.instrs) for node in self.nodes ]
+        self.inputs   = [ set(node.inputs) for node in self.nodes ]
+        self.outputs  = [ set(node.outputs) for node in self.nodes ]
+        self.changed  = [ False for _ in self.nodes ]
+        # Cluster defining each variable, and number of HLIs using
+        # each variable in each cluster
+        self.defined_in = dict()
+        self.uses = defaultdict(lambda: defaultdict(int))
+        for idx, instrs in enumerate(self.clusters):
+            for instr in instrs:
+                self.defined_in[instr.dst] = idx
+                for src in set(instr.mem_inputs()):
+                    self.uses[src][idx] += 1
+
+    def mlmi_count(self):
+        return sum(1 for instrs in self.clusters if len(instrs) != 0)
+
+    def inout_count(self):
+        return sum(len(inputs) + len(outputs)
+                   for inputs, outputs in zip(self.inputs, self.outputs))
+
+    def update_uses(self, instr, old_idx, new_idx):
+        for src in set(instr.mem_inputs()):
+            src_uses = self.uses[src]
+            src_uses[old_idx] -= 1
+            if src_uses[old_idx] == 0:
+                del src_uses[old_idx]
+            src_uses[new_idx] += 1
+
+    def compute_io(self, idx, instrs):
+        defs = { instr.dst for instr in instrs }
+        instr_inputs = { src for instr in instrs for src in instr.mem_inputs()
+                         if src not in defs }
+        instr_outputs = { dst for dst in defs
+                          if dst in self.prog_outputs or
+                          any(user != idx for user in self.uses[dst]) }
+        return (instr_inputs, instr_outputs)
+
+    @staticmethod
+    def is_valid(config, instrs, instr_inputs, instr_outputs):
+        if len(instrs) == 0:
+            return True
+        if len(instrs) > config.s:
+            reject("move_hlis", "s")
+            return False
+        if len(instr_inputs) > config.l_in:
+            reject("move_hlis", "l_in")
+            return False
+        if len(instr_outputs) > config.l_out:
+            reject("move_hlis", "l_out")
+            return False
+        if not timed("registers", LinearScanAllocator().needs_leq_k_registers,
+                     instrs, list(instr_inputs), list(instr_outputs),
+                     config.r, config.l_out):
+            reject("move_hlis", "registers")
+            return False
+        return True
+
+    def try_move(self, config, unit, old_idx, new_idx):
+        """Moves the HLIs of |unit| from the cluster |old_idx| to the
+        cluster |new_idx| if this lowers the number of inputs/outputs,
+        and returns True if they were moved"""
+        count_call("move_hlis")
+        old_instrs = [ i for i in self.clusters[old_idx] if id(i) not in unit ]
+        moved_instrs = [ i for i in self.clusters[old_idx] if id(i) in unit ]
+        if new_idx > old_idx:
+            new_instrs = moved_instrs + self.clusters[new_idx]
+        else:
+            new_instrs = self.clusters[new_idx] + moved_instrs
+        for instr in moved_instrs:
+            self.update_uses(instr, old_idx, new_idx)
+        (old_inputs, old_outputs) = self.compute_io(old_idx, old_instrs)
+        (new_inputs, new_outputs) = self.compute_io(new_idx, new_instrs)
+        gain = len(self.inputs[old_idx]) + len(self.outputs[old_idx]) + \
+            len(self.inputs[new_idx]) + len(self.outputs[new_idx]) - \
+            len(old_inputs) - len(old_outputs) - len(new_inputs) - len(new_outputs)
+        if gain <= 0:
+            reject("move_hlis", "gain")
+            valid = False
+        else:
+            valid = self.is_valid(config, new_instrs, new_inputs, new_outputs) and \
+                self.is_valid(config, old_instrs, old_inputs, old_outputs)
+        if not valid:
+            for instr in moved_instrs:
+                self.update_uses(instr, new_idx, old_idx)
+            return False
+
+        self.clusters[old_idx] = old_instrs
+        self.inputs[old_idx], self.outputs[old_idx] = old_inputs, old_outputs
+        self.clusters[new_idx] = new_instrs
+        self.inputs[new_idx], self.outputs[new_idx] = new_inputs, new_outputs
+        self.changed[old_idx] = self.changed[new_idx] = True
+        for instr in moved_instrs:
+            self.defined_in[instr.dst] = new_idx
+        return True
+
+    def move_units(self, config, units, unit_clusters, max_passes, deadline=None):
+        """Moves units between neighbouring clusters when this lowers
+        the number of inputs/outputs (with at most |max_passes|
+        passes, until |deadline|), and returns the number of moves.
+
+        |units| is a list of lists of HLIs (for instance, the HLIs of
+        the nodes of a coarser DFG), and |unit_clusters| gives the
+        index of the cluster of each unit, and is updated by the
+        moves. Each pass visits the units in the order of their
+        clusters, and of their first HLI in their cluster.
+
+        """
+        unit_ids = [ { id(instr) for instr in instrs } for instrs in units ]
+        move_count = 0
+        for _ in range(max_passes):
+            positions = { id(instr) : pos for instrs in self.clusters
+                          for pos, instr in enumerate(instrs) }
+            order = sorted(range(len(units)), key=lambda u:
+                           (unit_clusters[u], min(positions[i] for i in unit_ids[u])))
+
+            moved = 0
+            for u in order:
+                if out_of_time(deadline):
+                    break
+                idx = unit_clusters[u]
+                dsts = { instr.dst for instr in units[u] }
+                # Uses of the results of the unit inside the unit
+                unit_uses = defaultdict(int)
+                for instr in units[u]:
+                    for src in set(instr.mem_inputs()):
+                        if src in dsts:
+                            unit_uses[src] += 1
+                # Moving the unit to the first cluster using its
+                # results (if the rest of its cluster does not)
+                users = set()
+                used_in_cluster = False
+                for dst in dsts:
+                    for user, count in self.uses[dst].items():
+                        if user != idx:
+                            users.add(user)
+                        elif count > unit_uses[dst]:
+                            used_in_cluster = True
+                if len(users) != 0 and not used_in_cluster:
+                    first_user = min(users)
+                    if self.try_move(config, unit_ids[u], idx, first_user):
+                        unit_clusters[u] = first_user
+                        moved += 1
+                        continue
+                # Moving the unit to the last cluster defining one of
+                # its operands (if the rest of its cluster does not
+                # define any)
+                srcs_defined_in = { self.defined_in[src] for instr in units[u]
+                                    for src in instr.mem_inputs()
+                                    if src not in dsts and src in self.defined_in }
+                if len(srcs_defined_in) != 0 and idx not in srcs_defined_in:
+                    last_def = max(srcs_defined_in)
+                    if self.try_move(config, unit_ids[u], idx, last_def):
+                        unit_clusters[u] = last_def
+                        moved += 1
+            move_count += moved
+            if moved == 0 or out_of_time(deadline):
+                break
+        return move_count
+
+    def to_dfg(self):
+        """Returns the DFG of the clusters (the initial one if no HLI
+        was moved)"""
+        if not any(self.changed):
+            return self.dfg
+        mlmis = []
+        for idx, node in enumerate(self.nodes):
+            if not self.changed[idx]:
+                mlmis.append(node)
+            elif len(self.clusters[idx]) != 0:
+                mlmis.append(MLMI(MLS(self.clusters[idx]), list(self.inputs[idx]),
+                                  list(self.outputs[idx])))
+        dfg = self.dfg
+        return DFG(MLIRProgram(mlmis, dfg.prog.inputs, dfg.prog_outputs,
+                               dfg.memory_count), False)
+
+
+def move_hlis(dfg, config, max_passes, deadline=None):
+    """Moves HLIs between neighbouring MLMIs of |dfg| when this lowers
+    the number of inputs/outputs (with at most |max_passes| passes,
+    until |deadline|), and returns the resulting DFG"""
+    clusters = Clusters(dfg)
+    units = []
+    unit_clusters = []
+    for idx, instrs in enumerate(clusters.clusters):
+        for instr in instrs:
+            units.append([ instr ])
+            unit_clusters.append(idx)
+    clusters.move_units(config, units, unit_clusters, max_passes, deadline)
+    return clusters.to_dfg()
@@ -1,4 +1,8 @@
 # Hardcode keys
 
 shared_key = bytes.fromhex("03030303030303030303030303030303")
-pubkey = bytes.fromhex("C48246245F2E8D456F141D074A3A9712590D54A444049CE9BACB59D0DDC47662")
\ No newline at end of file
+pubkey = bytes.fromhex("C48246245F2E8D456F141D074A3A9712590D54A444049CE9BACB59D0DDC47662")
+
+# Keys of the secure element (see runtime/SEalgo.c), for the simulator
+prvkey = bytes.fromhex("2DC8720FD4964E38749222AAF5006BC8AF6D4CC67885B008318380C9C01479B0")
+seckey = bytes.fromhex("02020202020202020202020202020202")
@@ -1,8 +1,11 @@
+import struct
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from operator import attrgetter
 from enum import Enum
-from typing import Final
 from math import ceil, log2
 from IR import Opcode, ImmOperand, RegOperand, LLI, LLIRProgram
-from schwaemm import schwaemm128128_encrypt
+from schwaemm import schwaemm128128_encrypt_batch
 from pysodium import crypto_box_seal
 from .keys import shared_key, pubkey
 
@@ -40,51 +43,59 @@ class OperandCode(Enum):
     def __str__(self):
         return self.name
 
-NUL_FLAG = '00'
-REG_FLAG = '01'
-IMM_FLAG = '10'
+# Length of the authentication tag of SCHWAEMM
+TAG_BYTES = 16
 
+# Number of LLMIs whose LLSs are encrypted with a single call to
+# schwaemm128128_encrypt_batch (and encoded by a single worker with
+# -jobs)
+ENCRYPTION_CHUNK_SIZE = 1024
 
-class ID:
-    def __init__(self, instrID: int, outputID: int):
-        self.instrID  : Final = instrID
-        self.outputID : Final = outputID
-
-    def __str__(self):
-        return f"(InstrID, OutputID) = ({self.instrID}, {self.outputID})"
-
-
-def create_opdict():
-    """count = 16, each opcode is represented by 4 bits"""
-    assert len(Opcode) <= 16
-    opdict = {}
-    for x in Opcode:
-        b = bin(x.value)[2:]
-        opdict[x.name] = '0'*(4-len(b)) + b
-    return opdict
-
-def create_operanddict():
-    """count = 14, each code is represented by 4 bits"""
-    operanddict = {}
-    for x in OperandCode:
-        b = bin(x.value)[2:]
-        operanddict[x.name] = '0'*(4-len(b)) + b
-    return operanddict
-
-def create_memdict(count: int, bytelen: int):
-    memdict = {}
-    for i in range(count):
-        memdict[i] = (i).to_bytes(bytelen, byteorder='big')
-    return memdict
 
 def uint_tobytes(n: int, bytelen: int):
     return (n).to_bytes(bytelen, byteorder='big')
 
-def bin_tobytes(bitstr: str):
-    bitlen = len(bitstr)
-    assert bitlen % 8 == 0
-    n = int(bitstr, 2)
-    return (n).to_bytes(bitlen//8, byteorder='big')
+# struct formats for the big-endian unsigned integers of the bytecode
+# (3-byte integers have no struct format and are packed one by one)
+UINT_FORMATS = { 1: 'B', 2: 'H', 4: 'I', 8: 'Q' }
+
+def uints_tobytes(values, bytelen: int):
+    """Packs |values| as consecutive big-endian integers of |bytelen| bytes"""
+    fmt = UINT_FORMATS.get(bytelen)
+    if fmt is not None:
+        return struct.pack(f'>{len(values)}{fmt}', *values)
+    return b''.join([ (n).to_bytes(bytelen, byteorder='big') for n in values ])
+
+def varint_tobytes(n: int):
+    """Encodes |n| >= 0 as an unsigned LEB128 varint (version 1)"""
+    if n < 0x80:
+        return bytes((n,))
+    varint = bytearray()
+    while n >= 0x80:
+        varint.append((n & 0x7F) | 0x80)
+        n >>= 7
+    varint.append(n)
+    return bytes(varint)
+
+def varints_tobytes(values):
+    return b''.join([ varint_tobytes(n) for n in values ])
+
+def deltas_tobytes(values):
+    """Encodes |values| as the zigzag varints of their successive
+    differences, the first one being relative to 0 (version 1)"""
+    zigzags = []
+    prev = 0
+    for n in values:
+        delta = n - prev
+        zigzags.append(2*delta if delta >= 0 else -2*delta - 1)
+        prev = n
+    return varints_tobytes(zigzags)
+
+def encode_ID(instrID: int, outputID: int, lb_o: int):
+    """Encodes the (InstrID, OutputID) of a memory cell, as it is written
+    in the inputIDs of the LLMIs that use this cell"""
+    return (instrID).to_bytes(4, byteorder='big') + \
+        (outputID).to_bytes(lb_o, byteorder='big')
 
 def serialize_metadata(config):
     meta_bytecode = bytes()
@@ -104,72 +115,341 @@ def serialize_metadata(config):
 
     return meta_bytecode
 
-def serialize_lls(lls, regdict: dict, opdict: dict, operanddict: dict, config):
-    lls_bytecode = bytes()
-
-    for lli in lls:
-        if lli.is_nop():
-            lli_code = opdict[Opcode.NOP.value] + NUL_FLAG + NUL_FLAG
-            lls_bytecode += lli_code
-            continue
-
-        # opcode (4)
-        op_code = opdict[lli.opcode.name]
-        flag = ''
-
-        # dst (lb_r)
-        dst_code = regdict[lli.dst.r]
-
-        # src1 (lb_r or word_size)
-        src1_code = bytes()
-        if isinstance(lli.src1, RegOperand):
-            flag += 'R'
-            src1_code += regdict[lli.src1.r]
-        elif isinstance(lli.src1, ImmOperand):
-            flag += 'I'
-            src1_code += uint_tobytes(lli.src1.imm, config.word_size // 8)
-        else:
-            raise ValueError('Invalid Operand.')
-
-        # src2 (0 or lb_r or word_size)
-        src2_code = bytes()
-        if lli.src2 is None:
-            flag += 'N'
-            # src2_code is skipped
-        elif isinstance(lli.src2, RegOperand):
-            flag += 'R'
-            src2_code += regdict[lli.src2.r]
-        elif isinstance(lli.src2, ImmOperand):
-            flag += 'I'
-            src2_code += uint_tobytes(lli.src2.imm, config.word_size // 8)
+def create_lli_table(lb_r: int, word_size: int):
+    """Returns the encoders of the LLIs, indexed by (Opcode, type(src1),
+    type(src2), type(src3)), for registers of |lb_r| bytes and
+    immediates of |word_size| bits
+
+    Each encoder is a pair (pack, operands): operands(lli) returns the
+    register numbers and immediates of the LLI, and pack(*operands(lli))
+    returns its bytecode, starting with its header: the opcode (4 bits)
+    followed by its OperandCode (4 bits).
+
+    """
+    kinds = { 'R': (RegOperand, 'r', lb_r),
+              'I': (ImmOperand, 'imm', word_size // 8),
+              'N': (type(None), None, 0) }
+    lli_table = dict()
+    for code in OperandCode:
+        types = tuple([ kinds[k][0] for k in code.name ])
+        attrs = [ 'dst.r' ] + [ f'{src}.{kinds[k][1]}' for (src, k)
+                                in zip(('src1', 'src2', 'src3'), code.name)
+                                if k != 'N' ]
+        widths = [ lb_r ] + [ kinds[k][2] for k in code.name if k != 'N' ]
+        fmts = [ UINT_FORMATS.get(width) for width in widths ]
+        if None not in fmts:
+            pack_operands = struct.Struct('>B' + ''.join(fmts)).pack
         else:
-            raise ValueError('Invalid Operand.')
-
-        # src3 (0 or lb_r or word_size)
-        src3_code = bytes()
-        if lli.src3 is None:
-            flag += 'N'
-        elif isinstance(lli.src3, RegOperand):
-            flag += 'R'
-            src3_code += regdict[lli.src3.r]
-        elif isinstance(lli.src3, ImmOperand):
-            flag += 'I'
-            src3_code += uint_tobytes(lli.src3.imm, config.word_size // 8)
+            pack_operands = lambda header, *values, widths=widths: \
+                bytes([header]) + b''.join([ uint_tobytes(value, width)
+                                             for (value, width)
+                                             in zip(values, widths) ])
+        # src1 is never null, so operands(lli) is always a tuple
+        operands = attrgetter(*attrs)
+        for opcode in Opcode:
+            if opcode == Opcode.NOP:
+                continue
+            header = (opcode.value << 4) | code.value
+            lli_table[(opcode,) + types] = (partial(pack_operands, header),
+                                            operands)
+    return lli_table
+
+# Header of NOP, which has no operands
+NOP_HEADER = Opcode.NOP.value << 4
+
+def pack_llmi_chunk(chunk):
+    """Encrypts the LLSs of a chunk of LLMI records and returns the
+    bytecode of the records, along with the size of each record
+
+    |chunk| is a list of (fields, (msg, ad, nonce)), where |fields| are
+    the encoded fields of the record that come before the LLS,
+    and (msg, ad, nonce) are the arguments of the encryption of the
+    LLS. All the LLSs of the chunk are encrypted with a single call
+    to the SCHWAEMM extension, and the records are packed into a
+    single preallocated buffer.
+
+    """
+    ciphertexts = bytearray(sum([ len(msg) + TAG_BYTES
+                                  for _, (msg, _, _) in chunk ]))
+    schwaemm128128_encrypt_batch([ lls for _, lls in chunk ],
+                                 ciphertexts, shared_key)
+
+    chunk_code = bytearray(len(ciphertexts) +
+                           sum([ len(field) for fields, _ in chunk
+                                 for field in fields ]))
+    record_sizes = []
+    view = memoryview(chunk_code)
+    ciphertexts_view = memoryview(ciphertexts)
+    offset = 0
+    ct_offset = 0
+    for (fields, (msg, _, _)) in chunk:
+        record_start = offset
+        for field in fields:
+            view[offset:offset+len(field)] = field
+            offset += len(field)
+        # LLS
+        lls_bytelen = len(msg) + TAG_BYTES
+        view[offset:offset+lls_bytelen] = \
+            ciphertexts_view[ct_offset:ct_offset+lls_bytelen]
+        offset += lls_bytelen
+        ct_offset += lls_bytelen
+        record_sizes.append(offset - record_start)
+
+    return chunk_code, record_sizes
+
+class LLMIEncoder:
+    """Encodes and encrypts chunks of LLMI records
+
+    The encoder only holds the byte lengths and the LLI table of the
+    program (see create_lli_table), so that it can be sent once to the
+    worker processes of a parallel serialization (see serialize).
+
+    """
+    def __init__(self, version: int, word_size: int, lb_m: int, lb_r: int):
+        self.version = version
+        self.word_size = word_size
+        self.lb_m = lb_m
+        self.lb_r = lb_r
+        self.lli_table = create_lli_table(lb_r, word_size)
+
+    def __getstate__(self):
+        # The LLI table holds lambdas, and is rebuilt by __setstate__
+        return (self.version, self.word_size, self.lb_m, self.lb_r)
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+    def encode_lls(self, lls):
+        """Returns the (clear) bytecode of the LLIs of |lls|"""
+        lls_bytecode = bytearray()
+        lli_table = self.lli_table
+        for lli in lls:
+            if lli.opcode == Opcode.NOP:
+                lls_bytecode.append(NOP_HEADER)
+                continue
+            try:
+                pack, operands = lli_table[(lli.opcode, type(lli.src1),
+                                            type(lli.src2), type(lli.src3))]
+            except KeyError:
+                raise ValueError('Invalid Operand.')
+            lls_bytecode += pack(*operands(lli))
+        return lls_bytecode
+
+    def encode_chunk(self, first_instrID: int, llmis, reveal_flags, inputIDs):
+        """Returns the bytecode of the LLMI records of |llmis| (and the
+        size of each record, see pack_llmi_chunk)
+
+        |first_instrID| is the InstrID of llmis[0], and |reveal_flags| and
+        |inputIDs| hold the RevealFlag and the encoded inputIDs of each
+        LLMI of |llmis| (see assign_IDs).
+
+        """
+        lb_m = self.lb_m
+        chunk = []
+        for (i, llmi) in enumerate(llmis):
+            instrID = first_instrID + i
+            inputIDs_ad_bstr, inputIDs_bstr = inputIDs[i]
+            inputs  = [ inp.m for inp in llmi.inputs ]
+            outputs = [ out.m for out in llmi.outputs ]
+
+            # LLS (encrypted later, together with the rest of the chunk)
+            msg   = self.encode_lls(llmi.seq.instrs)
+            ad    = b''.join((struct.pack('>IB', instrID, reveal_flags[i]),
+                              uint_tobytes(len(inputs), lb_m),
+                              inputIDs_ad_bstr,
+                              uint_tobytes(len(outputs), lb_m)))
+            nonce = uint_tobytes(instrID, 32)
+
+            if self.version == 0:
+                fields = (
+                    # input_count (lb_m)
+                    uint_tobytes(len(inputs), lb_m),
+                    # inputs (lb_m * input_count)
+                    uints_tobytes(inputs, lb_m),
+                    # output_count (lb_m)
+                    uint_tobytes(len(outputs), lb_m),
+                    # outputs (lb_m * output_count)
+                    uints_tobytes(outputs, lb_m),
+                    # InstrID (32) and RevealFlag (8)
+                    struct.pack('>IB', instrID, reveal_flags[i]),
+                    # inputIDs ((lb_o + 32)*input_count)
+                    inputIDs_bstr,
+                    # LLS_bytelen (32)
+                    uint_tobytes(len(msg) + TAG_BYTES, 4))
+            else:
+                fields = (
+                    # input_count (varint)
+                    varint_tobytes(len(inputs)),
+                    # inputs (deltas)
+                    deltas_tobytes(inputs),
+                    # output_count (varint)
+                    varint_tobytes(len(outputs)),
+                    # outputs (deltas)
+                    deltas_tobytes(outputs),
+                    # RevealFlag (8)
+                    bytes([reveal_flags[i]]),
+                    # inputIDs (2 varints per input)
+                    inputIDs_bstr,
+                    # LLS_bytelen (varint)
+                    varint_tobytes(len(msg) + TAG_BYTES))
+            chunk.append((fields, (msg, ad, nonce)))
+
+        return pack_llmi_chunk(chunk)
+
+# State of the current worker process of a parallel serialization:
+# the encoder and the arguments of LLMIEncoder.encode_chunk for the
+# whole program, which the workers receive once when they start
+# (without being copied when the workers are forked)
+worker_encoder = None
+worker_program = None
+
+def init_worker(encoder: LLMIEncoder, llmis, reveal_flags, inputIDs):
+    global worker_encoder, worker_program
+    worker_encoder = encoder
+    worker_program = (llmis, reveal_flags, inputIDs)
+
+def encode_chunk_in_worker(args):
+    """Encodes the LLMIs of indices [start, end) of the program"""
+    first_instrID, start, end = args
+    llmis, reveal_flags, inputIDs = worker_program
+    return worker_encoder.encode_chunk(first_instrID + start,
+                                       llmis[start:end],
+                                       reveal_flags[start:end],
+                                       inputIDs[start:end])
+
+def assign_IDs(ir: LLIRProgram, l_out: int, lb_o: int, version: int):
+    """Computes the RevealFlag and the encoded inputIDs of every LLMI of |ir|
+
+    The (InstrID, OutputID) of a memory cell is the one of the last
+    LLMI (or program input) that wrote it, so this pass has to go
+    through the program in order; it is cheap compared to the
+    encoding and the encryption of the LLMIs, which can then be done
+    independently for each LLMI.
+
+    The inputIDs of an LLMI are returned twice: as they are
+    authenticated with its LLS (the inputIDs of version 0), and as
+    they are written in its record (see serialize).
+
+    """
+    outputs = set(ir.outputs)
+    id_dict = dict() # dict of encoded (InstrID, OutputID)
+    id_pairs = dict() # dict of (InstrID, OutputID), for version 1
+    for (idx, inp) in enumerate(ir.inputs):
+        instrID  = idx//l_out + 1
+        outputID = idx % l_out
+        id_dict[inp.m] = encode_ID(instrID, outputID, lb_o)
+        id_pairs[inp.m] = (instrID, outputID)
+
+    reveal_flags = []
+    inputIDs = []
+    first_instrID = len(ir.inputs)//l_out + 2
+    for (i, llmi) in enumerate(ir.instrs):
+        instrID = first_instrID + i
+
+        reveal_flag = 0
+        for out in llmi.outputs:
+            if out in outputs:
+                reveal_flag = 1
+                break
+        reveal_flags.append(reveal_flag)
+
+        inputIDs_bstr = b''.join([ id_dict[inp.m] for inp in llmi.inputs ])
+        if version == 0:
+            inputIDs.append((inputIDs_bstr, inputIDs_bstr))
         else:
-            raise ValueError('Invalid Operand.')
+            # Each InstrID is written as its distance to |instrID|
+            pairs = [ id_pairs[inp.m] for inp in llmi.inputs ]
+            inputIDs.append((inputIDs_bstr,
+                             varints_tobytes([ n for (inpID, outputID) in pairs
+                                               for n in (instrID - inpID,
+                                                         outputID) ])))
+            for (outputID, out) in enumerate(llmi.outputs):
+                id_pairs[out.m] = (instrID, outputID)
+        for (outputID, out) in enumerate(llmi.outputs):
+            id_dict[out.m] = encode_ID(instrID, outputID, lb_o)
 
-        flag_code = operanddict[flag]
-        opfl_code = bin_tobytes(op_code + flag_code)
-        lli_code = opfl_code + dst_code + src1_code + src2_code + src3_code
-        lls_bytecode += lli_code
+    return first_instrID, reveal_flags, inputIDs
 
-    return lls_bytecode
+def write_llmi_records(chunks, llmi_count, config):
+    """Writes the encoded |chunks| of the |llmi_count| LLMI records to
+    |config.outfile|
+
+    In version 1, the records are preceded by the offset of each
+    record from the start of the first one (32 bits each), so that a
+    record can be found without parsing the previous ones. The chunks
+    are written as soon as they are encoded, after room for the
+    offsets, which are written once all the sizes are known. If the
+    output file cannot seek (eg, a pipe), the chunks are kept in
+    memory until then instead.
+
+    """
+    outfile = config.outfile
+    if config.version == 0:
+        for (chunk_code, _) in chunks:
+            outfile.write(chunk_code)
+        return
+
+    if not outfile.seekable():
+        chunks = list(chunks)
+        offsets_pos = None
+    else:
+        # LLMI offsets (32 * LLMI_count), patched below
+        offsets_pos = outfile.tell()
+        outfile.write(bytes(4 * llmi_count))
+    offsets = []
+    offset = 0
+    for (chunk_code, record_sizes) in chunks:
+        if offsets_pos is not None:
+            outfile.write(chunk_code)
+        for size in record_sizes:
+            offsets.append(offset)
+            offset += size
+    assert len(offsets) == llmi_count
+
+    if offsets_pos is None:
+        # LLMI offsets (32 * LLMI_count)
+        outfile.write(uints_tobytes(offsets, 4))
+        for (chunk_code, _) in chunks:
+            outfile.write(chunk_code)
+    else:
+        end_pos = outfile.tell()
+        outfile.seek(offsets_pos)
+        outfile.write(uints_tobytes(offsets, 4))
+        outfile.seek(end_pos)
 
 def serialize(ir:LLIRProgram, config):
-    outputs = set(ir.outputs)
+    """Writes the bytecode of |ir| to |config.outfile|
+
+    The header of the program is written first. The IDs of the LLMIs
+    are then computed in a single pass (see assign_IDs), and the LLMI
+    records are encoded and written by chunks of
+    ENCRYPTION_CHUNK_SIZE records. With |config.jobs| > 1, the chunks
+    are encoded by a pool of |config.jobs| processes, and written in
+    the order of the program, so that the bytecode is the same as
+    with a single job.
+
+    Version 1 of the bytecode is a compact version of version 0:
+      - after input_count (which is part of the header of the
+        program), counts are varints, and lists of memory cells are
+        zigzag varints of the differences between successive cells;
+      - LLMI_count is aligned on 32 bits, and is followed by the
+        offsets of the LLMI records (see write_llmi_records);
+      - the InstrID of an LLMI is not written (it is given by its
+        index), and its inputIDs are written as the varints of the
+        distance to the InstrID of the LLMI and of the OutputID.
+    The LLSs are encrypted with the same associated data as in
+    version 0.
+
+    Version 2 is version 1 with the layers of the program (see
+    LLIRProgram) after LLMI_count: the number of layers, and then the
+    number of LLMIs of each layer (32 bits each). The LLMIs of a layer
+    are independent, so that the interpreter can run them
+    concurrently.
+
+    """
     l_out = config.l_out
 
-    bytecode = bytes()
+    bytecode = bytearray()
     # bytelen
     lb_o = ((ceil(log2(l_out)) + 7) & (-8)) // 8             # for 1 outputID
     lb_m = ((ceil(log2(ir.memory_count)) + 7) & (-8)) // 8   # for 1 memory cell
@@ -180,7 +460,6 @@ def serialize(ir:LLIRProgram, config):
 
     # memory_count (32)
     bytecode += uint_tobytes(ir.memory_count, 4)
-    memdict = create_memdict(ir.memory_count, lb_m)
 
     # program header (512)
     ct_sk = crypto_box_seal(shared_key, pubkey)
@@ -189,89 +468,59 @@ def serialize(ir:LLIRProgram, config):
     # input_count (lb_m)
     bytecode += uint_tobytes(len(ir.inputs), lb_m)
 
-    # inputs (lb_m * input_count)
-    id_dict = dict() # dict of (InstrID, OutputID)
-    for (idx, inp) in enumerate(ir.inputs):
-        bytecode += memdict[inp.m]
-        instrID  = idx//l_out + 1
-        outputID = idx % l_out
-        id_dict[inp.m] = ID(instrID, outputID)
-
-    # output_count (lb_m)
-    bytecode += uint_tobytes(len(ir.outputs), lb_m)
-
-    # outputs (lb_m * output_count)
-    for out in ir.outputs:
-        bytecode += memdict[out.m]
+    if config.version == 0:
+        # inputs (lb_m * input_count)
+        bytecode += uints_tobytes([ inp.m for inp in ir.inputs ], lb_m)
+        # output_count (lb_m)
+        bytecode += uint_tobytes(len(ir.outputs), lb_m)
+        # outputs (lb_m * output_count)
+        bytecode += uints_tobytes([ out.m for out in ir.outputs ], lb_m)
+    else:
+        # inputs (deltas)
+        bytecode += deltas_tobytes([ inp.m for inp in ir.inputs ])
+        # output_count (varint)
+        bytecode += varint_tobytes(len(ir.outputs))
+        # outputs (deltas)
+        bytecode += deltas_tobytes([ out.m for out in ir.outputs ])
+        # padding, so that LLMI_count and the LLMI offsets are aligned
+        bytecode += bytes(-len(bytecode) % 4)
 
     # LLMI_count (32)
     bytecode += uint_tobytes(len(ir.instrs), 4)
 
+    if config.version >= 2:
+        # Without layers, each LLMI is a layer of its own
+        layers = ir.layers if ir.layers is not None else [1] * len(ir.instrs)
+        # layer_count (32)
+        bytecode += uint_tobytes(len(layers), 4)
+        # layer sizes (32 * layer_count)
+        bytecode += uints_tobytes(layers, 4)
+
     # Flush header to output
     config.outfile.write(bytecode)
 
     # LLMI
-    opdict = create_opdict()
-    operanddict = create_operanddict()
-    regdict = create_memdict(config.r, lb_r)
-    for (i, llmi) in enumerate(ir.instrs):
-        instrID = (i+1) + (len(ir.inputs)//l_out + 1)
-
-        # input_count (lb_m)
-        input_count_bstr = uint_tobytes(len(llmi.inputs), lb_m)
-
-        # inputs (lb_m * input_count)
-        inputIDs     = [] # list of (instrID, outputID)
-        inputs_bstr  = bytes()
-        for inp in llmi.inputs:
-            inputs_bstr += memdict[inp.m]
-            inputIDs.append(id_dict[inp.m])
-
-        # output_count (lb_m)
-        output_count_bstr = uint_tobytes(len(llmi.outputs), lb_m)
-
-        # outputs (lb_m * output_count)
-        outputs_bstr = bytes()
-        for (outputID, out) in enumerate(llmi.outputs):
-            outputs_bstr  += memdict[out.m]
-            id_dict[out.m] = ID(instrID, outputID)
-
-        # InstrID (32)
-        instrID_bstr = uint_tobytes(instrID, 4)
-
-        # RevealFlag (8)
-        reveal_flag = 1 if [ True for out in llmi.outputs
-                             if out in outputs ] != [] else 0
-        rflag_bitstr = bin(reveal_flag)[2:]
-        rflag_bitstr = (8-len(rflag_bitstr))*'0' + rflag_bitstr
-        rflag_bstr = bin_tobytes(rflag_bitstr)
-
-        # inputIDs ((lb_o + 32)*input_count)
-        inputIDs_bstr = bytes()
-        for id in inputIDs:
-            inputIDs_bstr += uint_tobytes(id.instrID, 4)
-            inputIDs_bstr += uint_tobytes(id.outputID, lb_o)
-
-        # LLS
-        lls_code_bstr = serialize_lls(llmi.seq.instrs, \
-                                      regdict, \
-                                      opdict, \
-                                      operanddict, \
-                                      config)
-        msg   = lls_code_bstr
-        ad    = (instrID_bstr + rflag_bstr + \
-                    input_count_bstr + inputIDs_bstr + output_count_bstr)
-        nonce = uint_tobytes(instrID, 32)
-        lls_code_bstr  = schwaemm128128_encrypt(msg, ad, nonce, shared_key)
-
-        # LLS_bytelen (32)
-        lls_bytelen_bstr = uint_tobytes(len(lls_code_bstr), 4)
-
-        llmi_code = input_count_bstr  + inputs_bstr       \
-                  + output_count_bstr + outputs_bstr      \
-                  + instrID_bstr                          \
-                  + rflag_bstr                            \
-                  + inputIDs_bstr                         \
-                  + lls_bytelen_bstr  + lls_code_bstr
-
-        config.outfile.write(llmi_code)
+    first_instrID, reveal_flags, inputIDs = assign_IDs(ir, l_out, lb_o,
+                                                       config.version)
+    encoder = LLMIEncoder(config.version, config.word_size, lb_m, lb_r)
+    bounds = [ (i, min(i + ENCRYPTION_CHUNK_SIZE, len(ir.instrs)))
+               for i in range(0, len(ir.instrs), ENCRYPTION_CHUNK_SIZE) ]
+
+    if config.jobs <= 1:
+        write_llmi_records(( encoder.encode_chunk(first_instrID + start,
+                                                  ir.instrs[start:end],
+                                                  reveal_flags[start:end],
+                                                  inputIDs[start:end])
+                             for (start, end) in bounds ),
+                           len(ir.instrs), config)
+        return
+
+    with ProcessPoolExecutor(max_workers=config.jobs,
+                             initializer=init_worker,
+                             initargs=(encoder, ir.instrs,
+                                       reveal_flags, inputIDs)) as executor:
+        # map returns the results in the order of |bounds|
+        write_llmi_records(executor.map(encode_chunk_in_worker,
+                                        [ (first_instrID, start, end)
+                                          for (start, end) in bounds ]),
+                           len(ir.instrs), config)
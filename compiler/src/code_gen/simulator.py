@@ -0,0 +1,519 @@
+"""Simulator of the interpreter and of the secure element, in Python
+
+Executes the bytecode written by the serializer (any version) as the
+interpreter of runtime/interpreter.c does, with a secure element
+mirroring SEstart, SEinput and SEeval of runtime/SEalgo.c, so that
+compiled programs can be executed without building the runtime:
+
+  - interpret(bytecode, inputs) executes the program on a single
+    input vector, with the same protocol (and thus the same encrypted
+    words) as the interpreter;
+
+  - interpret_batch(bytecode, input_vectors) executes the program on
+    many input vectors at once: each LLS is decrypted and decoded
+    once, and its instructions are evaluated on NumPy arrays holding
+    one word per input vector. The words are not encrypted: instead,
+    the inputIDs of each LLMI are checked against the IDs of the words
+    it reads, which is what the decryption of these words authenticates
+    in the secure element.
+
+Run from compiler/src with:
+    python3 -m code_gen.simulator --inputs 111,222,333 bytecode.bin
+    python3 -m code_gen.simulator --inputs-file inputs.txt bytecode.bin
+
+"""
+import argparse
+import sys
+from math import ceil, log2
+import numpy as np
+from pysodium import crypto_box_seal_open
+from schwaemm import schwaemm128128_encrypt, schwaemm128128_decrypt, \
+    esch256_hash
+from IR import Opcode
+import evaluator
+from evaluator import WORD_DTYPES
+from .serializer import OperandCode, TAG_BYTES, uint_tobytes
+from .keys import pubkey, prvkey, seckey
+
+# Latest bytecode version supported (VERSION in runtime/SEconfig.h)
+VERSION = 2
+
+# Lengths of runtime/crypto_len.h
+HASH_BYTES = 32
+NONCE_BYTES = 32
+CT_SEPUB_BYTES = 64
+SHAREDKEY_BYTES = 16
+
+
+
+class SimulatorError(Exception):
+    """An error of the interpreter or of the secure element (see
+    runtime_error in runtime/utils.c)"""
+    pass
+
+
+def bytelen(n: int):
+    """Number of bytes of the fields holding integers < n (lb_m, lb_r
+    and lb_o of the serializer)"""
+    return ((ceil(log2(n)) + 7) & (-8)) // 8
+
+
+class BytecodeReader:
+    """Reads the fields of a bytecode, as load_bytes, load_varint,
+    load_count and load_mems in runtime/interpreter.c"""
+
+    def __init__(self, bytecode, pos=0):
+        self.bytecode = bytecode
+        self.pos = pos
+
+    def load_bytes(self, bytelen: int):
+        end = self.pos + bytelen
+        if end > len(self.bytecode):
+            raise SimulatorError("Interpret failed: error while reading bytecode.")
+        n = int.from_bytes(self.bytecode[self.pos:end], byteorder='big')
+        self.pos = end
+        return n
+
+    def load_varint(self):
+        n = 0
+        for shift in range(0, 32, 7):
+            b = self.load_bytes(1)
+            n |= (b & 0x7F) << shift
+            if not b & 0x80:
+                return n & 0xFFFFFFFF
+        raise SimulatorError("Invalid varint.")
+
+    def load_count(self, version: int, lb_m: int):
+        return self.load_bytes(lb_m) if version == 0 else self.load_varint()
+
+    def load_mems(self, count: int, version: int, lb_m: int):
+        if version == 0:
+            return [ self.load_bytes(lb_m) for _ in range(count) ]
+        mems = []
+        prev = 0
+        for _ in range(count):
+            zigzag = self.load_varint()
+            prev = (prev + ((zigzag >> 1) ^ -(zigzag & 1))) & 0xFFFFFFFF
+            mems.append(prev)
+        return mems
+
+
+class LLMIRecord:
+    """An LLMI of a bytecode: its memory cells, and its authenticated
+    encrypted LLS (AELLS in runtime/multi_instruction.h)"""
+
+    def __init__(self, mem_inps, mem_outs, instrID, reveal_flag, inputIDs, ct):
+        self.mem_inps = mem_inps
+        self.mem_outs = mem_outs
+        self.instrID = instrID
+        self.reveal_flag = reveal_flag
+        self.inputIDs = inputIDs # list of (InstrID, OutputID)
+        self.ct = ct
+
+
+class Bytecode:
+    """A parsed bytecode, as in interpret_meta and interpret_prog of
+    runtime/interpreter.c
+
+    Unlike the interpreter, the configuration of the secure element
+    (word size, l_in, l_out, r, s) is taken from the bytecode.
+
+    """
+
+    def __init__(self, bytecode):
+        bytecode = bytes(bytecode)
+        reader = BytecodeReader(bytecode)
+
+        # metadata
+        self.version = reader.load_bytes(4)
+        if self.version > VERSION:
+            raise SimulatorError(f"Invalid version ({self.version}). Require at most {VERSION}")
+        self.word_size = reader.load_bytes(4)
+        if self.word_size not in WORD_DTYPES:
+            raise SimulatorError(f"Unsupported word_size ({self.word_size}).")
+        self.l_in = reader.load_bytes(4)
+        self.l_out = reader.load_bytes(4)
+        self.r = reader.load_bytes(4)
+        self.s = reader.load_bytes(4)
+        self.memory_count = reader.load_bytes(4)
+
+        self.lb_m = bytelen(self.memory_count)
+        self.lb_c = self.word_size // 8
+        self.lb_r = bytelen(self.r)
+        self.lb_o = bytelen(self.l_out)
+        version, lb_m = self.version, self.lb_m
+
+        # header (ciphertext of shared key + number of inputs)
+        self.header = bytecode[reader.pos:reader.pos+CT_SEPUB_BYTES+lb_m]
+        reader.pos += CT_SEPUB_BYTES
+
+        # program inputs and outputs
+        inp_count = reader.load_bytes(lb_m)
+        self.inputs = reader.load_mems(inp_count, version, lb_m)
+        out_count = reader.load_count(version, lb_m)
+        self.outputs = reader.load_mems(out_count, version, lb_m)
+        if version >= 1:
+            reader.pos += -reader.pos % 4
+        llmi_count = reader.load_bytes(4)
+
+        # layers (version 2)
+        self.layers = None
+        if version >= 2:
+            layer_count = reader.load_bytes(4)
+            self.layers = [ reader.load_bytes(4) for _ in range(layer_count) ]
+            if sum(self.layers) != llmi_count or 0 in self.layers:
+                raise SimulatorError("Invalid layers.")
+
+        # LLMI offsets (version 1)
+        if version >= 1:
+            offsets = [ reader.load_bytes(4) for _ in range(llmi_count) ]
+            records = reader.pos
+
+        first_instrID = inp_count // self.l_out + 2
+        self.llmis = []
+        for i in range(llmi_count):
+            if version >= 1:
+                reader.pos = records + offsets[i]
+            inp_count = reader.load_count(version, lb_m)
+            if inp_count > self.l_in:
+                raise SimulatorError(f"Invalid input_count for LLMI {i} ({inp_count}). Require at most {self.l_in}")
+            mem_inps = reader.load_mems(inp_count, version, lb_m)
+            out_count = reader.load_count(version, lb_m)
+            if out_count > self.l_out:
+                raise SimulatorError(f"Invalid output_count for LLMI {i} ({out_count}). Require at most {self.l_out}")
+            mem_outs = reader.load_mems(out_count, version, lb_m)
+            instrID = reader.load_bytes(4) if version == 0 else first_instrID + i
+            reveal_flag = reader.load_bytes(1)
+            inputIDs = []
+            for _ in range(inp_count):
+                if version == 0:
+                    inputIDs.append((reader.load_bytes(4), reader.load_bytes(self.lb_o)))
+                else:
+                    inputIDs.append(((instrID - reader.load_varint()) & 0xFFFFFFFF,
+                                     reader.load_varint()))
+            lls_bytelen = reader.load_bytes(4) if version == 0 else reader.load_varint()
+            ct = bytecode[reader.pos:reader.pos+lls_bytelen]
+            reader.pos += lls_bytelen
+            self.llmis.append(LLMIRecord(mem_inps, mem_outs, instrID,
+                                         reveal_flag, inputIDs, ct))
+        if reader.pos != len(bytecode):
+            raise SimulatorError("Interpret failed: error while reading bytecode.")
+
+        for m in self.inputs + self.outputs + \
+                 [ m for llmi in self.llmis for m in llmi.mem_inps + llmi.mem_outs ]:
+            if m >= self.memory_count:
+                raise SimulatorError(f"Invalid memory cell ({m}). Require less than {self.memory_count}")
+
+    def input_count(self):
+        return len(self.inputs)
+
+
+def hash_withprefix(prefix: int, msg: bytes):
+    return esch256_hash(uint_tobytes(prefix, 4) + msg)
+
+def words_tobytes(words, word_size: int):
+    return b''.join([ uint_tobytes(int(x), word_size // 8) for x in words ])
+
+def hashchain(Hp: bytes, X, word_size: int):
+    """H_i = Hash(H_{i-1}, X_i)"""
+    return esch256_hash(Hp + words_tobytes(X, word_size))
+
+def open_header(header: bytes):
+    """Decrypts the shared key K_S of the header of a bytecode"""
+    try:
+        return crypto_box_seal_open(header[:CT_SEPUB_BYTES], pubkey, prvkey)
+    except ValueError:
+        raise SimulatorError("SEstart: Authenticated decryption header failed.")
+
+def decrypt_lls(bc: Bytecode, llmi: LLMIRecord, shared_key: bytes):
+    """Authenticated decryption of the LLS of |llmi|, as LLS_decrypt in
+    runtime/SEalgo.c"""
+    nonce = bytes(NONCE_BYTES - 4) + uint_tobytes(llmi.instrID, 4)
+    ad = uint_tobytes(llmi.instrID, 4) + uint_tobytes(llmi.reveal_flag, 1) + \
+        uint_tobytes(len(llmi.mem_inps), bc.lb_m) + \
+        b''.join([ uint_tobytes(instrID, 4) + uint_tobytes(outputID, bc.lb_o)
+                   for (instrID, outputID) in llmi.inputIDs ]) + \
+        uint_tobytes(len(llmi.mem_outs), bc.lb_m)
+    lls = schwaemm128128_decrypt(llmi.ct, ad, nonce, shared_key)
+    if lls is None or len(lls) != len(llmi.ct) - TAG_BYTES:
+        raise SimulatorError("Authenticated decryption LLS failed!")
+    return lls
+
+def decode_lls(bc: Bytecode, lls: bytes):
+    """Decodes the LLS bytecode written by LLMIEncoder.encode_lls, as
+    LLS_execute in runtime/SEalgo.c
+
+    Returns a list of (Opcode, dst, srcs), where each source is a pair
+    (is_register, register or immediate). NOPs are dropped.
+
+    """
+    instrs = []
+    pos = 0
+    count = 0
+    while pos != len(lls):
+        count += 1
+        if count > bc.s:
+            raise SimulatorError(f"Execute LLS failed: counter={count} > {bc.s}=LLS_MAX_LENGTH.")
+        try:
+            opcode = Opcode(lls[pos] >> 4)
+            flag = OperandCode(lls[pos] & 0xF)
+        except ValueError:
+            raise SimulatorError(f"Invalid opcode or flag: {lls[pos]}.")
+        pos += 1
+        if opcode == Opcode.NOP:
+            continue
+        reader = BytecodeReader(lls, pos)
+        dst = reader.load_bytes(bc.lb_r)
+        srcs = []
+        for kind in flag.name:
+            if kind == 'R':
+                srcs.append((True, reader.load_bytes(bc.lb_r)))
+            elif kind == 'I':
+                srcs.append((False, reader.load_bytes(bc.lb_c)))
+        for (is_reg, r) in [ (True, dst) ] + srcs:
+            if is_reg and r >= bc.r:
+                raise SimulatorError(f"Invalid register ({r}).")
+        pos = reader.pos
+        instrs.append((opcode, dst, srcs))
+    return instrs
+
+
+def _div(a, b):
+    if np.any(b == 0):
+        raise SimulatorError("Division by zero.")
+    return a // b
+
+def _mod(a, b):
+    if np.any(b == 0):
+        raise SimulatorError("Division by zero.")
+    return a % b
+
+# The instructions, as instruction_execute in runtime/SEalgo.c (see
+# evaluator.OPERATIONS), with the divisions by zero of the secure element.
+OPERATIONS = { **evaluator.OPERATIONS,
+               Opcode.DIV: lambda a, b, c, t: _div(a, b),
+               Opcode.MOD: lambda a, b, c, t: _mod(a, b) }
+
+def execute_lls(instrs, reg, dtype):
+    """Executes the decoded |instrs| on the registers |reg|, an array of
+    shape (r, number of input vectors)"""
+    with np.errstate(over='ignore'):
+        for (opcode, dst, srcs) in instrs:
+            vals = [ reg[x] if is_reg else dtype(x) for (is_reg, x) in srcs ]
+            vals += [ None ] * (3 - len(vals))
+            reg[dst] = OPERATIONS[opcode](*vals, dtype)
+
+
+class SecureElement:
+    """The secure element of runtime/SEalgo.c, with the configuration of
+    the bytecode |bc|. The encrypted words are bytes."""
+
+    def __init__(self, bc: Bytecode):
+        self.bc = bc
+        self.dtype = WORD_DTYPES[bc.word_size]
+
+    def word_ad(self, instrID, outputID, execID):
+        return uint_tobytes(instrID, 4) + uint_tobytes(outputID, 4) + execID
+
+    def encrypt_word(self, word, instrID, outputID, execID):
+        ad = self.word_ad(instrID, outputID, execID)
+        return schwaemm128128_encrypt(words_tobytes([word], self.bc.word_size),
+                                      ad, hash_withprefix(3, ad), seckey)
+
+    def start(self, header: bytes, H: bytes):
+        """SE("Start", header, H_L): returns (E_K, E_ID, C_L^in)"""
+        execID = hash_withprefix(0, H + header)
+        shared_key = open_header(header)
+        esharedkey = schwaemm128128_encrypt(shared_key, b'',
+                                            hash_withprefix(1, execID), seckey)
+        n = int.from_bytes(header[CT_SEPUB_BYTES:], byteorder='big')
+        L = uint_tobytes((n + self.bc.l_out - 1) // self.bc.l_out, 4)
+        Cin = schwaemm128128_encrypt(b'', H + L + execID,
+                                     hash_withprefix(2, execID + L), seckey)
+        return esharedkey, execID, Cin
+
+    def input(self, execID: bytes, i: int, Hp: bytes, X, Cinc: bytes):
+        """SE("Input", E_ID, i, H_{i-1}, X_i, C_i^in): returns (C_{i-1}^in,
+        [C_{i,1}, ..., C_{i,l_out}])"""
+        if i < 1:
+            raise SimulatorError("SEinput: Check i failed.")
+        if i == 1 and any(Hp):
+            raise SimulatorError("SEinput: Check H_0 when i=1 failed.")
+        Hc = hashchain(Hp, X, self.bc.word_size)
+        ibstr = uint_tobytes(i, 4)
+        if schwaemm128128_decrypt(Cinc, Hc + ibstr + execID,
+                                  hash_withprefix(2, execID + ibstr),
+                                  seckey) != b'':
+            raise SimulatorError("SEinput: Decrypting Cin failed.")
+        pbstr = uint_tobytes(i-1, 4)
+        Cinp = schwaemm128128_encrypt(b'', Hp + pbstr + execID,
+                                      hash_withprefix(2, execID + pbstr), seckey)
+        C = [ self.encrypt_word(X[j], i, j, execID) for j in range(self.bc.l_out) ]
+        return Cinp, C
+
+    def eval(self, execID: bytes, esharedkey: bytes, llmi: LLMIRecord, Cx):
+        """SE("Eval", E_ID, E_K, MI, C_1^*, ..., C_l^*): returns the
+        encrypted output words (or the output words in clear, as bytes,
+        if |llmi| reveals its outputs)"""
+        bc = self.bc
+        shared_key = schwaemm128128_decrypt(esharedkey, b'',
+                                            hash_withprefix(1, execID), seckey)
+        if shared_key is None or len(shared_key) != SHAREDKEY_BYTES:
+            raise SimulatorError("SEeval: Authenticated decrypting shared_key failed.")
+        instrs = decode_lls(bc, decrypt_lls(bc, llmi, shared_key))
+
+        reg = np.zeros((bc.r, 1), dtype=self.dtype)
+        for i, ((instrID, outputID), cx) in enumerate(zip(llmi.inputIDs, Cx)):
+            ad = self.word_ad(instrID, outputID, execID)
+            bword = schwaemm128128_decrypt(cx, ad, hash_withprefix(3, ad), seckey)
+            if bword is None or len(bword) != bc.word_size // 8:
+                raise SimulatorError("SEeval: Authenticated decrypting encrypted word failed. "
+                                     f"(LLMI,instrID,outputID) = ({llmi.instrID},{instrID},{outputID})")
+            reg[i] = int.from_bytes(bword, byteorder='big')
+
+        execute_lls(instrs, reg, self.dtype)
+
+        outs = [ int(reg[bc.r - bc.l_out + i][0]) for i in range(len(llmi.mem_outs)) ]
+        if llmi.reveal_flag:
+            return [ words_tobytes([x], bc.word_size) for x in outs ]
+        return [ self.encrypt_word(x, llmi.instrID, i, execID)
+                 for i, x in enumerate(outs) ]
+
+
+def check_input_count(bc: Bytecode, count: int):
+    if count != bc.input_count():
+        raise SimulatorError(f"Invalid program input_count! Provided {count}. "
+                             f"Bytecode required {bc.input_count()}")
+
+def interpret(bytecode, inputs):
+    """Executes |bytecode| (bytes or a Bytecode) on the list of integers
+    |inputs| as interpreter_run in runtime/interpreter.c, and returns
+    the list of the outputs of the program"""
+    bc = bytecode if isinstance(bytecode, Bytecode) else Bytecode(bytecode)
+    check_input_count(bc, len(inputs))
+    se = SecureElement(bc)
+    l_out = bc.l_out
+
+    # Step 1: batching and compute H
+    L = (len(inputs) + l_out - 1) // l_out
+    X = [ None ] + [ [ inputs[k] if k < len(inputs) else 0
+                       for k in range(i * l_out, (i+1) * l_out) ]
+                     for i in range(L) ]
+    H = [ bytes(HASH_BYTES) ]
+    for i in range(1, L+1):
+        H.append(hashchain(H[i-1], X[i], bc.word_size))
+
+    # Step 2: SE("Start", header, H_L)
+    Cin = [ None ] * (L+1)
+    esharedkey, execID, Cin[L] = se.start(bc.header, H[L])
+
+    # Step 3: SE("Input", E_ID, i, H_{i-1}, X_i, C_i^in)
+    C = [ None ] * (L * l_out)
+    for i in range(L, 0, -1):
+        Cin[i-1], C[(i-1)*l_out:i*l_out] = se.input(execID, i, H[i-1], X[i], Cin[i])
+
+    memory = dict()
+    for i, m in enumerate(bc.inputs):
+        memory[m] = C[i]
+
+    # Step 4: SE("Eval", E_ID, E_K, MI, C_1^*, ..., C_l^*)
+    for llmi in bc.llmis:
+        outs = se.eval(execID, esharedkey, llmi, [ memory.get(m, b'') for m in llmi.mem_inps ])
+        for m, out in zip(llmi.mem_outs, outs):
+            memory[m] = out
+
+    # The outputs are the first bytes of the (revealed) words
+    lb_c = bc.word_size // 8
+    return [ int.from_bytes(memory.get(m, bytes(lb_c))[:lb_c], byteorder='big')
+             for m in bc.outputs ]
+
+def interpret_batch(bytecode, input_vectors):
+    """Executes |bytecode| (bytes or a Bytecode) on each of the
+    |input_vectors| (an array of shape (vector count, input count)),
+    and returns the outputs of each execution, as an array of shape
+    (vector count, output count)
+
+    The LLSs are decrypted and decoded once, and the words are kept in
+    clear (see the docstring of the module).
+
+    """
+    bc = bytecode if isinstance(bytecode, Bytecode) else Bytecode(bytecode)
+    dtype = WORD_DTYPES[bc.word_size]
+    input_vectors = np.asarray(input_vectors, dtype=dtype)
+    if input_vectors.ndim != 2:
+        input_vectors = input_vectors.reshape((-1, bc.input_count()))
+    check_input_count(bc, input_vectors.shape[1])
+    vector_count = input_vectors.shape[0]
+    shared_key = open_header(bc.header)
+
+    # For each memory cell: its words, the (InstrID, OutputID) of the
+    # words (None if they are revealed), and the last LLMI reading it
+    values = dict()
+    IDs = dict()
+    for k, m in enumerate(bc.inputs):
+        values[m] = input_vectors[:, k]
+        IDs[m] = (k // bc.l_out + 1, k % bc.l_out)
+    last_reads = dict()
+    for i, llmi in enumerate(bc.llmis):
+        for m in llmi.mem_inps:
+            last_reads[m] = i
+    for m in bc.outputs:
+        last_reads[m] = len(bc.llmis)
+
+    for i, llmi in enumerate(bc.llmis):
+        instrs = decode_lls(bc, decrypt_lls(bc, llmi, shared_key))
+        reg = np.zeros((bc.r, vector_count), dtype=dtype)
+        for j, (m, inputID) in enumerate(zip(llmi.mem_inps, llmi.inputIDs)):
+            if IDs.get(m) != inputID:
+                raise SimulatorError("SEeval: Authenticated decrypting encrypted word failed. "
+                                     f"(LLMI,instrID,outputID) = ({llmi.instrID},{inputID[0]},{inputID[1]})")
+            reg[j] = values[m]
+        execute_lls(instrs, reg, dtype)
+        for j, m in enumerate(llmi.mem_outs):
+            values[m] = reg[bc.r - bc.l_out + j]
+            IDs[m] = None if llmi.reveal_flag else (llmi.instrID, j)
+        # Freeing the words that will not be read anymore
+        for m in llmi.mem_inps:
+            if last_reads[m] == i and m in values:
+                del values[m]
+
+    outputs = np.empty((vector_count, len(bc.outputs)), dtype=dtype)
+    for k, m in enumerate(bc.outputs):
+        if m not in IDs or IDs[m] is not None:
+            raise SimulatorError(f"Output {k} of the program is not revealed: "
+                                 "it can only be executed by interpret.")
+        outputs[:, k] = values[m]
+    return outputs
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Executes a bytecode with the simulator of the secure element.")
+    parser.add_argument("bytecode", type=argparse.FileType('rb'),
+                        help="name of the bytecode file")
+    inputs_group = parser.add_mutually_exclusive_group(required=True)
+    inputs_group.add_argument("--inputs", dest="inputs",
+                              help="inputs to give the program (separated by commas)")
+    inputs_group.add_argument("--inputs-file", dest="inputs_file",
+                              type=argparse.FileType('r'),
+                              help="file of input vectors (one per line, with the syntax of --inputs), or - for stdin. The vectors are executed by a single batch.")
+    config = parser.parse_args()
+
+    try:
+        bc = Bytecode(config.bytecode.read())
+        if config.inputs is not None:
+            inputs = [ int(x, 0) for x in config.inputs.split(',') ]
+            for y in interpret(bc, inputs):
+                print(y)
+        else:
+            vectors = [ [ int(x, 0) for x in line.replace(',', ' ').split() ]
+                        for line in config.inputs_file ]
+            vectors = [ v for v in vectors if v ]
+            for outs in interpret_batch(bc, np.array(vectors).reshape((len(vectors), -1))):
+                print(",".join([ str(y) for y in outs ]))
+    except SimulatorError as e:
+        sys.exit(str(e))
+
+
+if __name__ == "__main__":
+    main()
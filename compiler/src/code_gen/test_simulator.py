@@ -0,0 +1,97 @@
+"""Checks that the simulator agrees with the interpreter of the runtime
+on the programs of tests/automated
+
+Each program is compiled (with the configuration of run_tests.pl, and
+each bytecode version in turn), and executed on random input vectors
+by interpret_batch, by interpret (on the first vectors) and, if it has
+been built, by the interpreter of the runtime.
+
+Run from compiler/src with:
+    python3 -m code_gen.test_simulator [C files]
+(default: the programs of tests/automated/basic and tests/automated/medium)
+
+"""
+import glob
+import os
+import random
+import subprocess
+import sys
+import tempfile
+from code_gen.simulator import VERSION, Bytecode, SimulatorError, \
+    interpret, interpret_batch
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..'))
+COMPILER = os.path.join(ROOT, 'compiler', 'compiler.py')
+INTERPRETER = os.path.join(ROOT, 'runtime', 'interpreter')
+CONFIG = [ '-r', '40', '-s', '32', '-lin', '8', '-lout', '8' ]
+
+VECTOR_COUNT = 100
+CHUNK_SIZE = 10
+DRAW_COUNT = 20
+SINGLE_COUNT = 2
+
+def read_info(c_source):
+    with open(c_source[:-2] + '.info') as f:
+        return dict([ [ x.strip() for x in line.split('=', 1) ]
+                      for line in f if '=' in line ])
+
+def check(c_source, bin_file, version):
+    info = read_info(c_source)
+    input_count = int(info['INPUT_COUNT'])
+    if subprocess.call([ sys.executable, COMPILER, c_source, '-o', bin_file,
+                         '-version', str(version) ] + CONFIG,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL):
+        return "error during compilation"
+    with open(bin_file, 'rb') as f:
+        bc = Bytecode(f.read())
+
+    # The simulator stops on divisions by zero (as the interpreter):
+    # the chunks of vectors where this happens are drawn again
+    vectors, outputs = [], []
+    for _ in range(0, VECTOR_COUNT, CHUNK_SIZE):
+        for _ in range(DRAW_COUNT):
+            chunk = [ [ random.getrandbits(32) for _ in range(input_count) ]
+                      for _ in range(CHUNK_SIZE) ]
+            try:
+                outs = interpret_batch(bc, chunk)
+            except SimulatorError as e:
+                if str(e) != "Division by zero.":
+                    raise
+                continue
+            vectors += chunk
+            outputs += [ [ int(y) for y in o ] for o in outs ]
+            break
+        else:
+            return "division by zero on all the drawn input vectors"
+
+    for inputs, outs in list(zip(vectors, outputs))[:SINGLE_COUNT]:
+        if interpret(bc, inputs) != outs:
+            return f"interpret and interpret_batch disagree on {inputs}"
+
+    if os.path.exists(INTERPRETER):
+        lines = "".join([ ",".join(map(str, inputs)) + "\n" for inputs in vectors ])
+        run = subprocess.run([ INTERPRETER, '--inputs-file', '-', bin_file ],
+                             input=lines, capture_output=True, text=True)
+        expected = [ [ int(y) for y in line.split(',') ] if line else []
+                     for line in run.stdout.split('\n')[:-1] ]
+        if expected != outputs:
+            return "the simulator and the interpreter disagree"
+    return None
+
+
+c_sources = sys.argv[1:] or \
+    sorted(glob.glob(os.path.join(ROOT, 'tests', 'automated', 'basic', '*.c')) +
+           glob.glob(os.path.join(ROOT, 'tests', 'automated', 'medium', '*.c')))
+if not os.path.exists(INTERPRETER):
+    print(f"{INTERPRETER} not found: only comparing interpret and interpret_batch.")
+
+errors = 0
+with tempfile.TemporaryDirectory() as tmp:
+    for i, c_source in enumerate(c_sources):
+        error = check(os.path.abspath(c_source), os.path.join(tmp, 'bytecode.bin'),
+                      i % (VERSION + 1))
+        if error:
+            print(f"{os.path.relpath(c_source, ROOT)}: {error}")
+            errors += 1
+assert errors == 0, f"{errors} failures"
+print("Ok!")
@@ -0,0 +1,213 @@
+"""Vectorized evaluation of the intermediate representations
+
+Evaluates an HLIRProgram, an MLIRProgram (or the DFG holding it) or
+an LLIRProgram on many input vectors at once: each memory cell and
+each register holds a NumPy array with one word per input vector, and
+each Opcode is an operation on these arrays, wrapping around the word
+size as instruction_execute in runtime/SEalgo.c does. Divisions by
+zero (undefined in C) give 0.
+
+The Verifier uses it to check that each pass of the compiler preserves
+the outputs of the first HLIR of the program (see -verify).
+
+"""
+import sys
+import time
+from collections import defaultdict, deque
+import numpy as np
+import IR
+from IR import Opcode, ImmOperand, RegOperand
+from DFG import DFG
+
+# NumPy types of the words, by word size
+WORD_DTYPES = { 8: np.uint8, 16: np.uint16, 32: np.uint32, 64: np.uint64 }
+
+class EvaluationError(Exception):
+    pass
+
+
+# The shift amounts are taken modulo the word size, as the shifts of
+# the interpreter on x86.
+OPERATIONS = {
+    Opcode.MOV:  lambda a, b, c, t: a,
+    Opcode.XOR:  lambda a, b, c, t: a ^ b,
+    Opcode.OR:   lambda a, b, c, t: a | b,
+    Opcode.AND:  lambda a, b, c, t: a & b,
+    Opcode.LSL:  lambda a, b, c, t: a << (b & t(np.iinfo(t).bits - 1)),
+    Opcode.LSR:  lambda a, b, c, t: a >> (b & t(np.iinfo(t).bits - 1)),
+    Opcode.LT:   lambda a, b, c, t: (a < b).astype(t),
+    Opcode.ADD:  lambda a, b, c, t: a + b,
+    Opcode.SUB:  lambda a, b, c, t: a - b,
+    Opcode.MUL:  lambda a, b, c, t: a * b,
+    Opcode.EQ:   lambda a, b, c, t: (a == b).astype(t),
+    Opcode.DIV:  lambda a, b, c, t: a // b,
+    Opcode.MOD:  lambda a, b, c, t: a % b,
+    Opcode.CMOV: lambda a, b, c, t: np.where(a != 0, b, c),
+}
+
+def read(env, operand):
+    """Returns the value of the MemOperand or RegOperand |operand| in |env|"""
+    if operand not in env:
+        raise EvaluationError(f"{operand} is read before being written")
+    return env[operand]
+
+def execute(instrs, env, dtype):
+    """Executes the HLIs or LLIs |instrs| on |env|, a map from their
+    operands to their values"""
+    mask = (1 << np.iinfo(dtype).bits) - 1
+    with np.errstate(over='ignore', divide='ignore'):
+        for instr in instrs:
+            if instr.opcode == Opcode.NOP:
+                continue
+            vals = [ None if src is None else
+                     dtype(src.imm & mask) if isinstance(src, ImmOperand) else
+                     read(env, src)
+                     for src in (instr.src1, instr.src2, instr.src3) ]
+            env[instr.dst] = OPERATIONS[instr.opcode](*vals, dtype)
+
+def last_reads(reads, outputs):
+    """For each step, reading the memory cells |reads[i]|, returns the
+    cells that are not read after this step (except the |outputs|)"""
+    last = dict()
+    for i, cells in enumerate(reads):
+        for m in cells:
+            last[m] = i
+    for m in outputs:
+        last.pop(m, None)
+    frees = [ [] for _ in reads ]
+    for m, i in last.items():
+        frees[i].append(m)
+    return frees
+
+def schedule(mlmis, prog_inputs):
+    """Returns the |mlmis| in an order where each MLMI comes after the
+    MLMIs defining its inputs"""
+    prog_inputs = set(prog_inputs)
+    defined = { m for mlmi in mlmis for m in mlmi.outputs }
+    waiting = dict()
+    users = defaultdict(list)
+    ready = deque()
+    for mlmi in mlmis:
+        deps = { m for m in mlmi.inputs if m not in prog_inputs }
+        for m in deps:
+            if m not in defined:
+                raise EvaluationError(f"{m} is read but never written")
+            users[m].append(mlmi)
+        waiting[mlmi] = len(deps)
+        if not deps:
+            ready.append(mlmi)
+    order = []
+    while ready:
+        mlmi = ready.popleft()
+        order.append(mlmi)
+        for m in mlmi.outputs:
+            for user in users.pop(m, []):
+                waiting[user] -= 1
+                if waiting[user] == 0:
+                    ready.append(user)
+    if len(order) != len(waiting):
+        raise EvaluationError("the MLMIs have a cyclic dependency")
+    return order
+
+
+def evaluate(prog, input_vectors, dtype, config=None):
+    """Evaluates |prog| (an HLIRProgram, an MLIRProgram, a DFG or an
+    LLIRProgram) on the |input_vectors|, an array of shape (vector
+    count, input count), and returns the outputs of each vector, as an
+    array of shape (vector count, output count)
+
+    LLIRPrograms need the configuration |config| (r and l_out) to know
+    in which registers the outputs of their LLMIs are.
+
+    """
+    if isinstance(prog, DFG):
+        inputs, outputs = prog.prog.inputs, prog.prog_outputs
+    else:
+        inputs, outputs = prog.inputs, prog.outputs
+    input_vectors = np.asarray(input_vectors, dtype=dtype)
+    if input_vectors.shape[1] != len(inputs):
+        raise EvaluationError(f"the program has {len(inputs)} inputs, "
+                              f"{input_vectors.shape[1]} provided")
+    mem = { m: input_vectors[:, k] for k, m in enumerate(inputs) }
+
+    if isinstance(prog, IR.HLIRProgram):
+        steps = prog.instrs
+        reads = [ list(hli.mem_inputs()) for hli in steps ]
+        def run(hli):
+            execute([hli], mem, dtype)
+    elif isinstance(prog, IR.LLIRProgram):
+        steps = prog.instrs
+        reads = [ llmi.inputs for llmi in steps ]
+        first_output = config.r - config.l_out
+        def run(llmi):
+            reg = { RegOperand(j): read(mem, m) for j, m in enumerate(llmi.inputs) }
+            execute(llmi.seq, reg, dtype)
+            for j, m in enumerate(llmi.outputs):
+                mem[m] = read(reg, RegOperand(first_output + j))
+    else:
+        steps = schedule(list(prog.nodes if isinstance(prog, DFG) else prog.instrs),
+                         inputs)
+        reads = [ mlmi.inputs for mlmi in steps ]
+        def run(mlmi):
+            env = { m: read(mem, m) for m in mlmi.inputs }
+            execute(mlmi.seq, env, dtype)
+            for m in mlmi.outputs:
+                mem[m] = read(env, m)
+
+    # Freeing the cells that will not be read anymore
+    for step, frees in zip(steps, last_reads(reads, outputs)):
+        run(step)
+        for m in frees:
+            mem.pop(m, None)
+
+    result = np.empty((input_vectors.shape[0], len(outputs)), dtype=dtype)
+    for k, m in enumerate(outputs):
+        result[:, k] = read(mem, m)
+    return result
+
+
+class Verifier:
+    """Checks that the programs given to |check| compute the same
+    outputs as the first one, on |vector_count| random input vectors"""
+
+    def __init__(self, vector_count: int, config):
+        self.vector_count = vector_count
+        self.config = config
+        self.dtype = WORD_DTYPES[config.word_size]
+        self.input_vectors = None
+        self.expected = None
+        self.pass_count = 0
+        self.total_time = 0
+
+    def check(self, pass_name: str, prog):
+        """Evaluates |prog|, the output of the pass |pass_name|, and exits
+        if its outputs differ from the ones of the first program"""
+        start_time = time.time()
+        if self.expected is None:
+            inputs = prog.prog.inputs if isinstance(prog, DFG) else prog.inputs
+            rng = np.random.default_rng()
+            self.input_vectors = rng.integers(np.iinfo(self.dtype).max,
+                                              size=(self.vector_count, len(inputs)),
+                                              dtype=self.dtype, endpoint=True)
+        try:
+            outputs = evaluate(prog, self.input_vectors, self.dtype, self.config)
+        except EvaluationError as e:
+            sys.exit(f"-verify: cannot evaluate the program after {pass_name}: {e}")
+
+        if self.expected is None:
+            self.expected = outputs
+        elif outputs.shape != self.expected.shape:
+            sys.exit(f"-verify: the program has {outputs.shape[1]} outputs after {pass_name} "
+                     f"instead of {self.expected.shape[1]}")
+        else:
+            wrong = np.nonzero((outputs != self.expected).any(axis=1))[0]
+            if len(wrong) != 0:
+                k = wrong[0]
+                diffs = np.nonzero(outputs[k] != self.expected[k])[0]
+                inputs = ",".join([ str(x) for x in self.input_vectors[k] ])
+                details = ", ".join([ f"output {i} is {outputs[k][i]} instead of {self.expected[k][i]}"
+                                      for i in diffs[:4] ])
+                sys.exit(f"-verify: {pass_name} changed the outputs of {len(wrong)} "
+                         f"of {self.vector_count} input vectors. With the inputs {inputs}: {details}")
+        self.pass_count += 1
+        self.total_time += time.time() - start_time
@@ -6,7 +6,13 @@ from utils import debug_print_AST, debug_print_IR
 from .AST_to_IR import AST_to_IR
 
 
-def file_to_IR(filestream, config):
+def file_to_IR(filestream, config, verifier=None):
+    """Returns the HLIRProgram of the C program of |filestream|
+
+    If |verifier| is not None, each pass from the initial IR onwards is
+    checked by it (see evaluator.Verifier).
+
+    """
     ast = file_to_AST(filestream)
     debug_print_AST(config.verbose >= 5, "Initial AST", ast)
 
@@ -21,18 +27,26 @@ def file_to_IR(filestream, config):
     # Conversion to non-SSA IR
     ir = AST_to_IR().convert(ast, returns)
     debug_print_IR(config.verbose >= 10, "Initial IR:", ir)
+    if verifier:
+        verifier.check("conversion to IR", ir)
 
     # Conversion to SSA IR
     ir = to_SSA(ir)
     debug_print_IR(config.verbose >= 10, "Initial SSA IR:", ir)
+    if verifier:
+        verifier.check("SSA conversion", ir)
 
     # Copy propagation
     ir = propagate_copy(ir)
     debug_print_IR(config.verbose >= 10, "Initial SSA IR after CP:", ir)
+    if verifier:
+        verifier.check("copy propagation", ir)
 
     # Remove dead code
     ir = remove_dead_code(ir)
     debug_print_IR(config.verbose >= 5, "Final initial IR:", ir)
+    if verifier:
+        verifier.check("dead code removal", ir)
 
 
     return ir
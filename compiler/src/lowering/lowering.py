@@ -7,7 +7,7 @@ def MLMI_to_LLMI(mlmi:MLMI, max_register_count:int, max_output_count:int):
     inputs = mlmi.inputs or [ MemOperand(0) ]
     registers = LinearScanAllocator().get_registers_mapping(
         mlmi.seq.instrs, inputs, mlmi.outputs, max_register_count,
-        max_output_count)
+        max_output_count, mlmi.get_used())
 
     def convert_src(src):
         if src == None:
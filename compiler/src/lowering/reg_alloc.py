@@ -14,7 +14,13 @@ class LinearScanAllocator:
     not_enough_register_msg = 'Not enough registers to perform register allocation'
 
     def compute_live_intervals(self, instrs, inputs, outputs):
-        """Compute live intervals for all variables of |instrs|"""
+        """Compute live intervals for all variables of |instrs|
+
+        Outputs stay alive until the end of |instrs|, and variables
+        that are defined but never used die right after their
+        definition.
+
+        """
         births = defaultdict(lambda:set())
         deaths = defaultdict(lambda:set())
         for m in inputs:
@@ -28,8 +34,11 @@ class LinearScanAllocator:
 
         # Setting deaths
         last = len(instrs) - 1
-        dead = set()
+        dead = set(outputs)
         for idx, instr in enumerate(reversed(instrs)):
+            if instr.dst not in dead:
+                deaths[last-idx+1].add(instr.dst)
+                dead.add(instr.dst)
             for m in instr.mem_inputs():
                 if m not in dead:
                     deaths[last-idx].add(m)
@@ -38,7 +47,8 @@ class LinearScanAllocator:
         return births, deaths
 
     def get_registers_mapping(self, instrs, inputs,
-                              outputs, k:int, max_output_count:int):
+                              outputs, k:int, max_output_count:int,
+                              used=None):
         """Assign a register for each MemOperand of |instrs|
 
         A mapping of MemOperand to RegOperand is thus returned.
@@ -49,27 +59,32 @@ class LinearScanAllocator:
         By conventions, inputs will be put in the first registers and
         outputs in the last registers.
 
+        |used| is the set of variables used but not defined by
+        |instrs| (computed if None).
+
         """
         mem_to_reg = dict()
+        # Putting outputs in the last registers
+        first_output_idx = k - max_output_count
+        for idx, m in enumerate(outputs):
+            mem_to_reg[m] = RegOperand(first_output_idx+idx)
+
         # Putting inputs in the first registers. Note that we make
         # sure that inputs are actually used: universalisation
-        # introduces inputs that are not used.
-        used = MLMI(MLS(instrs), inputs, outputs).get_used()
+        # introduces inputs that are not used. The registers of unused
+        # inputs are free.
+        if used is None:
+            used = MLMI(MLS(instrs), inputs, outputs).get_used()
         for idx, m in enumerate(inputs):
             if m in used and m not in mem_to_reg:
+                if idx >= first_output_idx:
+                    raise ValueError(self.not_enough_register_msg)
                 mem_to_reg[m] = RegOperand(idx)
-        first_free_register = len(mem_to_reg.keys())
-
-        # Putting outputs in the last registers
-        first_output_idx = k - max_output_count
-        for idx, m in enumerate(outputs):
-            mem_to_reg[m] = RegOperand(first_output_idx+idx)
-        last_free_register  = k - len(outputs) - 1
 
         (births, deaths) = self.compute_live_intervals(instrs, inputs, outputs)
 
-        free_registers = set([RegOperand(r) for r in
-                              range(first_free_register, first_output_idx)])
+        free_registers = set([RegOperand(r) for r in range(first_output_idx)]) - \
+            set(mem_to_reg.values())
 
         # Perform linear allocation
         for i in range(len(instrs)):
@@ -93,14 +108,55 @@ class LinearScanAllocator:
         """Returns True if |instrs| requires less than |k| registers
         (and False otherwise)
 
+        This gives the same answer as get_registers_mapping, without
+        building the mapping: outputs are in the last |max_output_count|
+        registers, and all the other variables share the first ones,
+        so only the number of variables alive at each instruction
+        matters. It is computed by a single backward sweep (assuming
+        that each variable is defined at most once, as in the MLIR).
+
+        A sequence using a variable that is neither one of its
+        |inputs| nor defined earlier cannot be allocated: False is
+        returned.
+
         """
-        try:
-            self.get_registers_mapping(instrs, inputs, outputs, k, max_output_count)
-            return True
-        except ValueError as e:
-            if str(e) == self.not_enough_register_msg:
+        fixed = set(outputs)
+        available = k - max_output_count
+        # Variables alive after the current instruction, and how many
+        # of them are in the first registers
+        live = set()
+        live_count = 0
+        for instr in reversed(instrs):
+            dst = instr.dst
+            if dst in live:
+                live.remove(dst)
+                if dst not in fixed:
+                    # The sources dying at |instr| free their register
+                    # before |dst| gets one
+                    if live_count > available:
+                        return False
+                    live_count -= 1
+            elif dst not in fixed and live_count + 1 > available:
+                # Never used: only alive during its definition
+                return False
+            for m in (instr.src1, instr.src2, instr.src3):
+                if isinstance(m, MemOperand) and m not in live:
+                    live.add(m)
+                    if m not in fixed:
+                        live_count += 1
+
+        # Variables alive at the start are the used inputs, in the
+        # register of their position in |inputs|
+        positions = dict()
+        for idx, m in enumerate(inputs):
+            positions.setdefault(m, idx)
+        for m in live:
+            if m not in positions:
+                # Used before being defined
+                return False
+            if m not in fixed and positions[m] >= available:
                 return False
-            raise e
+        return True
 
 
 # ----------------------------------------------------- #
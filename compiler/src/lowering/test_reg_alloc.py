@@ -0,0 +1,94 @@
+"""Checks that LinearScanAllocator.needs_leq_k_registers agrees with
+the register mapping of get_registers_mapping, on random sequences of
+instructions (including unused inputs, inputs that are also outputs,
+outputs used inside the sequence and variables used before being
+defined), and that this mapping never gives the same register to two
+variables alive at the same time.
+
+Run from compiler/src with: python3 -m lowering.test_reg_alloc
+
+"""
+import random
+from IR import Opcode, MemOperand, ImmOperand, HLI
+from lowering.reg_alloc import LinearScanAllocator
+
+SEQUENCE_COUNT = 3000
+
+def make_sequence(rng):
+    input_count = rng.randint(0, 8)
+    inputs = [ MemOperand(m) for m in range(input_count) ]
+    defined = list(inputs)
+    instrs = []
+    for idx in range(rng.randint(1, 32)):
+        dst = MemOperand(input_count + idx)
+        srcs = [ rng.choice(defined) if defined and rng.random() < 0.8
+                 else ImmOperand(rng.randint(0, 255))
+                 for _ in range(rng.randint(1, 3)) ]
+        instrs.append(HLI(Opcode.ADD, dst, *srcs))
+        defined.append(dst)
+    defs = [ instr.dst for instr in instrs ]
+    outputs = rng.sample(defs, rng.randint(0, min(8, len(defs))))
+    if inputs and rng.random() < 0.05:
+        outputs.append(rng.choice(inputs))
+    rng.shuffle(inputs)
+    if rng.random() < 0.1:
+        inputs.append(MemOperand(10000))
+    if rng.random() < 0.02:
+        # Using a variable before its definition (or never defined)
+        idx = rng.randrange(len(instrs))
+        instr = instrs[idx]
+        src = MemOperand(rng.choice(defs).m + 1)
+        instrs[idx] = HLI(instr.opcode, instr.dst, src, instr.src2, instr.src3)
+    return instrs, inputs, outputs
+
+def get_mapping(instrs, inputs, outputs, k, max_output_count):
+    """Returns the mapping of get_registers_mapping, or None if it
+    cannot allocate |instrs| (or if |instrs| uses a variable before
+    defining it)"""
+    defined = set(inputs)
+    for instr in instrs:
+        if any(m not in defined for m in instr.mem_inputs()):
+            return None
+        defined.add(instr.dst)
+    try:
+        return allocator.get_registers_mapping(instrs, inputs, outputs,
+                                               k, max_output_count)
+    except ValueError:
+        return None
+
+def check_mapping(mapping, instrs, inputs, outputs, k):
+    """Checks that no register of |mapping| holds two variables alive
+    at the same time"""
+    assert all(r.r < k for r in mapping.values())
+    last_use = { m : idx for idx, instr in enumerate(instrs)
+                 for m in instr.mem_inputs() }
+    for m in outputs:
+        last_use[m] = len(instrs)
+    # Register of each variable, and the variable in each register
+    used = { m for m in last_use if m not in { instr.dst for instr in instrs } }
+    holder = { mapping[m] : m for m in used }
+    assert len(holder) == len(used)
+    for idx, instr in enumerate(instrs):
+        for r, m in list(holder.items()):
+            if last_use.get(m, -1) <= idx and m not in outputs:
+                del holder[r]
+        r = mapping[instr.dst]
+        assert holder.get(r, instr.dst) == instr.dst, \
+            f"{instr.dst} overwrites {holder[r]} in {r}"
+        holder[r] = instr.dst
+
+rng = random.Random(0)
+allocator = LinearScanAllocator()
+for _ in range(SEQUENCE_COUNT):
+    instrs, inputs, outputs = make_sequence(rng)
+    max_output_count = max(len(outputs), rng.randint(0, 8))
+    for k in range(max_output_count, max_output_count + 24):
+        fast = allocator.needs_leq_k_registers(instrs, inputs, outputs,
+                                               k, max_output_count)
+        mapping = get_mapping(instrs, inputs, outputs, k, max_output_count)
+        assert fast == (mapping is not None), \
+            f"k={k}: {fast} for inputs {inputs}, " + \
+            f"outputs {outputs}:\n" + "\n".join(str(i) for i in instrs)
+        if mapping is not None:
+            check_mapping(mapping, instrs, inputs, outputs, k)
+print("Ok!")
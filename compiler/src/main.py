@@ -2,10 +2,12 @@ from pathlib import Path
 import sys
 import argparse
 import time
+import json
 
 import IR
 import frontend.frontend as frontend
 import clusterization.clusterizer as clusterizer
+import clusterization.merge_stats as merge_stats
 import universalization.universalizer as universalizer
 import lowering.lowering as lowering
 import code_gen.serializer as serializer
@@ -34,21 +36,43 @@ def main():
     parser.add_argument("-w", dest="word_size", default=32, type=int,
                         help="word size")
     parser.add_argument("-version", dest="version", default=0, type=int,
-                        help="version of the compiler")
+                        choices=[0, 1, 2],
+                        help="version of the bytecode: 0, 1 for a more compact bytecode, or 2 for a compact bytecode with the layers of the program (default: 0)")
     parser.add_argument("-stats", dest="stats", default=False,
                         help="print helpful statistics on the compilation",
                         action='store_true')
+    parser.add_argument("-stats-json", dest="stats_json", default=None,
+                        type=argparse.FileType('w'), metavar="FILE",
+                        help="write the compilation times and the counters of the clusterizer to FILE, as JSON")
     parser.add_argument("-width", dest="width", default=0, type=int,
                         help="minimal width of the program")
     parser.add_argument("-depth", dest="depth", default=0, type=int,
                         help="minimal depth of the program")
+    parser.add_argument("-jobs", dest="jobs", default=1, type=int,
+                        help="number of processes used to encode and encrypt the bytecode (default: 1)")
+    parser.add_argument("-verify", dest="verify", default=0, type=int, metavar="N",
+                        help="check that each pass preserves the outputs of the program, on N random input vectors (default: 0, no check)")
+    parser.add_argument("-check-caches", dest="check_caches", action="store_true",
+                        help="check the cached defined and used variables of the multi-instructions at each use (slow, for debugging)")
+    parser.add_argument("-clusterizer", dest="clusterizer", default="basic", choices=["basic", "multilevel"],
+                        help="clusterization algorithm: greedy merges, or multilevel coarsening of the DFG (default: basic)")
     parser.add_argument("-simple-clusterizer", dest="simple_clusterizer", action="store_true",
                         help="faster compilation, but more multi-instructions")
+    parser.add_argument("-time-budget", dest="time_budget", default=0, type=float, metavar="SECONDS",
+                        help="stop improving the clusterization after SECONDS seconds, and keep the best one found (default: 0, no limit)")
+    parser.add_argument("-refine", dest="refine", default=0, type=int, metavar="PASSES",
+                        help="after the clusterization, move instructions between neighbouring multi-instructions when this removes inputs/outputs, with at most PASSES passes (default: 0, no refinement)")
+    parser.add_argument("-merge-log", dest="merge_log", default=None,
+                        type=argparse.FileType('w'), metavar="FILE",
+                        help="save the clusterization to FILE, to replay it with -replay-merges")
+    parser.add_argument("-replay-merges", dest="replay_merges", default=None,
+                        type=argparse.FileType('r'), metavar="FILE",
+                        help="read the clusterization from FILE (saved by -merge-log) instead of computing it")
     fast_group = parser.add_mutually_exclusive_group()
     fast_group.add_argument("-fast", action="store_true",
-                            help="faster compilation, but maybe worse generated code (default: -fast)")
+                            help="faster compilation, but maybe worse generated code: a multi-instruction that cannot be merged with its childs is not tried again (default: -fast)")
     fast_group.add_argument("-no-fast", action="store_true",
-                            help="slower compilation, but maybe better generated code (default: -fast)")
+                            help="slower compilation, but maybe better generated code: a multi-instruction is tried again when its childs change. The merges of siblings are done as with -fast (default: -fast)")
     universal_group = parser.add_mutually_exclusive_group()
     universal_group.add_argument("-universal", action="store_true",
                                  help="enable universalization to protect the data-flow (default: -universal)")
@@ -81,28 +105,48 @@ def main():
     #                          Compiling!                            #
     # -------------------------------------------------------------- #
     global_start_time = time.time()
+    IR.MLS.check_caches = config.check_caches
+    # Statistics written by -stats-json
+    json_stats = { "passes": {} }
+    verifier = None
+    if config.verify > 0:
+        # Imported here, as the evaluator requires numpy
+        from evaluator import Verifier
+        verifier = Verifier(config.verify, config)
 
     # Frontend (C -> AST -> HLIR)
     pass_start_time = time.time()
-    hlir_prog = frontend.file_to_IR(config.inputfile, config)
+    hlir_prog = frontend.file_to_IR(config.inputfile, config, verifier)
     pass_total_time = time.time() - pass_start_time
+    json_stats["passes"]["frontend"] = pass_total_time
     if config.stats:
         print(f"Frontend: {pass_total_time:.2f} sec")
         print(f"  HLIR size: {len(hlir_prog.instrs)} HLIs")
 
     # Clusterizer (HLIR -> MLIR/DFG)
     pass_start_time = time.time()
+    if config.stats or config.stats_json:
+        merge_stats.enable()
     dfg = clusterizer.clusterize(hlir_prog, config)
+    if verifier:
+        verifier.check("clusterization", dfg)
     pass_total_time = time.time() - pass_start_time
+    json_stats["passes"]["clusterization"] = pass_total_time
     if config.stats:
         print(f"Clusterization: {pass_total_time:.2f} sec")
         print(f"  MLIR size: {len(dfg.nodes)} MLMIs")
+        merge_stats.current.print()
+    if config.stats_json:
+        json_stats["clusterization"] = merge_stats.current.to_dict()
+        json_stats["clusterization"]["MLMIs"] = len(dfg.nodes)
+    merge_stats.disable()
 
     # Universalizer (MLIR/DFG -> MLIR/DFG)
     if config.universal:
         pass_start_time = time.time()
-        dfg = universalizer.universalize(dfg, config)
+        dfg = universalizer.universalize(dfg, config, verifier)
         pass_total_time = time.time() - pass_start_time
+        json_stats["passes"]["universalization"] = pass_total_time
         if config.stats:
             print(f"Universalization: {pass_total_time:.2f} sec")
             print(f"  MLIR size: {len(dfg.nodes)} MLMIs")
@@ -110,20 +154,33 @@ def main():
     # Lowering (MLIR/DFG -> LLIR)
     pass_start_time = time.time()
     llir_prog = lowering.lower(dfg, config)
+    if verifier:
+        verifier.check("lowering", llir_prog)
     pass_total_time = time.time() - pass_start_time
+    json_stats["passes"]["lowering"] = pass_total_time
     if config.stats:
         print(f"Lowering: {pass_total_time:.2f} sec")
+        if llir_prog.layers:
+            print(f"  LLIR layers: {len(llir_prog.layers)} (widest: {max(llir_prog.layers)} LLMIs)")
 
     # Serializer (LLIR -> bytecode)
     pass_start_time = time.time()
     serializer.serialize(llir_prog, config)
     pass_total_time = time.time() - pass_start_time
+    json_stats["passes"]["serialization"] = pass_total_time
     if config.stats:
         print(f"Serialization: {pass_total_time:.2f} sec")
 
     global_total_time = time.time() - global_start_time
+    if config.stats and verifier:
+        print(f"Verification: {verifier.total_time:.2f} sec (included above)")
+        print(f"  {verifier.pass_count} passes checked on {config.verify} input vectors")
     if config.stats:
         print(f"Total compilation time: {global_total_time:.2f} sec")
+    if config.stats_json:
+        json_stats["total"] = global_total_time
+        json.dump(json_stats, config.stats_json, indent=2)
+        config.stats_json.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,104 @@
+"""Checks the evaluator of the intermediate representations
+
+Each program is compiled with -verify (which checks every pass against
+the first HLIR), its HLIR is evaluated and compared with the bytecode
+executed by the simulator, and a modified HLIR has to be rejected by
+the Verifier.
+
+Run from compiler/src with:
+    python3 -m test_evaluator [C files]
+(default: the programs of tests/automated/basic and tests/automated/medium)
+
+"""
+import glob
+import os
+import subprocess
+import sys
+import tempfile
+from argparse import Namespace
+import numpy as np
+import IR
+import frontend.frontend as frontend
+from evaluator import WORD_DTYPES, Verifier, evaluate
+from code_gen.simulator import Bytecode, SimulatorError, interpret_batch
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+COMPILER = os.path.join(ROOT, 'compiler', 'compiler.py')
+CONFIG = [ '-r', '40', '-s', '32', '-lin', '8', '-lout', '8' ]
+
+VECTOR_COUNT = 200
+CHUNK_SIZE = 10
+
+def modified(hlir):
+    """Returns a copy of |hlir| where the last instruction computing an
+    output XORs it with 1 (or None if there is none)"""
+    outputs = set(hlir.outputs)
+    for k in reversed(range(len(hlir.instrs))):
+        instr = hlir.instrs[k]
+        if instr.dst in outputs and instr.opcode != IR.Opcode.NOP:
+            tmp = IR.MemOperand(hlir.memory_count)
+            instrs = hlir.instrs[:k] + \
+                [ IR.HLI(instr.opcode, tmp, instr.src1, instr.src2, instr.src3),
+                  IR.HLI(IR.Opcode.XOR, instr.dst, tmp, IR.ImmOperand(1)) ] + \
+                hlir.instrs[k+1:]
+            return IR.HLIRProgram(instrs, hlir.inputs, hlir.outputs,
+                                  hlir.memory_count + 1)
+    return None
+
+def check(c_source, bin_file):
+    if subprocess.call([ sys.executable, COMPILER, c_source, '-o', bin_file,
+                         '-verify', str(VECTOR_COUNT), '-version', '1' ] + CONFIG,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL):
+        return "error during compilation with -verify"
+
+    config = Namespace(verbose=0, word_size=32)
+    with open(c_source) as f:
+        hlir = frontend.file_to_IR(f, config)
+    dtype = WORD_DTYPES[config.word_size]
+    vectors = np.random.default_rng().integers(np.iinfo(dtype).max,
+                                               size=(VECTOR_COUNT, len(hlir.inputs)),
+                                               dtype=dtype, endpoint=True)
+    outputs = evaluate(hlir, vectors, dtype)
+    with open(bin_file, 'rb') as f:
+        bc = Bytecode(f.read())
+    # The simulator stops on divisions by zero, where the evaluator
+    # gives 0: skipping the chunks of vectors where this happens
+    compared = 0
+    for k in range(0, VECTOR_COUNT, CHUNK_SIZE):
+        try:
+            expected = interpret_batch(bc, vectors[k:k+CHUNK_SIZE])
+        except SimulatorError as e:
+            if str(e) != "Division by zero.":
+                raise
+            continue
+        if not np.array_equal(outputs[k:k+CHUNK_SIZE], expected):
+            return "the evaluator and the simulator disagree"
+        compared += 1
+    if compared == 0:
+        return "division by zero on all the chunks of input vectors"
+
+    wrong = modified(hlir)
+    if wrong is not None:
+        verifier = Verifier(VECTOR_COUNT, config)
+        verifier.check("frontend", hlir)
+        try:
+            verifier.check("modification", wrong)
+            return "the Verifier accepted a modified HLIR"
+        except SystemExit:
+            pass
+    return None
+
+
+c_sources = sys.argv[1:] or \
+    sorted(glob.glob(os.path.join(ROOT, 'tests', 'automated', 'basic', '*.c')) +
+           glob.glob(os.path.join(ROOT, 'tests', 'automated', 'medium', '*.c')))
+
+errors = 0
+with tempfile.TemporaryDirectory() as tmp:
+    for c_source in c_sources:
+        error = check(os.path.abspath(c_source), os.path.join(tmp, 'bytecode.bin'))
+        if error:
+            print(f"{os.path.relpath(c_source, ROOT)}: {error}")
+            errors += 1
+assert errors == 0, f"{errors} failures"
+print("Ok!")
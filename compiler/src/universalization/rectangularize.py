@@ -42,10 +42,9 @@ def segregate_layers(dfg:DFG, node_layers, layers, config):
     # some room for an additional input+output+instr.
     #
     # To do so, we iterate from the last layer to the first once,
-    # because the backward_edges in the DFG can be be used to map each
-    # variable to the node that defines them (and we don't have a map
-    # mapping define points to the use points (although we could
-    # generate it from other structures that we have)).
+    # because the defining nodes in the DFG can be be used to map each
+    # variable to the node that defines them (while the uses of the DFG
+    # map each variable to the nodes using it).
 
 
     # Records alternative places where MemOperands are defined
@@ -58,18 +57,6 @@ def segregate_layers(dfg:DFG, node_layers, layers, config):
                 return True
         return False
 
-    def replace_input(node:MLMI, old_m:MemOperand, new_m:MemOperand):
-        """Replace |old_m| by |new_m| in |node|"""
-        node.inputs = [ m if m != old_m else new_m
-                        for m in node.inputs ]
-        for instr in node.seq:
-            if instr.src1 == old_m:
-                instr.src1 = new_m
-            if instr.src2 == old_m:
-                instr.src2 = new_m
-            if instr.src3 == old_m:
-                instr.src3 = new_m
-
     def make_alternative(old_m:MemOperand, node:MLMI, layer:int):
         """Creates a new MemOperand to replace |old_m|"""
         # Creating the new MemOperand
@@ -80,47 +67,25 @@ def segregate_layers(dfg:DFG, node_layers, layers, config):
         alternative_defs[old_m][layer] = new_m
 
         # Updating |node| with this new MemOperand
-        dfg.backward_edges[new_m] = node
+        dfg.set_defining_node(new_m, node)
         node.outputs.append(new_m)
-        if old_m not in node.inputs:
-            node.inputs.append(old_m)
-            if old_m not in dfg.prog_inputs:
-                old_m_def = dfg.backward_edges[old_m]
-                dfg.forward_edges[old_m_def].add(node)
+        if node not in dfg.uses.get(old_m, ()):
+            dfg.add_input(node, old_m)
         # Making sure to add the next MOV at the begining of node's
         # seq, so that it doesn't needlessly keep the input alive
         # throughout the whole MLS.
-        node.seq.instrs.insert(0, HLI(Opcode.MOV, new_m, old_m))
+        node.seq.insert(0, HLI(Opcode.MOV, new_m, old_m))
 
         return new_m
 
-    def remove_forward_edge_if_needed(def_node:MLMI, dst_node:MLMI):
-        """Removes the edge from |def_node| to |dst_node| if needed.
-
-        "if needed" means "if the edge shouldn't be here now that
-        we've removed one of the MemOperand that was the cause of this
-        edge".
-
-        """
-        need_to_remove_edge = True
-        for m in dst_node.inputs:
-            if m in def_node.outputs:
-                need_to_remove_edge = False
-                break
-        if need_to_remove_edge:
-            dfg.forward_edges[def_node] = { n for n in dfg.forward_edges[def_node]
-                                            if n != dst_node }
-
-
     def break_edge(def_node:MLMI, dst_node:MLMI, mid_layer:int, m:MemOperand):
+        # Note that dfg.replace_input updates the edges of |dst_node|
+        # (removing the one from |def_node| if it does not use its
+        # other outputs)
         if has_alternative_def(m, mid_layer):
             # |m| is actually already in layer |mid_layer|.
             alt_m = alternative_defs[m][mid_layer]
-            alt_m_def = dfg.backward_edges[alt_m]
-            dfg.forward_edges[alt_m_def].add(dst_node)
-            replace_input(dst_node, m, alt_m)
-            if def_node != None:
-                remove_forward_edge_if_needed(def_node, dst_node)
+            dfg.replace_input(dst_node, m, alt_m)
             return
         # Searching for a candidate node in layer |mid_layer| to use.
         candidate = None
@@ -145,28 +110,13 @@ def segregate_layers(dfg:DFG, node_layers, layers, config):
             node = MLMI(MLS([]), [], [])
             node_layers[node] = mid_layer
             layers[mid_layer].append(node)
-            dfg.nodes.add(node)
+            dfg.add_node(node)
 
-        # Creating alternative |m|
+        # Creating alternative |m| (with the edge from |def_node| to
+        # |node|)
         alt_m = make_alternative(m, node, mid_layer)
         # Updating |dst_node|
-        dst_node.inputs = [ x if x != m else alt_m for x in dst_node.inputs ]
-        for instr in dst_node.seq.instrs:
-            if instr.src1 == m:
-                instr.src1 = alt_m
-            if instr.src2 == m:
-                instr.src2 = alt_m
-            if instr.src3 == m:
-                instr.src3 = alt_m
-        # Adding forward edge from |node| to |dst_node|
-        dfg.forward_edges[node].add(dst_node)
-
-        if def_node != None:
-            # Removing the forward edge from |def_node| to |dst_node|
-            remove_forward_edge_if_needed(def_node, dst_node)
-
-            # Adding forward edge from |def_node| to |node|
-            dfg.forward_edges[def_node].add(node)
+        dfg.replace_input(dst_node, m, alt_m)
 
 
     count = 0
@@ -184,38 +134,21 @@ def segregate_layers(dfg:DFG, node_layers, layers, config):
                     def_point = None
                     def_layer_idx = -1
                 else:
-                    def_point = dfg.backward_edges[m]
+                    def_point = dfg.defining_node(m)
                     def_layer_idx = node_layers[def_point]
                 if def_layer_idx != curr_layer_idx-1:
                     break_edge(def_point, node, curr_layer_idx-1, m)
 
 
 def layerize(dfg:DFG):
-    node_layers = dict()
-    defined = set(dfg.prog_inputs)
-    to_visit = set(dfg.nodes)
-    last_layer = 0
-    while len(to_visit) != 0:
-        to_remove = set()
-        for node in to_visit:
-            layer = 0
-            for prev in dfg.prev_nodes(node):
-                if prev not in node_layers:
-                    layer = -1
-                    break
-                layer = max(layer, node_layers[prev]+1)
-
-            if layer != -1:
-                last_layer = max(last_layer, layer)
-                node_layers[node] = layer
-                to_remove.add(node)
-
-        to_visit = to_visit - to_remove
-
-    # Computing all the nodes in each layer
-    layers = [ [] for _ in range(last_layer+1) ]
-    for node, layer in node_layers.items():
-        layers[layer].append(node)
+    """Returns the layer of each node of |dfg|, each node being in the
+    first layer after the ones of the nodes it depends on, and the
+    list of the nodes of each layer"""
+    frozen = dfg.freeze()
+    (layer_of_ids, layer_ids) = frozen.layers()
+    assert len(frozen.undefined) == 0 and -1 not in layer_of_ids
+    node_layers = { node : layer_of_ids[idx] for idx, node in enumerate(frozen.nodes) }
+    layers = [ [ frozen.nodes[idx] for idx in ids ] for ids in layer_ids ]
 
     return (node_layers, layers)
 
@@ -6,7 +6,9 @@ import math
 import random
 import time
 
-def universalize(dfg:DFG, config) -> DFG :
+def universalize(dfg:DFG, config, verifier=None) -> DFG :
+    """Universalizes |dfg|, checking each step with |verifier| if it is
+    not None (see evaluator.Verifier)"""
 
     assert config.l_in == config.l_out and \
         2**math.log2(config.l_in) == config.l_in
@@ -15,6 +17,8 @@ def universalize(dfg:DFG, config) -> DFG :
 
     start_rectangularize_time = time.time()
     layers = rectangularize(dfg, config)
+    if verifier:
+        verifier.check("rectangularization", dfg)
 
     if config.stats:
         if config.depth == 0 or config.depth <= len(layers):
@@ -27,22 +31,32 @@ def universalize(dfg:DFG, config) -> DFG :
     #dfg.show_dfg(filename="universalize_1")
 
     add_depth_padding(dfg, layers, config)
+    if verifier:
+        verifier.check("depth padding", dfg)
 
     #dfg.show_dfg(filename="universalize_2")
 
     add_input_masking_layer(dfg, layers, config)
+    if verifier:
+        verifier.check("input masking", dfg)
 
     #dfg.show_dfg(filename="universalize_3")
 
     propagate_outputs_to_last_layer(dfg, layers, config)
+    if verifier:
+        verifier.check("output propagation", dfg)
 
     #dfg.show_dfg(filename="universalize_4")
 
     equalize_layers(dfg, layers, config)
+    if verifier:
+        verifier.check("layer equalization", dfg)
 
     #dfg.show_dfg(filename="universalize_5")
 
     match_layers_inputs_outputs(dfg, layers,config)
+    if verifier:
+        verifier.check("layer matching", dfg)
     rectangularize_total_time = time.time() - start_rectangularize_time
 
     if config.stats:
@@ -52,6 +66,8 @@ def universalize(dfg:DFG, config) -> DFG :
     #dfg.show_dfg(filename="universalize_6")
 
     add_permutation(dfg, layers, config)
+    if verifier:
+        verifier.check("permutation", dfg)
 
     #dfg.show_dfg(filename="universalize_7")
 
@@ -71,7 +87,7 @@ def add_depth_padding(dfg:DFG, layers, config):
 
     for _ in range(len(layers), depth):
         node = MLMI(MLS([]), [], [])
-        dfg.nodes.add(node)
+        dfg.add_node(node)
         layers.append([node])
 
 def add_input_masking_layer(dfg:DFG, layers, config):
@@ -90,6 +106,7 @@ def add_input_masking_layer(dfg:DFG, layers, config):
     old_inputs = set(dfg.prog.inputs)
     while len(old_inputs) != 0:
         node = MLMI(MLS([]), [], [])
+        dfg.add_node(node)
         initial_layer.append(node)
         while len(node.inputs)  < config.l_in and \
               len(node.outputs) < config.l_out and \
@@ -98,11 +115,11 @@ def add_input_masking_layer(dfg:DFG, layers, config):
             new_input = MemOperand(dfg.memory_count)
             dfg.memory_count += 1
 
-            node.inputs.append(m)
+            dfg.add_input(node, m)
             node.outputs.append(new_input)
-            node.seq.instrs.append(HLI(Opcode.MOV, new_input, m))
+            node.seq.append(HLI(Opcode.MOV, new_input, m))
 
-            dfg.backward_edges[new_input] = node
+            dfg.set_defining_node(new_input, node)
             old_to_new_inputs[m] = new_input
 
     node = initial_layer[0]
@@ -110,25 +127,17 @@ def add_input_masking_layer(dfg:DFG, layers, config):
         out = MemOperand(dfg.memory_count)
         dfg.memory_count += 1
         node.outputs.append(out)
-        node.seq.instrs.append(HLI(Opcode.MOV, out, ImmOperand(0)))
-        dfg.backward_edges[out] = node
+        node.seq.append(HLI(Opcode.MOV, out, ImmOperand(0)))
+        dfg.set_defining_node(out, node)
 
     # Adding forward edges from this initial layer to the rest of the
     # graph, and updating the uses of the old inputs.
     dfg.prog_outputs = [ old_to_new_inputs.get(m, m) for m in dfg.prog_outputs ]
-    for node in dfg.nodes:
-        for m in node.inputs:
-            if m in old_to_new_inputs:
-                dfg.forward_edges[dfg.backward_edges[old_to_new_inputs[m]]].add(node)
-        node.inputs = [ old_to_new_inputs.get(m, m) for m in node.inputs ]
-        for instr in node.seq:
-            instr.src1 = old_to_new_inputs.get(instr.src1, instr.src1)
-            instr.src2 = old_to_new_inputs.get(instr.src2, instr.src2)
-            instr.src3 = old_to_new_inputs.get(instr.src3, instr.src3)
+    initial_nodes = set(initial_layer)
+    for node in { node for m in old_to_new_inputs for node in dfg.uses.get(m, ()) } - initial_nodes:
+        dfg.replace_inputs(node, old_to_new_inputs)
 
     layers.insert(0, initial_layer)
-    for node in initial_layer:
-        dfg.nodes.add(node)
 
 
 
@@ -148,13 +157,10 @@ def propagate_outputs_to_last_layer(dfg:DFG, layers, config):
         new_output = MemOperand(dfg.memory_count)
         dfg.memory_count += 1
 
-        node.inputs.append(m)
+        dfg.add_input(node, m)
         node.outputs.append(new_output)
-        node.seq.instrs.append(HLI(Opcode.MOV, new_output, m))
-
-        def_m_node = dfg.backward_edges[m]
-        dfg.forward_edges[def_m_node].add(node)
-        dfg.backward_edges[new_output] = node
+        node.seq.append(HLI(Opcode.MOV, new_output, m))
+        dfg.set_defining_node(new_output, node)
 
         return new_output
 
@@ -176,7 +182,7 @@ def propagate_outputs_to_last_layer(dfg:DFG, layers, config):
             if node == None:
                 # Need to create a new node in the next layer
                 node = MLMI(MLS([]), [], [])
-                dfg.nodes.add(node)
+                dfg.add_node(node)
                 layers[layer_idx].append(node)
 
             new_output = add_input_output_to_node(m, node)
@@ -196,7 +202,7 @@ def propagate_outputs_to_last_layer(dfg:DFG, layers, config):
     new_outputs = dict()
     while len(to_take_as_inputs) != 0:
         curr_mlmi = MLMI(MLS([]), [], [])
-        dfg.nodes.add(curr_mlmi)
+        dfg.add_node(curr_mlmi)
         while len(curr_mlmi.inputs)  < config.l_in and \
               len(curr_mlmi.outputs) < config.l_out and \
               len(curr_mlmi.seq.instrs)  < config.s and \
@@ -231,7 +237,7 @@ def equalize_layers(dfg:DFG, layers, config):
     for layer in layers[1:-1]:
         for _ in range(len(layer), max_width):
             mlmi = MLMI(MLS([]), [], [])
-            dfg.nodes.add(mlmi)
+            dfg.add_node(mlmi)
             layer.append(mlmi)
 
 
@@ -267,9 +273,7 @@ def match_layers_inputs_outputs(dfg:DFG, layers, config):
                 new_input = random.choice(prev_layer_outputs)
                 while new_input in mlmi.inputs:
                     new_input = random.choice(prev_layer_outputs)
-                mlmi.inputs.append(new_input)
-                def_node = dfg.backward_edges[new_input]
-                dfg.forward_edges[def_node].add(mlmi)
+                dfg.add_input(mlmi, new_input)
 
         # Add outputs
         for mlmi in layer:
@@ -287,14 +291,14 @@ def match_layers_inputs_outputs(dfg:DFG, layers, config):
                         # outputs.
                         new_output = possible_returns.pop()
                         mlmi.outputs.append(new_output)
-                        dfg.backward_edges[new_output] = mlmi
+                        dfg.set_defining_node(new_output, mlmi)
                     else:
                         # Returning a 0
                         new_output = MemOperand(dfg.memory_count)
                         dfg.memory_count += 1
-                        mlmi.seq.instrs.append(HLI(Opcode.MOV, new_output, ImmOperand(0)))
+                        mlmi.seq.append(HLI(Opcode.MOV, new_output, ImmOperand(0)))
                         mlmi.outputs.append(new_output)
-                        dfg.backward_edges[new_output] = mlmi
+                        dfg.set_defining_node(new_output, mlmi)
 
 
         prev_layer_outputs = list({ m for mlmi in layer for m in mlmi.outputs })
@@ -302,6 +306,10 @@ def match_layers_inputs_outputs(dfg:DFG, layers, config):
 
 
 def add_permutation(dfg:DFG, layers, config):
+    """Adds the permutation networks between the layers, and records in
+    |dfg.layers| the final layers of the program: each row of secret
+    shuffles becomes a layer between |layers[i]| and |layers[i+1]|."""
+    dfg.layers = [ list(layers[0]) ]
     for i in range(len(layers)-1):
         before_layer = layers[i]
         after_layer  = layers[i+1]
@@ -312,7 +320,7 @@ def add_permutation(dfg:DFG, layers, config):
         # Removing old foward edges: the permutation network will make
         # them obsolete.
         for mlmi in before_layer:
-            dfg.forward_edges[mlmi] = set()
+            dfg.clear_next_nodes(mlmi)
 
         perm_layer_min_size = max(len(inputs), len(outputs))
         if int(math.log2(perm_layer_min_size)) == math.log2(perm_layer_min_size):
@@ -336,28 +344,29 @@ def add_permutation(dfg:DFG, layers, config):
             new_inputs = list(inputs)
             new_inputs_checker = list(inputs_checker)
             node = MLMI(MLS([]), [], [])
-            dfg.nodes.add(node)
-            node.inputs = [ m for m in inputs[off:off+len(p)] if isinstance(m,MemOperand)]
+            dfg.add_node(node)
+            for m in inputs[off:off+len(p)]:
+                if isinstance(m, MemOperand):
+                    dfg.add_input(node, m)
             for i,idx in enumerate(p):
                 out = MemOperand(dfg.memory_count)
                 dfg.memory_count += 1
                 prev = inputs[off+idx]
-                node.seq.instrs.append(HLI(Opcode.MOV, out, inputs[off+idx]))
+                node.seq.append(HLI(Opcode.MOV, out, inputs[off+idx]))
                 node.outputs.append(out)
 
                 new_inputs[off+i] = out
                 new_inputs_checker[off+i] = inputs_checker[off+idx]
 
-                dfg.backward_edges[out] = node
+                dfg.set_defining_node(out, node)
 
-            for m in node.inputs:
-                if m in dfg.backward_edges:
-                    dfg.forward_edges[dfg.backward_edges[m]].add(node)
 
             for i in range(len(inputs)):
                 inputs[i] = new_inputs[i]
                 inputs_checker[i] = new_inputs_checker[i]
 
+            return node
+
         # inputs_checker is used to check that the permutation is
         # correct: it's an array of integers of which we apply the
         # permutation alongside the real |inputs|, and at the end we
@@ -371,8 +380,10 @@ def add_permutation(dfg:DFG, layers, config):
                 inputs_checker = [ inputs_checker[i] for i in row ]
 
             elif isinstance(row, routing.SecretShuffles):
-                for off, p in row.items():
-                    apply_secret_perm(inputs, off, p, inputs_checker)
+                perm_layer = [ apply_secret_perm(inputs, off, p, inputs_checker)
+                               for off, p in row.items() ]
+                if perm_layer:
+                    dfg.layers.append(perm_layer)
 
             else:
                 assert False
@@ -386,17 +397,10 @@ def add_permutation(dfg:DFG, layers, config):
         # Updating the inputs of the next layer
         off = 0
         for mlmi in after_layer:
-            old_to_new = dict()
-            # Updating inputs and DFG edges
-            for i,old_m in enumerate(mlmi.inputs):
-                new_m = inputs[off+i]
-                dfg.forward_edges[dfg.backward_edges[new_m]].add(mlmi)
-                old_to_new[old_m] = new_m
-                mlmi.inputs[i]    = new_m
-            # Updating body of the MLMI
-            for instr in mlmi.seq.instrs:
-                instr.src1 = old_to_new.get(instr.src1, instr.src1)
-                instr.src2 = old_to_new.get(instr.src2, instr.src2)
-                instr.src3 = old_to_new.get(instr.src3, instr.src3)
+            # Updating inputs, uses and DFG edges
+            dfg.replace_inputs(mlmi, { old_m : inputs[off+i]
+                                       for i,old_m in enumerate(mlmi.inputs) })
 
             off += len(mlmi.inputs)
+
+        dfg.layers.append(list(after_layer))
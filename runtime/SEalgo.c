@@ -26,7 +26,6 @@ static u8 prvkey[32] = {0x2D, 0xC8, 0x72, 0x0F, 0xD4, 0x96, 0x4E, 0x38, \
 static u8 seckey[16] = {0x2, 0x2, 0x2, 0x2, 0x2, 0x2, 0x2, 0x2,
                         0x2, 0x2, 0x2, 0x2, 0x2, 0x2, 0x2, 0x2};
 
-static u8 *ptr;
 /******************************************************************************
  *                        functions
  ******************************************************************************/
@@ -66,8 +65,7 @@ static void LLS_decrypt(u8 *lls_bytecode, AELLS *aells, u8 *shared_key, u32 lb_m
                                 ad, adlen,
                                 nonce, shared_key);
   if (ret != 0 || mlen != aells->bytelen-MAC_INBYTES){
-    fprintf(stderr, "Authenticated decryption LLS failed!\n");
-    exit(EXIT_FAILURE);
+    runtime_error("Authenticated decryption LLS failed!\n");
   }
 
   free(ad);
@@ -93,9 +91,8 @@ static void EWORD_decrypt(uSE *reg, AELLS *aells, u8 *execID, EWORD *Cx)
                               ad, A_INBYTES,
                               nonce, seckey);
     if (ret != 0 || mlen != WORD_INBYTES){
-      fprintf(stderr, "SEeval: Authenticated decrypting encrypted word failed. (LLMI,instrID,outputID) = (%u,%u,%u)\n",
+      runtime_error("SEeval: Authenticated decrypting encrypted word failed. (LLMI,instrID,outputID) = (%u,%u,%u)\n",
                       aells->instrID, aells->inputIDs[i].instrID, aells->inputIDs[i].outputID);
-      exit(EXIT_FAILURE);
     }
 
     word = load_word(bword, WORD_INBYTES);
@@ -122,8 +119,7 @@ static void EWORD_encrypt(EWORD *Cr, AELLS *aells, u8 *execID, uSE *reg, u32 r)
                         NULL,
                         nonce, seckey);
     if (clen != C_INBYTES){
-      fprintf(stderr, "SEeval: Encrypting word (C) failed.\n");
-      exit(EXIT_FAILURE);
+      runtime_error("SEeval: Encrypting word (C) failed.\n");
     }
   }
 }
@@ -187,22 +183,21 @@ static void instruction_execute(uSE *ret, u8 opcode,
       result = operand1 ? operand2 : operand3;
       break;
     default:
-        fprintf(stderr, "Invalid opcode: %d.\n", opcode);
-        exit(EXIT_FAILURE);
+        runtime_error("Invalid opcode: %d.\n", opcode);
   }
   *ret = result;
 }
 
-static uSE load_regvalue(u32 bytelen, uSE *reg){
-  u32 src = load_u32(ptr, bytelen);
+static uSE load_regvalue(u8 **ptr, u32 bytelen, uSE *reg){
+  u32 src = load_u32(*ptr, bytelen);
   uSE val = reg[src];
-  ptr += bytelen;
+  *ptr += bytelen;
   return val;
 }
 
-static uSE load_immvalue(u32 bytelen){
-  uSE val = load_word(ptr, bytelen);
-  ptr += bytelen;
+static uSE load_immvalue(u8 **ptr, u32 bytelen){
+  uSE val = load_word(*ptr, bytelen);
+  *ptr += bytelen;
   return val;
 }
 
@@ -212,14 +207,14 @@ static void LLS_execute(uSE *reg,
                         u32 lb_c,
                         u32 lb_r)
 {
-  ptr = lls_bytecode;
+  // local, so that several LLSs can be executed concurrently
+  u8 *ptr = lls_bytecode;
   u32 counter = 0;
   while (ptr != lls_bytecode + lls_bytelen){
     counter++;
     if (counter > LLS_MAX_LENGTH){
-      fprintf(stderr, "Execute LLS failed: counter=%d > %d=LLS_MAX_LENGTH.\n",
+      runtime_error("Execute LLS failed: counter=%d > %d=LLS_MAX_LENGTH.\n",
               counter, LLS_MAX_LENGTH);
-      exit(EXIT_FAILURE);
     }
 
     u8 opcode   = (*ptr & 0xF0) >> 4; // first 4 bits
@@ -234,70 +229,69 @@ static void LLS_execute(uSE *reg,
 
     switch (flag){
       case INN:
-        val1 = load_immvalue(lb_c);
+        val1 = load_immvalue(&ptr, lb_c);
         break;
       case IRN:
-        val1 = load_immvalue(lb_c);
-        val2 = load_regvalue(lb_r, reg);
+        val1 = load_immvalue(&ptr, lb_c);
+        val2 = load_regvalue(&ptr, lb_r, reg);
         break;
       case IRR:
-        val1 = load_immvalue(lb_c);
-        val2 = load_regvalue(lb_r, reg);
-        val3 = load_regvalue(lb_r, reg);
+        val1 = load_immvalue(&ptr, lb_c);
+        val2 = load_regvalue(&ptr, lb_r, reg);
+        val3 = load_regvalue(&ptr, lb_r, reg);
         break;
       case IRI:
-        val1 = load_immvalue(lb_c);
-        val2 = load_regvalue(lb_r, reg);
-        val3 = load_immvalue(lb_c);
+        val1 = load_immvalue(&ptr, lb_c);
+        val2 = load_regvalue(&ptr, lb_r, reg);
+        val3 = load_immvalue(&ptr, lb_c);
         break;
       case IIN:
-        val1 = load_immvalue(lb_c);
-        val2 = load_immvalue(lb_c);
+        val1 = load_immvalue(&ptr, lb_c);
+        val2 = load_immvalue(&ptr, lb_c);
         break;
       case IIR:
-        val1 = load_immvalue(lb_c);
-        val2 = load_immvalue(lb_c);
-        val3 = load_regvalue(lb_r, reg);
+        val1 = load_immvalue(&ptr, lb_c);
+        val2 = load_immvalue(&ptr, lb_c);
+        val3 = load_regvalue(&ptr, lb_r, reg);
         break;
       case III:
-        val1 = load_immvalue(lb_c);
-        val2 = load_immvalue(lb_c);
-        val3 = load_immvalue(lb_c);
+        val1 = load_immvalue(&ptr, lb_c);
+        val2 = load_immvalue(&ptr, lb_c);
+        val3 = load_immvalue(&ptr, lb_c);
         break;
       case RNN:
-        val1 = load_regvalue(lb_r, reg);
+        val1 = load_regvalue(&ptr, lb_r, reg);
         break;
       case RRN:
-        val1 = load_regvalue(lb_r, reg);
-        val2 = load_regvalue(lb_r, reg);
+        val1 = load_regvalue(&ptr, lb_r, reg);
+        val2 = load_regvalue(&ptr, lb_r, reg);
         break;
       case RRI:
-        val1 = load_regvalue(lb_r, reg);
-        val2 = load_regvalue(lb_r, reg);
-        val3 = load_immvalue(lb_c);
+        val1 = load_regvalue(&ptr, lb_r, reg);
+        val2 = load_regvalue(&ptr, lb_r, reg);
+        val3 = load_immvalue(&ptr, lb_c);
         break;
       case RRR:
-        val1 = load_regvalue(lb_r, reg);
-        val2 = load_regvalue(lb_r, reg);
-        val3 = load_regvalue(lb_r, reg);
+        val1 = load_regvalue(&ptr, lb_r, reg);
+        val2 = load_regvalue(&ptr, lb_r, reg);
+        val3 = load_regvalue(&ptr, lb_r, reg);
         break;
       case RII:
-        val1 = load_regvalue(lb_r, reg);
-        val2 = load_immvalue(lb_c);
-        val3 = load_immvalue(lb_c);
+        val1 = load_regvalue(&ptr, lb_r, reg);
+        val2 = load_immvalue(&ptr, lb_c);
+        val3 = load_immvalue(&ptr, lb_c);
         break;
       case RIR:
-        val1 = load_regvalue(lb_r, reg);
-        val2 = load_immvalue(lb_c);
-        val3 = load_regvalue(lb_r, reg);
+        val1 = load_regvalue(&ptr, lb_r, reg);
+        val2 = load_immvalue(&ptr, lb_c);
+        val3 = load_regvalue(&ptr, lb_r, reg);
         break;
       case RIN:
-        val1 = load_regvalue(lb_r, reg);
-        val2 = load_immvalue(lb_c);
+        val1 = load_regvalue(&ptr, lb_r, reg);
+        val2 = load_immvalue(&ptr, lb_c);
         break;
       default:
-        fprintf(stderr, "Invalid flag: %d.\n", flag);
-        exit(EXIT_FAILURE);
+        runtime_error("Invalid flag: %d.\n", flag);
     }
 
     instruction_execute(&ret, opcode, val1, val2, val3);
@@ -326,8 +320,7 @@ void SEstart(u8 *esharedkey,
   u8 shared_key[SHAREDKEY_INBYTES];
   int ret = crypto_box_seal_open(shared_key, header, CT_SEPUB_INBYTES, pubkey, prvkey);
   if (ret != 0){
-    fprintf(stderr, "SEstart: Authenticated decryption header failed.\n");
-    exit(EXIT_FAILURE);
+    runtime_error("SEstart: Authenticated decryption header failed.\n");
   }
 
   // encrypt shared_key: E_K
@@ -340,8 +333,7 @@ void SEstart(u8 *esharedkey,
                       NULL, nonce,
                       seckey);
   if (clen != ENCRYPTED_SHAREDKEY_INBYTES){
-    fprintf(stderr, "SEstart: Encrypting shared key failed.\n");
-    exit(EXIT_FAILURE);
+    runtime_error("SEstart: Encrypting shared key failed.\n");
   }
 
   // L = ceil(n/l_out)
@@ -367,8 +359,7 @@ void SEstart(u8 *esharedkey,
                       NULL, nonce,
                       seckey);
   if (clen != CIN_INBYTES){
-    fprintf(stderr, "SEstart: Encrypting Cin failed.\n");
-    exit(EXIT_FAILURE);
+    runtime_error("SEstart: Encrypting Cin failed.\n");
   }
 }
 
@@ -386,16 +377,14 @@ void SEinput(u8 *Cinp,
 // Hc: current hash, aka H_i
 {
   if (i < 1){
-    fprintf(stderr, "SEinput: Check i failed.\n");
-    exit(EXIT_FAILURE);
+    runtime_error("SEinput: Check i failed.\n");
   }
   u32 j;
   if (i == 1){
     u32 sum = 0;
     for(j=0; j<HASH_INBYTES; j++) sum += Hp[j];
     if (sum != 0){
-      fprintf(stderr, "SEinput: Check H_0 when i=1 failed.\n");
-      exit(EXIT_FAILURE);
+      runtime_error("SEinput: Check H_0 when i=1 failed.\n");
     }
   }
 
@@ -429,8 +418,7 @@ void SEinput(u8 *Cinp,
                                 nonce, seckey);
 
   if (ret != 0 || mlen != 0){
-    fprintf(stderr, "SEinput: Decrypting Cin failed.\n");
-    exit(EXIT_FAILURE);
+    runtime_error("SEinput: Decrypting Cin failed.\n");
   }
 
   // N_{i-1}^in
@@ -468,8 +456,7 @@ void SEinput(u8 *Cinp,
                         NULL,
                         nonce, seckey);
     if (clen != C_INBYTES){
-      fprintf(stderr, "SEinput: Encrypting word (C) failed.\n");
-      exit(EXIT_FAILURE);
+      runtime_error("SEinput: Encrypting word (C) failed.\n");
     }
   }
 }
@@ -498,8 +485,7 @@ void SEeval(EWORD *Cr,
                                 NULL, 0,
                                 nonce, seckey);
   if (ret != 0 || mlen != SHAREDKEY_INBYTES){
-    fprintf(stderr, "SEeval: Authenticated decrypting shared_key failed.\n");
-    exit(EXIT_FAILURE);
+    runtime_error("SEeval: Authenticated decrypting shared_key failed.\n");
   }
 
   // decrypt instructions f_\nu
@@ -1,7 +1,7 @@
 #ifndef SECONFIG_H
 #define SECONFIG_H
 
-#define VERSION       0
+#define VERSION       2         // latest supported bytecode version
 #define WORD_SIZE     32
 
 #define SE_SMALL      1
@@ -2,6 +2,7 @@
 #include <stdlib.h>
 #include <math.h>
 #include <string.h>
+#include <pthread.h>
 #include "interpreter.h"
 #include "crypto_len.h"
 #include "program.h"
@@ -9,247 +10,599 @@
 #include "sparkle/esch/esch.h"
 #include "SEalgo.h"
 
-// global pointer to bytecode file
-static u8* bcptr;
+static void check_bytes(u8 *p, u8 *end, unsigned long bytelen)
+// Checks that the |bytelen| bytes at |p| are before |end|, the end of
+// the bytecode
+{
+  if (p > end || (unsigned long) (end - p) < bytelen){
+    runtime_error("Interpret failed: truncated bytecode.\n");
+  }
+}
 
-static u32 load_bytes(u32 bytelen)
+static u32 load_bytes(u8 **bcptr, u8 *end, u32 bytelen)
 // big-endian
 {
   u32 n;
+  u8 *p = *bcptr;
+  check_bytes(p, end, bytelen);
   switch (bytelen){
     case 1:
-      n = bcptr[0];
+      n = p[0];
       break;
     case 2:
-      n = (bcptr[0] << 8)
-        | (bcptr[1]     );
+      n = (p[0] << 8)
+        | (p[1]     );
       break;
     case 3:
-      n = (bcptr[0] << 16)
-        | (bcptr[1] <<  8)
-        | (bcptr[2]      );
+      n = (p[0] << 16)
+        | (p[1] <<  8)
+        | (p[2]      );
       break;
     case 4:
-      n = (bcptr[0] << 24)
-        | (bcptr[1] << 16)
-        | (bcptr[2] <<  8)
-        | (bcptr[3]      );
+      n = (p[0] << 24)
+        | (p[1] << 16)
+        | (p[2] <<  8)
+        | (p[3]      );
       break;
     default:
-      fprintf(stderr, "Invalid number of bytes (%d).\n", bytelen);
-      exit(EXIT_FAILURE);
+      runtime_error("Invalid number of bytes (%d).\n", bytelen);
     }
-  bcptr += bytelen;
+  *bcptr += bytelen;
   return n;
 }
 
-static void interpret_meta(u32 *memory_count)
+static u32 load_varint(u8 **bcptr, u8 *end)
+// unsigned LEB128 (bytecode version >= 1)
+{
+  u32 n = 0;
+  u32 shift;
+  for (shift = 0; shift < 32; shift += 7){
+    check_bytes(*bcptr, end, 1);
+    u8 b = *(*bcptr)++;
+    n |= (u32) (b & 0x7F) << shift;
+    if (!(b & 0x80)) return n;
+  }
+  runtime_error("Invalid varint.\n");
+}
+
+static u32 load_count(u8 **bcptr, u8 *end, u32 version, u32 lb_m)
 {
-  u32 version, word_size, lin_bc, lout_bc, r_bc, s_bc;
+  return (version == 0) ? load_bytes(bcptr, end, lb_m) : load_varint(bcptr, end);
+}
+
+static void load_mems(u8 **bcptr, u8 *end, u32 *mems, u32 count, u32 version, u32 lb_m)
+// version 0: lb_m bytes per memory cell
+// version 1: zigzag varints of the differences between successive cells
+{
+  u32 i, zigzag, prev = 0;
+  for(i=0; i<count; i++){
+    if (version == 0){
+      mems[i] = load_bytes(bcptr, end, lb_m);
+    } else {
+      zigzag = load_varint(bcptr, end);
+      prev += (zigzag >> 1) ^ (-(zigzag & 1));
+      mems[i] = prev;
+    }
+  }
+}
+
+static void interpret_meta(u8 **bcptr, u8 *end, u32 *version, u32 *memory_count)
+{
+  u32 word_size, lin_bc, lout_bc, r_bc, s_bc;
   // version (32)
-  version = load_bytes(4);
-  if (version != VERSION){
-    fprintf(stderr, "Invalid version (%d). Require %d\n", version, VERSION);
-    exit(EXIT_FAILURE);
+  *version = load_bytes(bcptr, end, 4);
+  if (*version > VERSION){
+    runtime_error("Invalid version (%d). Require at most %d\n", *version, VERSION);
   }
   // word_size (32)
-  word_size = load_bytes(4);
+  word_size = load_bytes(bcptr, end, 4);
   if (word_size != WORD_SIZE){
-    fprintf(stderr, "Invalid word_size (%d). Require %d\n", \
+    runtime_error("Invalid word_size (%d). Require %d\n", \
                      word_size, WORD_SIZE);
-    exit(EXIT_FAILURE);
   }
   // LLMI_max_input_count (l_in) (32)
-  lin_bc = load_bytes(4);
+  lin_bc = load_bytes(bcptr, end, 4);
   if (lin_bc != LLMI_MAX_INPUT_COUNT){
-    fprintf(stderr, "Invalid LLMI_max_input_count (%d). Require %d\n", \
+    runtime_error("Invalid LLMI_max_input_count (%d). Require %d\n", \
                      lin_bc, LLMI_MAX_INPUT_COUNT);
-    exit(EXIT_FAILURE);
   }
   // LLMI_max_output_count (l_out) (32)
-  lout_bc = load_bytes(4);
+  lout_bc = load_bytes(bcptr, end, 4);
   if (lout_bc != LLMI_MAX_OUTPUT_COUNT){
-    fprintf(stderr, "Invalid LLMI_max_output_count (%d). Require %d\n", \
+    runtime_error("Invalid LLMI_max_output_count (%d). Require %d\n", \
                      lout_bc, LLMI_MAX_OUTPUT_COUNT);
-    exit(EXIT_FAILURE);
   }
   // register_count (r) (32)
-  r_bc = load_bytes(4);
+  r_bc = load_bytes(bcptr, end, 4);
   if (r_bc != REGISTER_COUNT){
-    fprintf(stderr, "Invalid register_count (%d). Require %d\n", \
+    runtime_error("Invalid register_count (%d). Require %d\n", \
                      r_bc, REGISTER_COUNT);
-    exit(EXIT_FAILURE);
   }
   // LLS_max_length (s) (32)
-  s_bc = load_bytes(4);
+  s_bc = load_bytes(bcptr, end, 4);
   if (s_bc != LLS_MAX_LENGTH){
-    fprintf(stderr, "Invalid LLS_max_length (%d). Require %d\n", \
+    runtime_error("Invalid LLS_max_length (%d). Require %d\n", \
                      s_bc, LLS_MAX_LENGTH);
-    exit(EXIT_FAILURE);
   }
   // memory_count (32)
-  *memory_count = load_bytes(4);
+  *memory_count = load_bytes(bcptr, end, 4);
+}
+
+static void interpret_layers(u8 **bcptr, u8 *end, Program *program)
+// version 2: layer_count (32), then the number of LLMIs of each layer
+{
+  u32 i, size;
+  program->layer_count = load_bytes(bcptr, end, 4);
+  if (program->layer_count > program->llmi_count){
+    runtime_error("Invalid layer_count (%u). Require at most LLMI_count (%u)\n",
+                  program->layer_count, program->llmi_count);
+  }
+  program->layer_starts = malloc((program->layer_count + 1) * sizeof(u32));
+  program->layer_starts[0] = 0;
+  for(i=0; i<program->layer_count; i++){
+    size = load_bytes(bcptr, end, 4);
+    if (size == 0 || size > program->llmi_count - program->layer_starts[i]){
+      runtime_error("Invalid size for layer %u (%u).\n", i, size);
+    }
+    program->layer_starts[i+1] = program->layer_starts[i] + size;
+  }
+  if (program->layer_starts[program->layer_count] != program->llmi_count){
+    runtime_error("Invalid layers: they contain %u LLMIs instead of %u.\n",
+                  program->layer_starts[program->layer_count],
+                  program->llmi_count);
+  }
 }
 
-static void interpret_prog(Program *program,
-                               u32 lb_m,
-                               u32 lb_o)
+static void interpret_prog(u8 **bcptr,
+                           Program *program,
+                           u8 *bytecode,
+                           unsigned long bytecode_len,
+                           u32 version,
+                           u32 lb_m,
+                           u32 lb_o)
 {
   u32 i, j;
+  u8 *offsets = NULL, *records = NULL;
+  u8 *end = bytecode + bytecode_len;
   // input_count (lb_m)
-  program->inp_count = load_bytes(lb_m);
+  program->inp_count = load_bytes(bcptr, end, lb_m);
+  // (each count is checked against the remaining bytes before
+  // allocating: an item takes at least one byte)
+  check_bytes(*bcptr, end, program->inp_count);
   program->mem_inps = malloc(program->inp_count * sizeof(u32));
-  for(i=0; i<program->inp_count; i++) program->mem_inps[i] = load_bytes(lb_m);
-  // output_count (lb_m)
-  program->out_count = load_bytes(lb_m);
+  load_mems(bcptr, end, program->mem_inps, program->inp_count, version, lb_m);
+  // output_count (lb_m or varint)
+  program->out_count = load_count(bcptr, end, version, lb_m);
+  check_bytes(*bcptr, end, program->out_count);
   program->mem_outs = malloc(program->out_count * sizeof(u32));
-  for(i=0; i<program->out_count; i++) program->mem_outs[i] = load_bytes(lb_m);
+  load_mems(bcptr, end, program->mem_outs, program->out_count, version, lb_m);
+  // padding (version 1)
+  if (version >= 1) *bcptr = bytecode + ((*bcptr - bytecode + 3) & ~3UL);
   // LLMI_count (32)
-  program->llmi_count = load_bytes(4);
+  program->llmi_count = load_bytes(bcptr, end, 4);
+  check_bytes(*bcptr, end, program->llmi_count);
+  // layers (version 2)
+  program->layer_count = 0;
+  program->layer_starts = NULL;
+  if (version >= 2) interpret_layers(bcptr, end, program);
+  // LLMI offsets (32 * LLMI_count) (version 1)
+  if (version >= 1){
+    offsets = *bcptr;
+    check_bytes(offsets, end, 4 * (unsigned long) program->llmi_count);
+    records = *bcptr + 4 * (unsigned long) program->llmi_count;
+    *bcptr = records;
+  }
+  // InstrID of the first LLMI (see the program inputs in interpret)
+  u32 first_instrID = program->inp_count / l_out + 2;
   program->llmis = malloc(program->llmi_count * sizeof(LLMI));
   for(i=0; i<program->llmi_count; i++){
     LLMI  *llmi  = &(program->llmis[i]);
     AELLS *aells = &(llmi->aells);
 
+    if (version >= 1){
+      // records can be read in any order from their offsets
+      u32 offset = load_u32(offsets + 4*i, 4);
+      if (offset >= (unsigned long) (end - records)){
+        runtime_error("Interpret failed: invalid offset for LLMI %u.\n", i);
+      }
+      *bcptr = records + offset;
+    }
+
     // LLMI inputs
-    llmi->inp_count = load_bytes(lb_m);
+    llmi->inp_count = load_count(bcptr, end, version, lb_m);
+    if (llmi->inp_count > LLMI_MAX_INPUT_COUNT){
+      runtime_error("Invalid input_count for LLMI %u (%u). Require at most %d\n",
+                    i, llmi->inp_count, LLMI_MAX_INPUT_COUNT);
+    }
     aells->inp_count = llmi->inp_count;
     llmi->mem_inps = malloc(llmi->inp_count * sizeof(u32));
-    for(j=0; j<llmi->inp_count; j++) llmi->mem_inps[j] = load_bytes(lb_m);
+    load_mems(bcptr, end, llmi->mem_inps, llmi->inp_count, version, lb_m);
 
     // LLMI outputs
-    llmi->out_count = load_bytes(lb_m);
+    llmi->out_count = load_count(bcptr, end, version, lb_m);
+    if (llmi->out_count > LLMI_MAX_OUTPUT_COUNT){
+      runtime_error("Invalid output_count for LLMI %u (%u). Require at most %d\n",
+                    i, llmi->out_count, LLMI_MAX_OUTPUT_COUNT);
+    }
     aells->out_count = llmi->out_count;
     llmi->mem_outs = malloc(llmi->out_count * sizeof(u32));
-    for(j=0; j<llmi->out_count; j++) llmi->mem_outs[j] = load_bytes(lb_m);
+    load_mems(bcptr, end, llmi->mem_outs, llmi->out_count, version, lb_m);
 
     // instrID
-    aells->instrID = load_bytes(4);
-    aells->reveal_flag = load_bytes(1);
+    aells->instrID = (version == 0) ? load_bytes(bcptr, end, 4) : first_instrID + i;
+    aells->reveal_flag = load_bytes(bcptr, end, 1);
 
     // inputIDs
     aells->inputIDs = malloc(aells->inp_count * sizeof(ID));
     for(j=0; j < aells->inp_count; j++){
-      aells->inputIDs[j].instrID = load_bytes(4);
-      aells->inputIDs[j].outputID = load_bytes(lb_o);
+      if (version == 0){
+        aells->inputIDs[j].instrID = load_bytes(bcptr, end, 4);
+        aells->inputIDs[j].outputID = load_bytes(bcptr, end, lb_o);
+      } else {
+        aells->inputIDs[j].instrID = aells->instrID - load_varint(bcptr, end);
+        aells->inputIDs[j].outputID = load_varint(bcptr, end);
+      }
     }
 
     // LLS_bytelen
-    aells->bytelen = load_bytes(4);
-    aells->bytecode = bcptr;
-    bcptr += aells->bytelen;
+    aells->bytelen = (version == 0) ? load_bytes(bcptr, end, 4) : load_varint(bcptr, end);
+    check_bytes(*bcptr, end, aells->bytelen);
+    aells->bytecode = *bcptr;
+    *bcptr += aells->bytelen;
   }
 }
 
-void interpret(u8  *bytecode, unsigned long bytecode_len,
-               uSE *prog_inps, u32 prog_inpcount,
-               uSE *prog_outs, u32 prog_outcount)
+static void check_mems(u32 *mems, u32 count, u32 memory_count)
+{
+  u32 i;
+  for(i=0; i<count; i++){
+    if (mems[i] >= memory_count){
+      runtime_error("Invalid memory cell (%u). Require less than %u\n",
+                    mems[i], memory_count);
+    }
+  }
+}
+
+static void check_prog(Program *program, u32 memory_count)
+// Checks that the memory cells are in the memory, and that the LLMIs
+// of a layer can be executed in any order (and thus concurrently): no
+// memory cell is written twice in a layer, nor read in the layer that
+// writes it.
+{
+  u32 i, j, l;
+  check_mems(program->mem_inps, program->inp_count, memory_count);
+  check_mems(program->mem_outs, program->out_count, memory_count);
+  for(i=0; i<program->llmi_count; i++){
+    LLMI *llmi = &program->llmis[i];
+    check_mems(llmi->mem_inps, llmi->inp_count, memory_count);
+    check_mems(llmi->mem_outs, llmi->out_count, memory_count);
+  }
+  if (program->layer_count == 0) return;
+
+  // written[m]: 1 + the last layer writing memory cell m
+  u32 *written = calloc(memory_count, sizeof(u32));
+  for(l=0; l<program->layer_count; l++){
+    u32 start = program->layer_starts[l], end = program->layer_starts[l+1];
+    for(i=start; i<end; i++){
+      LLMI *llmi = &program->llmis[i];
+      for(j=0; j<llmi->out_count; j++){
+        if (written[llmi->mem_outs[j]] == l+1){
+          runtime_error("Invalid layer %u: memory cell %u is written twice.\n",
+                        l, llmi->mem_outs[j]);
+        }
+        written[llmi->mem_outs[j]] = l+1;
+      }
+    }
+    for(i=start; i<end; i++){
+      LLMI *llmi = &program->llmis[i];
+      for(j=0; j<llmi->inp_count; j++){
+        if (written[llmi->mem_inps[j]] == l+1){
+          runtime_error("Invalid layer %u: LLMI %u reads memory cell %u, which is written in the same layer.\n",
+                        l, i, llmi->mem_inps[j]);
+        }
+      }
+    }
+  }
+  free(written);
+}
+
+/******************************************************************************
+ *                        Thread pool
+ ******************************************************************************/
+// The threads of the pool execute the LLMIs of a layer concurrently
+// (static striding: thread t executes the LLMIs t, t+thread_count, ...
+// of the layer), and wait for each other at the end of each layer.
+// The thread calling interpreter_run is the thread 0 of the pool.
+
+typedef struct _Barrier
+{
+  pthread_mutex_t mutex;
+  pthread_cond_t cond;
+  u32 count;
+  u32 waiting;
+  u32 generation;
+} Barrier;
+
+typedef struct _Worker
+{
+  Interpreter *interp;
+  u32 index;
+  pthread_t thread;
+  EWORD inps[LLMI_MAX_INPUT_COUNT];
+  EWORD outs[LLMI_MAX_OUTPUT_COUNT];
+} Worker;
+
+struct _ThreadPool
 {
-  bcptr = bytecode;
+  u32 thread_count;
+  Worker *workers;
+  Barrier barrier;
+  int stop;
+  u8 *execID;         // of the current execution
+  u8 *esharedkey;
+};
 
-  u32 memory_count;
-  interpret_meta(&memory_count);
+static void barrier_wait(Barrier *barrier)
+{
+  pthread_mutex_lock(&barrier->mutex);
+  u32 generation = barrier->generation;
+  if (++barrier->waiting == barrier->count){
+    barrier->waiting = 0;
+    barrier->generation++;
+    pthread_cond_broadcast(&barrier->cond);
+  } else {
+    while (generation == barrier->generation)
+      pthread_cond_wait(&barrier->cond, &barrier->mutex);
+  }
+  pthread_mutex_unlock(&barrier->mutex);
+}
+
+static void eval_llmi(Interpreter *interp, LLMI *llmi,
+                      u8 *execID, u8 *esharedkey,
+                      EWORD *inps, EWORD *outs)
+{
+  u32 j;
+  EWORD *memory = interp->memory;
+  // Load encrypted input words from memory
+  for(j=0; j<llmi->inp_count; j++) inps[j] = memory[llmi->mem_inps[j]];
+  // Request SE to execute
+  SEeval(outs, execID, esharedkey, &llmi->aells, inps, REGISTER_COUNT,
+         interp->lb_m, interp->lb_r, interp->lb_c, interp->lb_o);
+  // Store encrypted output words into memory
+  for(j=0; j<llmi->out_count; j++) memory[llmi->mem_outs[j]] = outs[j];
+}
+
+static void run_layers(Worker *worker)
+{
+  Interpreter *interp = worker->interp;
+  ThreadPool *pool = interp->pool;
+  Program *program = &interp->program;
+  u32 i, l;
+  for(l=0; l<program->layer_count; l++){
+    for(i=program->layer_starts[l] + worker->index;
+        i<program->layer_starts[l+1];
+        i+=pool->thread_count){
+      eval_llmi(interp, &program->llmis[i], pool->execID, pool->esharedkey,
+                worker->inps, worker->outs);
+    }
+    barrier_wait(&pool->barrier);
+  }
+}
+
+static void *worker_main(void *arg)
+{
+  Worker *worker = arg;
+  ThreadPool *pool = worker->interp->pool;
+  while (1){
+    // wait for an execution (see interpreter_run)
+    barrier_wait(&pool->barrier);
+    if (pool->stop) break;
+    run_layers(worker);
+  }
+  return NULL;
+}
+
+static void stop_threads(Interpreter *interp)
+{
+  u32 i;
+  ThreadPool *pool = interp->pool;
+  if (!pool) return;
+  pool->stop = 1;
+  barrier_wait(&pool->barrier);
+  for(i=1; i<pool->thread_count; i++) pthread_join(pool->workers[i].thread, NULL);
+  pthread_cond_destroy(&pool->barrier.cond);
+  pthread_mutex_destroy(&pool->barrier.mutex);
+  free(pool->workers);
+  free(pool);
+  interp->pool = NULL;
+}
+
+void interpreter_set_threads(Interpreter *interp, u32 thread_count)
+{
+  u32 i;
+  stop_threads(interp);
+  if (thread_count <= 1 || interp->program.layer_count == 0) return;
+
+  ThreadPool *pool = malloc(sizeof(ThreadPool));
+  pool->thread_count = thread_count;
+  pool->workers = malloc(thread_count * sizeof(Worker));
+  pool->stop = 0;
+  pthread_mutex_init(&pool->barrier.mutex, NULL);
+  pthread_cond_init(&pool->barrier.cond, NULL);
+  pool->barrier.count = thread_count;
+  pool->barrier.waiting = 0;
+  pool->barrier.generation = 0;
+  interp->pool = pool;
+  for(i=0; i<thread_count; i++){
+    pool->workers[i].interp = interp;
+    pool->workers[i].index = i;
+  }
+  for(i=1; i<thread_count; i++){
+    int ret = pthread_create(&pool->workers[i].thread, NULL,
+                             worker_main, &pool->workers[i]);
+    if (ret != 0){
+      runtime_error("Cannot create thread %u: %s.\n", i, strerror(ret));
+    }
+  }
+}
 
+/******************************************************************************
+ *                        Interpreter
+ ******************************************************************************/
+Interpreter *interpreter_init(u8 *bytecode, unsigned long bytecode_len)
+{
+  Interpreter *interp = malloc(sizeof(Interpreter));
+  u8 *bcptr = bytecode;
+
+  u32 version;
+  interpret_meta(&bcptr, bytecode + bytecode_len, &version, &interp->memory_count);
   u32 r = REGISTER_COUNT;
 
   // lb_c: bytelen for memory cell
-  u32 lb_m = ((u32) ceilf(log2f(memory_count)) + 7) / 8;
+  interp->lb_m = ((u32) ceilf(log2f(interp->memory_count)) + 7) / 8;
   // lb_c: bytelen for a constant
-  u32 lb_c = WORD_SIZE / 8;
+  interp->lb_c = WORD_SIZE / 8;
   // lb_r: bytelen for 1 register
-  u32 lb_r = ((u32) ceilf(log2f(r)) + 7) / 8;
+  interp->lb_r = ((u32) ceilf(log2f(r)) + 7) / 8;
   // lb_o: bytelen for an outputID
-  u32 lb_o = ((u32) ceilf(log2f(l_out)) + 7) / 8;
+  interp->lb_o = ((u32) ceilf(log2f(l_out)) + 7) / 8;
 
   // header (ciphertext of shared key + number of inputs)
-  u8* header = bcptr; bcptr += CT_SEPUB_INBYTES;
+  check_bytes(bcptr, bytecode + bytecode_len, CT_SEPUB_INBYTES);
+  interp->header = bcptr; bcptr += CT_SEPUB_INBYTES;
 
   // program
-  Program program;
-  interpret_prog(&program, lb_m, lb_o);
+  Program *program = &interp->program;
+  interpret_prog(&bcptr, program, bytecode, bytecode_len, version,
+                 interp->lb_m, interp->lb_o);
   if (bcptr != bytecode + bytecode_len){
-    fprintf(stderr, "Interpret failed: error while reading bytecode.\n");
-    exit(EXIT_FAILURE);
+    runtime_error("Interpret failed: error while reading bytecode.\n");
+  }
+  check_prog(program, interp->memory_count);
+
+  // Working buffers, reused by every execution
+  u32 i;
+  u32 L = (program->inp_count + l_out - 1) / l_out;
+  interp->L = L;
+  interp->X = malloc((L+1) * sizeof(uSE *));
+  interp->H = malloc((L+1) * sizeof(u8 *));
+  interp->Cin = malloc((L+1) * sizeof(u8 *));
+  for(i=0; i<=L; i++){ // X[0] is not used, for indices compatible with H
+    interp->X[i] = malloc(l_out * sizeof(uSE));
+    interp->H[i] = malloc(HASH_INBYTES * sizeof(u8));
+    interp->Cin[i] = malloc(CIN_INBYTES * sizeof(u8));
   }
+  interp->C = malloc((l_out*L) * sizeof(EWORD));
+  interp->memory = malloc(interp->memory_count * sizeof(EWORD));
+  interp->inps = malloc(LLMI_MAX_INPUT_COUNT * sizeof(EWORD));
+  interp->outs = malloc(LLMI_MAX_OUTPUT_COUNT * sizeof(EWORD));
+  interp->pool = NULL;
+
+  return interp;
+}
+
+void interpreter_run(Interpreter *interp,
+                     uSE *prog_inps, u32 prog_inpcount,
+                     uSE *prog_outs, u32 prog_outcount)
+{
+  Program *program = &interp->program;
+  u32 L = interp->L;
+  uSE **X = interp->X;
+  u8 **H = interp->H;
+  u8 **Cin = interp->Cin;
+  EWORD *C = interp->C;
+  EWORD *memory = interp->memory;
 
   // check program input_cout and output_count
-  if (prog_inpcount != program.inp_count){
-    fprintf(stderr, "Invalid program input_count! Provided %u. Bytecode required %u\n",
-                      prog_inpcount, program.inp_count);
-    exit(EXIT_FAILURE);
+  if (prog_inpcount != program->inp_count){
+    runtime_error("Invalid program input_count! Provided %u. Bytecode required %u\n",
+                      prog_inpcount, program->inp_count);
   }
-  if (prog_outcount != program.out_count){
-    fprintf(stderr, "Invalid program output_count! Provided %u. Bytecode required %u\n",
-                      prog_outcount, program.out_count);
-    exit(EXIT_FAILURE);
+  if (prog_outcount != program->out_count){
+    runtime_error("Invalid program output_count! Provided %u. Bytecode required %u\n",
+                      prog_outcount, program->out_count);
   }
 
   u32 i, j, k;
   // Step 1: batching and compute H
-  u32 L = (program.inp_count + l_out - 1) / l_out;
-  uSE **X = malloc((L+1) * sizeof(uSE *));
-  for(i=1; i<= L; i++){ // Ignore X[0] for indice compatible with H
-    X[i] = malloc(l_out * sizeof(uSE));
+  for(i=1; i<= L; i++){
     for(j=0; j<l_out; j++){
       k = (i-1)*l_out + j;
-      X[i][j] = (k < program.inp_count) ? prog_inps[k] : 0;
+      X[i][j] = (k < program->inp_count) ? prog_inps[k] : 0;
     }
   }
 
-  u8 **H = malloc((L+1) * sizeof(u8 *));
-  H[0] = malloc(HASH_INBYTES * sizeof(u8));
   for(j=0; j<HASH_INBYTES; j++) H[0][j] = 0;
   for(i=1; i<=L; i++){
-    H[i] = malloc(HASH_INBYTES * sizeof(u8));
     hashchain(H[i], H[i-1], X[i]);
   }
 
   // Step 2: SE("Start", header, H_L)
-  u8 **Cin = malloc((L+1) * sizeof(u8 *));
-  for(i=0; i<=L; i++) Cin[i] = malloc(CIN_INBYTES * sizeof(u8));
   u8 execID[HASH_INBYTES];
   u8 esharedkey[ENCRYPTED_SHAREDKEY_INBYTES];
-  SEstart(esharedkey, execID, Cin[L], header, lb_m, H[L]);
+  SEstart(esharedkey, execID, Cin[L], interp->header, interp->lb_m, H[L]);
 
   // Step 3: SE("Input", E_ID, i, H_{i-1}, X_i, C_i^in)
-  EWORD *C = malloc((l_out*L) * sizeof(EWORD));
   for(i=L; i>0; i--){
     SEinput(Cin[i-1], C+(i-1)*l_out,
             execID, i, H[i-1], X[i], Cin[i]);
   }
 
   // Store encrypted intput words into memory
-  EWORD *memory = malloc(memory_count * sizeof(EWORD));
-  for(i=0; i<program.inp_count; i++) memory[program.mem_inps[i]] = C[i];
+  for(i=0; i<program->inp_count; i++) memory[program->mem_inps[i]] = C[i];
 
   // Step 4: SE("Eval", E_ID, E_K, MI_\nu, C_1^*, ..., C_l^*)
-  for(i=0; i<program.llmi_count; i++){
-    LLMI *llmi = &program.llmis[i];
-    EWORD *inps = malloc(llmi->inp_count * sizeof(EWORD));
-    EWORD *outs = malloc(llmi->out_count * sizeof(EWORD));
-    // Load encrypted input words from memory
-    for(j=0; j<llmi->inp_count; j++) inps[j] = memory[llmi->mem_inps[j]];
-    // Request SE to execute
-    SEeval(outs, execID, esharedkey, &llmi->aells, inps, r, lb_m, lb_r, lb_c, lb_o);
-    // Store encrypted output words into memory
-    for(j=0; j<llmi->out_count; j++) memory[llmi->mem_outs[j]] = outs[j];
-
-    free(inps);
-    free(outs);
-  }
-
-  for(i=0; i<program.out_count; i++)
-    prog_outs[i] = load_word(memory[program.mem_outs[i]].eword, WORD_INBYTES);
-
-  // free memory
-  free(memory);
-  free(C);
-  for(i=0; i<=L; i++) free(Cin[i]); free(Cin);
-  for(i=0; i<=L; i++) free(H[i]); free(H);
-  for(i=1; i<=L; i++) free(X[i]); free(X);
-  free(program.mem_inps);
-  free(program.mem_outs);
-  for(i=0; i<program.llmi_count; i++) free(program.llmis[i].mem_inps);
-  for(i=0; i<program.llmi_count; i++) free(program.llmis[i].mem_outs);
-  for(i=0; i<program.llmi_count; i++) free(program.llmis[i].aells.inputIDs);
-}
\ No newline at end of file
+  if (interp->pool){
+    // layer by layer, by all the threads of the pool
+    interp->pool->execID = execID;
+    interp->pool->esharedkey = esharedkey;
+    barrier_wait(&interp->pool->barrier);
+    run_layers(&interp->pool->workers[0]);
+  } else {
+    for(i=0; i<program->llmi_count; i++){
+      eval_llmi(interp, &program->llmis[i], execID, esharedkey,
+                interp->inps, interp->outs);
+    }
+  }
+
+  for(i=0; i<program->out_count; i++)
+    prog_outs[i] = load_word(memory[program->mem_outs[i]].eword, WORD_INBYTES);
+}
+
+void interpreter_free(Interpreter *interp)
+{
+  u32 i;
+  Program *program = &interp->program;
+  stop_threads(interp);
+  free(interp->memory);
+  free(interp->C);
+  free(interp->inps);
+  free(interp->outs);
+  for(i=0; i<=interp->L; i++){
+    free(interp->Cin[i]);
+    free(interp->H[i]);
+    free(interp->X[i]);
+  }
+  free(interp->Cin);
+  free(interp->H);
+  free(interp->X);
+  free(program->mem_inps);
+  free(program->mem_outs);
+  for(i=0; i<program->llmi_count; i++){
+    free(program->llmis[i].mem_inps);
+    free(program->llmis[i].mem_outs);
+    free(program->llmis[i].aells.inputIDs);
+  }
+  free(program->llmis);
+  free(program->layer_starts);
+  free(interp);
+}
+
+void interpret(u8  *bytecode, unsigned long bytecode_len,
+               uSE *prog_inps, u32 prog_inpcount,
+               uSE *prog_outs, u32 prog_outcount)
+{
+  Interpreter *interp = interpreter_init(bytecode, bytecode_len);
+  interpreter_run(interp, prog_inps, prog_inpcount, prog_outs, prog_outcount);
+  interpreter_free(interp);
+}
@@ -3,8 +3,48 @@
 
 #include "SEconfig.h"
 #include "crypto_uint.h"
+#include "crypto_len.h"
+#include "program.h"
 
+typedef struct _ThreadPool ThreadPool;
 
+// A parsed program, along with the working buffers of its executions
+typedef struct _Interpreter
+{
+  Program program;
+  u8  *header;        // ciphertext of shared key + number of inputs
+  u32 memory_count;
+  u32 lb_m, lb_c, lb_r, lb_o;
+  u32 L;              // number of batches of program inputs
+  uSE **X;            // batches of program inputs
+  u8  **H;            // hash chain of the batches
+  u8  **Cin;
+  EWORD *C;           // encrypted program inputs
+  EWORD *memory;
+  EWORD *inps;        // encrypted inputs of an LLMI
+  EWORD *outs;        // encrypted outputs of an LLMI
+  ThreadPool *pool;   // NULL if the LLMIs are executed sequentially
+} Interpreter;
+
+// Parses |bytecode| once, so that it can be executed many times by
+// interpreter_run. |bytecode| must outlive the interpreter.
+Interpreter *interpreter_init(u8 *bytecode, unsigned long bytecode_len);
+
+void interpreter_run(Interpreter *interp,
+                     uSE *prog_inps, u32 prog_inpcount,
+                     uSE *prog_outs, u32 prog_outcount);
+
+// Executes the LLMIs of each layer of the program (bytecode version
+// >= 2) with |thread_count| threads in the next executions, the
+// calling thread being one of them. Without layers, or with
+// |thread_count| <= 1, the LLMIs are executed sequentially.
+// runtime_error_jmp must not be set while several threads are used,
+// as the errors of the other threads cannot jump to it.
+void interpreter_set_threads(Interpreter *interp, u32 thread_count);
+
+void interpreter_free(Interpreter *interp);
+
+// Parses and executes |bytecode| once
 void interpret(u8  *bytecode, unsigned long bytecode_len,
                uSE *prog_inps, u32 prog_inpcount,
                uSE *prog_outs, u32 prog_outcount);
@@ -4,7 +4,13 @@
 #include <string.h>
 #include <errno.h>
 #include <getopt.h>
+#include <fcntl.h>
+#include <unistd.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <time.h>
 #include "interpreter.h"
+#include "utils.h"
 
 
 static int is_int(char* s) {
@@ -47,22 +53,113 @@ static uSE* parse_inputs(char* str, int* input_count) {
   return inputs;
 }
 
+// Parses a line of an inputs file into |inputs|, and returns the
+// number of inputs of the line (which can be more than |max_count|)
+static u32 parse_input_line(char* line, uSE* inputs, u32 max_count) {
+  u32 count = 0;
+  char* token = strtok(line, ", \t\r\n");
+  while (token != NULL) {
+    if (count < max_count) {
+      inputs[count] = strtoul(token, NULL, 0);
+    }
+    count++;
+    token = strtok(NULL, ", \t\r\n");
+  }
+  return count;
+}
+
+static double elapsed_since(struct timespec* start) {
+  struct timespec now;
+  clock_gettime(CLOCK_MONOTONIC, &now);
+  return (now.tv_sec - start->tv_sec) + (now.tv_nsec - start->tv_nsec) / 1e9;
+}
+
+// Executes the program once for each input vector of |in|, and writes
+// the outputs of each execution on a line of stdout. Input vectors
+// are either lines of comma-separated integers (blank lines are
+// skipped), or, if |binary|, consecutive vectors of input_count words
+// of WORD_SIZE bits (big-endian).
+static void run_batch(Interpreter* interp, FILE* in, int binary, u32 output_count) {
+  u32 input_count = interp->program.inp_count;
+  uSE* inputs = malloc((input_count + 1) * sizeof(*inputs));
+  uSE* outputs = malloc((output_count + 1) * sizeof(*outputs));
+  u8* words = malloc((input_count + 1) * WORD_INBYTES);
+  char* line = NULL;
+  size_t line_size = 0;
+  unsigned long executions = 0;
+
+  struct timespec start;
+  clock_gettime(CLOCK_MONOTONIC, &start);
+  while (1) {
+    u32 count;
+    if (binary) {
+      size_t read = fread(words, WORD_INBYTES, input_count, in);
+      if (read == 0 && input_count > 0) break;
+      if (read != input_count) {
+        fprintf(stderr, "Truncated input vector %lu in inputs file.\n", executions);
+        exit(EXIT_FAILURE);
+      }
+      for (u32 i = 0; i < input_count; i++) {
+        inputs[i] = load_word(words + i * WORD_INBYTES, WORD_INBYTES);
+      }
+      count = input_count;
+    } else {
+      if (getline(&line, &line_size, in) < 0) break;
+      count = parse_input_line(line, inputs, input_count);
+      if (count == 0) continue;
+    }
+
+    interpreter_run(interp, inputs, count, outputs, output_count);
+    executions++;
+
+    for (u32 i = 0; i < output_count; i++) {
+      fprintf(stdout, i ? ",%u" : "%u", outputs[i]);
+    }
+    fputc('\n', stdout);
+    if (binary && input_count == 0) break;
+  }
+  fflush(stdout);
+
+  double seconds = elapsed_since(&start);
+  fprintf(stderr, "%lu executions in %.3f s (%.1f executions/sec)\n",
+          executions, seconds, seconds > 0 ? executions / seconds : 0.0);
+
+  free(line);
+  free(words);
+  free(inputs);
+  free(outputs);
+}
+
 
 char* prog_name = NULL;
 static void usage() {
   fprintf(stderr, "Usage:\n"
           "    %s BYTECODE_FILE\n"
           "Inteprets the BYTECODE_FILE with the provided configuration arguments.\n\n"
-          "Mandatory arguments:\n"
+          "Mandatory arguments (one of):\n"
+          "    --inputs INT_LIST        inputs to give the program (separated by commas)\n"
+          "    --inputs-file FILE       file of input vectors (one per line, with the\n"
+          "                             syntax of --inputs), or - for stdin. The\n"
+          "                             bytecode is parsed once, and the outputs of\n"
+          "                             each vector are printed on one line.\n"
           "Optional arguments:\n"
-          "    --inputs INT_LIST        inputs to give the program (separated by commas)\n",
-          "    --out_count INT          number of outputs for the program\n",
+          "    --out_count INT          number of outputs for the program\n"
+          "                             (default: 1 with --inputs, the number of\n"
+          "                             outputs of the program with --inputs-file)\n"
+          "    --binary                 the inputs file is binary: consecutive input\n"
+          "                             vectors of WORD_SIZE-bit big-endian words\n"
+          "    --threads INT            number of threads executing the independent\n"
+          "                             instructions of the program (bytecode\n"
+          "                             version 2) (default: 1)\n",
           prog_name);
   exit(EXIT_FAILURE);
 }
 
 #define INPUTS_OPT 1000
 #define OUT_COUNT_OPT 1001
+#define INPUTS_FILE_OPT 1002
+#define BINARY_OPT 1003
+#define THREADS_OPT 1004
 
 int main(int argc, char** argv) {
   prog_name = argv[0];
@@ -71,13 +168,19 @@ int main(int argc, char** argv) {
   char* filename = NULL;
   uSE* inputs = NULL;
   int input_count = -1;
-  int output_count = 1;
+  int output_count = -1;
+  char* inputs_filename = NULL;
+  int binary = 0;
+  int thread_count = 1;
 
   while (1) {
     static struct option long_options[] = {
       { "help",   no_argument,       0, 'h' },
       { "inputs", required_argument, 0, INPUTS_OPT },
       { "out_count", required_argument, 0, OUT_COUNT_OPT },
+      { "inputs-file", required_argument, 0, INPUTS_FILE_OPT },
+      { "binary", no_argument,     0, BINARY_OPT },
+      { "threads", required_argument, 0, THREADS_OPT },
       { NULL, 0, NULL, 0 }
     };
 
@@ -96,13 +199,22 @@ int main(int argc, char** argv) {
     case OUT_COUNT_OPT:
       output_count = to_int("out_count", optarg);
       break;
+    case INPUTS_FILE_OPT:
+      inputs_filename = optarg;
+      break;
+    case BINARY_OPT:
+      binary = 1;
+      break;
+    case THREADS_OPT:
+      thread_count = to_int("threads", optarg);
+      break;
     default:
       usage();
     }
   }
 
-  if (!inputs) {
-    fprintf(stderr, "Missing mandatory argument.\n\n");
+  if (!inputs == !inputs_filename) {
+    fprintf(stderr, "Exactly one of --inputs and --inputs-file is required.\n\n");
     usage();
   }
 
@@ -121,33 +233,63 @@ int main(int argc, char** argv) {
   }
 
 
-  // Reading bytecode
-  FILE* f = fopen(filename, "rb");
-  if (! f) {
+  // Mapping bytecode
+  int fd = open(filename, O_RDONLY);
+  if (fd < 0) {
     fprintf(stderr, "Cannot open '%s': ", filename);
     perror("");
     exit(EXIT_FAILURE);
   }
-  fseek(f, 0, SEEK_END);
-  unsigned long bytecode_length = ftell(f);
-  fseek(f, 0, SEEK_SET);
-  unsigned char* bytecode = malloc(bytecode_length);
-  fread(bytecode, 1, bytecode_length, f);
-  fclose(f);
-
-  // Interpreting bytecode
-  uSE* outputs = malloc(output_count * sizeof(*outputs));
-  interpret(bytecode, bytecode_length, \
-            inputs,  (u32) input_count, \
-            outputs, (u32) output_count);
-
-  // Print outputs
-  for (int i = 0; i < output_count; i++){
-    fprintf(stdout, "%u\n", outputs[i]);
+  struct stat st;
+  if (fstat(fd, &st) < 0) {
+    fprintf(stderr, "Cannot stat '%s': ", filename);
+    perror("");
+    exit(EXIT_FAILURE);
+  }
+  unsigned long bytecode_length = st.st_size;
+  unsigned char* bytecode = mmap(NULL, bytecode_length, PROT_READ, MAP_PRIVATE, fd, 0);
+  if (bytecode == MAP_FAILED) {
+    fprintf(stderr, "Cannot map '%s': ", filename);
+    perror("");
+    exit(EXIT_FAILURE);
+  }
+  close(fd);
+
+  // Parsing bytecode
+  Interpreter* interp = interpreter_init(bytecode, bytecode_length);
+  if (thread_count > 1 && interp->program.layer_count == 0) {
+    fprintf(stderr, "Flag '--threads %d' was used, but the bytecode has no layers (version < 2). "
+            "Ignoring the --threads flag and continuing.\n", thread_count);
+  }
+  interpreter_set_threads(interp, (u32) thread_count);
+
+  if (inputs_filename) {
+    FILE* in = strcmp(inputs_filename, "-") ? fopen(inputs_filename, binary ? "rb" : "r") : stdin;
+    if (! in) {
+      fprintf(stderr, "Cannot open '%s': ", inputs_filename);
+      perror("");
+      exit(EXIT_FAILURE);
+    }
+    if (output_count < 0) output_count = interp->program.out_count;
+    run_batch(interp, in, binary, (u32) output_count);
+    if (in != stdin) fclose(in);
+  } else {
+    // Interpreting bytecode
+    if (output_count < 0) output_count = 1;
+    uSE* outputs = malloc(output_count * sizeof(*outputs));
+    interpreter_run(interp, \
+                    inputs,  (u32) input_count, \
+                    outputs, (u32) output_count);
+
+    // Print outputs
+    for (int i = 0; i < output_count; i++){
+      fprintf(stdout, "%u\n", outputs[i]);
+    }
+    free(inputs);
+    free(outputs);
   }
 
   // Free memory
-  free(inputs);
-  free(outputs);
-  free(bytecode);
+  interpreter_free(interp);
+  munmap(bytecode, bytecode_length);
 }
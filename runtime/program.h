@@ -13,6 +13,8 @@ typedef struct _Program
   u32 *mem_outs;
   u32 llmi_count;
   LLMI *llmis;
+  u32 layer_count;    // 0 if the bytecode has no layers (version < 2)
+  u32 *layer_starts;  // LLMIs of layer i: layer_starts[i] to layer_starts[i+1]-1
 
 } Program;
 
@@ -0,0 +1 @@
+from ._obscure_interpreter import interpret_inputs
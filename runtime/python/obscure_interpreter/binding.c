@@ -0,0 +1,154 @@
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+#include <string.h>
+#include "interpreter.h"
+#include "utils.h"
+
+// Sets a RuntimeError from the message of the last runtime_error
+static void set_runtime_error(void)
+{
+	runtime_error_jmp = NULL;
+	size_t len = strlen(runtime_error_msg);
+	if (len > 0 && runtime_error_msg[len-1] == '\n') {
+		runtime_error_msg[len-1] = '\0';
+	}
+	PyErr_SetString(PyExc_RuntimeError, runtime_error_msg);
+}
+
+// interpreter_init and interpreter_run, turning the errors of the
+// interpreter (see runtime_error) into a RuntimeError.
+static Interpreter *init_catching_errors(u8 *bytecode, unsigned long bytecode_len)
+{
+	jmp_buf env;
+	runtime_error_jmp = &env;
+	if (setjmp(env) != 0) {
+		set_runtime_error();
+		return NULL;
+	}
+	Interpreter *interp = interpreter_init(bytecode, bytecode_len);
+	runtime_error_jmp = NULL;
+	return interp;
+}
+
+static int run_catching_errors(Interpreter *interp,
+                               uSE *inputs, u32 input_count,
+                               uSE *outputs, u32 output_count)
+{
+	jmp_buf env;
+	runtime_error_jmp = &env;
+	if (setjmp(env) != 0) {
+		set_runtime_error();
+		return -1;
+	}
+	interpreter_run(interp, inputs, input_count, outputs, output_count);
+	runtime_error_jmp = NULL;
+	return 0;
+}
+
+// Interprets |bytecode| (any object supporting the buffer protocol)
+// once for each input vector of |input_vectors| (a sequence of
+// sequences of integers), and returns the list of the |out_count|
+// outputs of each execution. The bytecode is parsed once for all the
+// executions.
+//
+// The GIL is held during the executions, as the interpreter is not
+// reentrant.
+PyObject *interpret_inputs(PyObject *bytecode, PyObject *input_vectors,
+                           unsigned int out_count)
+{
+	Py_buffer view;
+	if (PyObject_GetBuffer(bytecode, &view, PyBUF_SIMPLE) != 0) {
+		return NULL;
+	}
+	PyObject *seq = PySequence_Fast(input_vectors,
+		"input_vectors must be a sequence of input vectors");
+	if (!seq) {
+		PyBuffer_Release(&view);
+		return NULL;
+	}
+	Py_ssize_t count = PySequence_Fast_GET_SIZE(seq);
+	Interpreter *interp = NULL;
+	uSE *inputs = NULL;
+	uSE *outputs = PyMem_Calloc(out_count + 1, sizeof(uSE));
+	PyObject *result = PyList_New(count);
+	if (!outputs || !result) {
+		if (!outputs) PyErr_NoMemory();
+		Py_CLEAR(result);
+		goto cleanup;
+	}
+	interp = init_catching_errors((u8 *)view.buf, (unsigned long)view.len);
+	if (!interp) {
+		Py_CLEAR(result);
+		goto cleanup;
+	}
+
+	for (Py_ssize_t i = 0; i < count; i++) {
+		PyObject *vector = PySequence_Fast(PySequence_Fast_GET_ITEM(seq, i),
+			"each input vector must be a sequence of integers");
+		if (!vector) {
+			Py_CLEAR(result);
+			goto cleanup;
+		}
+		Py_ssize_t input_count = PySequence_Fast_GET_SIZE(vector);
+		PyMem_Free(inputs);
+		inputs = PyMem_Calloc(input_count + 1, sizeof(uSE));
+		if (!inputs) {
+			PyErr_NoMemory();
+			Py_DECREF(vector);
+			Py_CLEAR(result);
+			goto cleanup;
+		}
+		for (Py_ssize_t j = 0; j < input_count; j++) {
+			unsigned long long x = PyLong_AsUnsignedLongLong(
+				PySequence_Fast_GET_ITEM(vector, j));
+			if (PyErr_Occurred()) {
+				Py_DECREF(vector);
+				Py_CLEAR(result);
+				goto cleanup;
+			}
+			if (x != (uSE) x) {
+				PyErr_Format(PyExc_OverflowError,
+					"input vector %zd: input %zd does not fit in %d bits",
+					i, j, WORD_SIZE);
+				Py_DECREF(vector);
+				Py_CLEAR(result);
+				goto cleanup;
+			}
+			inputs[j] = (uSE) x;
+		}
+		Py_DECREF(vector);
+
+		if (run_catching_errors(interp,
+		                        inputs, (u32)input_count,
+		                        outputs, out_count) != 0) {
+			Py_CLEAR(result);
+			goto cleanup;
+		}
+
+		PyObject *outs = PyList_New(out_count);
+		if (!outs) {
+			Py_CLEAR(result);
+			goto cleanup;
+		}
+		for (unsigned int j = 0; j < out_count; j++) {
+			PyObject *y = PyLong_FromUnsignedLongLong(outputs[j]);
+			if (!y) {
+				Py_DECREF(outs);
+				Py_CLEAR(result);
+				goto cleanup;
+			}
+			PyList_SET_ITEM(outs, j, y);
+		}
+		PyList_SET_ITEM(result, i, outs);
+	}
+
+cleanup:
+	if (interp) {
+		interpreter_free(interp);
+	}
+	PyMem_Free(inputs);
+	PyMem_Free(outputs);
+	Py_DECREF(seq);
+	PyBuffer_Release(&view);
+	return result;
+}
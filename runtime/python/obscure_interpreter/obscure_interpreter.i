@@ -0,0 +1,9 @@
+%module obscure_interpreter
+
+%{
+PyObject *interpret_inputs(PyObject *bytecode, PyObject *input_vectors,
+                           unsigned int out_count);
+%}
+
+PyObject *interpret_inputs(PyObject *bytecode, PyObject *input_vectors,
+                           unsigned int out_count);
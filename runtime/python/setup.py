@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+from distutils.core import setup, Extension
+
+# The interpreter is compiled with the configuration of the secure
+# element in ../SEconfig.h, as runtime/interpreter is.
+RUNTIME_SOURCES = [
+    '../interpreter.c',
+    '../SEalgo.c',
+    '../utils.c',
+    '../sparkle/esch/esch.c',
+    '../sparkle/esch/sparkle.c',
+    '../sparkle/schwaemm/schwaemm.c',
+    '../sparkle/schwaemm/sparkle.c',
+]
+
+interpreter_ext = Extension(
+    'obscure_interpreter._obscure_interpreter',
+    sources=[
+        'obscure_interpreter/obscure_interpreter.i',
+        'obscure_interpreter/binding.c',
+    ] + RUNTIME_SOURCES,
+    include_dirs=['..'],
+    libraries=['sodium', 'm', 'pthread'],
+    depends=[
+        '../*.h',
+        '../sparkle/esch/*.h',
+        '../sparkle/schwaemm/*.h',
+    ],
+    swig_opts=["-DSWIGWORDSIZE64"],  # https://github.com/swig/swig/issues/568
+)
+
+setup(
+    packages=["obscure_interpreter"],
+    name='obscure_interpreter',
+    version='0.1',
+    description="""In-process Python binding for the OBSCURE interpreter""",
+    ext_modules=[interpreter_ext],
+)
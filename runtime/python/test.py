@@ -0,0 +1,76 @@
+"""Runs tests/vrac/t.c through the binding on many input vectors.
+
+Run from runtime/python once the extension is built, with the compiler
+dependencies installed (see INSTALL.md).
+
+"""
+import random
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from obscure_interpreter import interpret_inputs
+
+ROOT = Path(__file__).resolve().parents[2]
+MASK = 0xFFFFFFFF
+
+def f(a, b, c):
+    # tests/vrac/t.c
+    k = (a + b) & MASK
+    l = 42
+    m = (c + l) & MASK
+    o = (l + m) & MASK
+    e = (m + o) & MASK
+    l = l | k
+    o = e & m
+    o = (o - a) & MASK
+    o = o ^ c
+    m = l ^ o
+    o = (m << 4) & MASK
+    a = (m * m) & MASK
+    return (a + o) & MASK
+
+def compile_t(version):
+    with tempfile.NamedTemporaryFile(suffix=".bin") as out:
+        subprocess.run([sys.executable, str(ROOT / "compiler/compiler.py"),
+                        "-r", "40", "-lin", "8", "-lout", "8", "-s", "32",
+                        "-version", str(version),
+                        str(ROOT / "tests/vrac/t.c"), "-o", out.name],
+                       check=True)
+        return Path(out.name).read_bytes()
+
+bytecode = compile_t(0)
+
+vectors = [ [ random.randrange(1 << 32) for _ in range(3) ] for _ in range(1000) ]
+outputs = interpret_inputs(bytecode, vectors, 1)
+assert outputs == [ [f(*v)] for v in vectors ]
+assert interpret_inputs(memoryview(bytecode), [], 1) == []
+
+try:
+    interpret_inputs(bytecode, [[1, 2]], 1)
+    assert False
+except RuntimeError as e:
+    assert "input_count" in str(e)
+
+corrupted = bytearray(bytecode)
+corrupted[-1] ^= 1
+try:
+    interpret_inputs(corrupted, [[1, 2, 3]], 1)
+    assert False
+except RuntimeError as e:
+    assert "decryption" in str(e)
+
+# Truncated bytecode is rejected without reading past its end
+for version in [0, 1, 2]:
+    full = compile_t(version)
+    assert interpret_inputs(full, vectors[:1], 1) == outputs[:1]
+    for length in range(len(full)):
+        try:
+            interpret_inputs(full[:length], vectors[:1], 1)
+            assert False, f"version {version}: truncated to {length} bytes"
+        except RuntimeError:
+            pass
+
+# The interpreter can still be used after an error
+assert interpret_inputs(bytecode, vectors[:1], 1) == outputs[:1]
+print("Ok!")
@@ -1,10 +1,28 @@
 #include <stdio.h>
 #include <stdlib.h>
 #include <string.h>
+#include <stdarg.h>
 #include "crypto_len.h"
 #include "sparkle/esch/esch.h"
 #include "utils.h"
 
+jmp_buf *runtime_error_jmp = NULL;
+char runtime_error_msg[RUNTIME_ERROR_MSG_INBYTES];
+
+void runtime_error(const char *fmt, ...)
+{
+  va_list args;
+  va_start(args, fmt);
+  if (runtime_error_jmp){
+    vsnprintf(runtime_error_msg, RUNTIME_ERROR_MSG_INBYTES, fmt, args);
+    va_end(args);
+    longjmp(*runtime_error_jmp, 1);
+  }
+  vfprintf(stderr, fmt, args);
+  va_end(args);
+  exit(EXIT_FAILURE);
+}
+
 u32 load_u32(const u8* bytes, u32 bytelen)
 // big-endian
 {
@@ -29,8 +47,7 @@ u32 load_u32(const u8* bytes, u32 bytelen)
         | ((u32) bytes[3]      );
       break;
     default:
-      fprintf(stderr, "Invalid number of bytes (%d).\n", bytelen);
-      exit(EXIT_FAILURE);
+      runtime_error("Invalid number of bytes (%d).\n", bytelen);
     }
   return n;
 }
@@ -93,8 +110,7 @@ u64 load_u64(const u8* bytes, u32 bytelen)
         | ((u64) bytes[7]      );
       break;
     default:
-      fprintf(stderr, "Invalid number of bytes (%d).\n", bytelen);
-      exit(EXIT_FAILURE);
+      runtime_error("Invalid number of bytes (%d).\n", bytelen);
     }
   return n;
 }
@@ -121,8 +137,7 @@ void u32_tobytes(u8 *bytes, u32 bytelen, u32 num)
       bytes[3] = num      ;
       break;
     default:
-      fprintf(stderr, "Invalid bytelen: %d.\n", bytelen);
-      exit(EXIT_FAILURE);
+      runtime_error("Invalid bytelen: %d.\n", bytelen);
 	}
 }
 
@@ -182,8 +197,7 @@ void u64_tobytes(u8 *bytes, u32 bytelen, u64 num)
       bytes[7] = num      ;
       break;
     default:
-      fprintf(stderr, "Invalid bytelen: %d.\n", bytelen);
-      exit(EXIT_FAILURE);
+      runtime_error("Invalid bytelen: %d.\n", bytelen);
 	}
 }
 
@@ -197,8 +211,7 @@ void word_tobytes(u8 *bytes, uSE x)
       u64_tobytes(bytes, WORD_SIZE/8, x);
       break;
     default:
-      fprintf(stderr, "Unsupported WORD_SIZE: %d.\n", WORD_SIZE);
-      exit(EXIT_FAILURE);
+      runtime_error("Unsupported WORD_SIZE: %d.\n", WORD_SIZE);
   }
 }
 
@@ -210,8 +223,7 @@ uSE load_word(u8 *bytes, u32 bytelen)
     case 64:
       return load_u64(bytes, bytelen);
     default:
-      fprintf(stderr, "Unsupported WORD_SIZE: %d.\n", WORD_SIZE);
-      exit(EXIT_FAILURE);
+      runtime_error("Unsupported WORD_SIZE: %d.\n", WORD_SIZE);
   }
 }
 
@@ -233,8 +245,7 @@ void batch_tobytes(u8 *Xbstr, uSE* X)
       }
       break;
     default:
-      fprintf(stderr, "Unsupported WORD_SIZE: %d.\n", WORD_SIZE);
-      exit(EXIT_FAILURE);
+      runtime_error("Unsupported WORD_SIZE: %d.\n", WORD_SIZE);
   }
 }
 
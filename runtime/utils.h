@@ -1,8 +1,21 @@
 #ifndef UTILS_H
 #define UTILS_H
 
+#include <setjmp.h>
 #include "crypto_uint.h"
 
+#define RUNTIME_ERROR_MSG_INBYTES 256
+
+// Errors of the interpreter and of the SE. By default, runtime_error
+// prints its message on stderr and exits. If runtime_error_jmp is set
+// (by a program embedding the interpreter, such as the Python
+// binding), the message is stored into runtime_error_msg instead, and
+// runtime_error jumps to runtime_error_jmp. Memory allocated by the
+// interrupted functions is not freed.
+extern jmp_buf *runtime_error_jmp;
+extern char runtime_error_msg[RUNTIME_ERROR_MSG_INBYTES];
+_Noreturn void runtime_error(const char *fmt, ...);
+
 void word_tobytes(u8 *bytes, uSE x);
 uSE load_word(u8 *bytes, u32 bytelen);
 u32 load_u32(const u8* bytes, u32 bytelen);